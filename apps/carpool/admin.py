@@ -1,9 +1,15 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from . import exports, rollups, surge
+from .pagination import EstimatedCountPaginator
 from .models import (
     Account, Passenger, Driver, Advertiser,
     IdentityVerification, Vehicle,
     RideService, DriverService,
-    Ride, TripRequest, TripOrder,
+    Ride, TripRequest, TripOrder, RideMembership, SupplyDemandCounter, DriverDailyStats,
+    ArchivedTripRequest, ArchivedTripOrder,
     Message, Review,
     Coupon, UserCoupon,
     Ad
@@ -12,6 +18,17 @@ from .models import (
 
 # Register your models here.
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    大表（订单、请求、消息等）的后台：总行数使用估算值，筛选时不再额外统计全表行数，
+    默认按主键倒序（直接走主键索引）。子类需在 raw_id_fields 中列出外键，编辑页用 id 输入框代替
+    加载整张关联表的下拉框，在 list_select_related 中列出 list_display 用到的关联对象
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+
+
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
     list_display = ('id', 'phone', 'is_passenger', 'is_driver', 'is_advertiser',
@@ -34,13 +51,15 @@ class AccountAdmin(admin.ModelAdmin):
 
 @admin.register(Passenger)
 class PassengerAdmin(admin.ModelAdmin):
-    list_display = ('id', 'account', 'nickname', 'rating', 'created_at')
+    list_display = ('id', 'account', 'nickname', 'rating', 'rating_count', 'created_at')
+    readonly_fields = ('rating_sum', 'rating_count')
     search_fields = ('account__phone', 'nickname')
 
 
 @admin.register(Driver)
 class DriverAdmin(admin.ModelAdmin):
-    list_display = ('id', 'account', 'rating', 'created_at')
+    list_display = ('id', 'account', 'rating', 'rating_count', 'created_at')
+    readonly_fields = ('rating_sum', 'rating_count')
     search_fields = ('account__phone',)
 
 
@@ -92,21 +111,25 @@ class DriverServiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ride)
-class RideAdmin(admin.ModelAdmin):
+class RideAdmin(LargeTableAdmin):
     list_display = ('id', 'account', 'start_location', 'end_location', 'departure_time', 'available_seats', 'status')
+    list_select_related = ('account',)
+    raw_id_fields = ('account',)
     list_filter = ('status', 'departure_time')
     search_fields = ('start_location', 'end_location', 'account__phone')
 
 
 @admin.register(TripRequest)
-class TripRequestAdmin(admin.ModelAdmin):
+class TripRequestAdmin(LargeTableAdmin):
     list_display = ('id', 'account', 'trip_type', 'status', 'pickup_address', 'dropoff_address', 'request_time')
+    list_select_related = ('account',)
+    raw_id_fields = ('account',)
     list_filter = ('trip_type', 'status')
     search_fields = ('pickup_address', 'dropoff_address', 'account__phone')
 
 
 @admin.register(TripOrder)
-class TripOrderAdmin(admin.ModelAdmin):
+class TripOrderAdmin(LargeTableAdmin):
     # --- 【核心修正部分】 ---
     # 将 list_display 中的 'trip_request' 和 'driver' 替换为我们自定义的方法名
     list_display = ('id', 'trip_request_info', 'driver_info', 'actual_price', 'payment_status', 'start_time', 'end_time')
@@ -114,10 +137,35 @@ class TripOrderAdmin(admin.ModelAdmin):
 
     list_filter = ('payment_status',)
     search_fields = ('trip_request__account__phone', 'driver__account__phone')
+    # trip_request_info / driver_info 用到的关联对象随列表一起查出
+    list_select_related = ('trip_request__account', 'driver__account')
+    raw_id_fields = ('trip_request', 'driver', 'user_coupon')
     
     # 编辑页面的字段保持不变
-    fields = ('trip_request', 'driver', 'actual_price', 'user_coupon', 'discount_amount', 'payment_status', 'start_time', 'end_time', 'route')
-    
+    fields = ('trip_request', 'driver', 'actual_price', 'user_coupon', 'discount_amount', 'payment_status', 'start_time', 'end_time', 'route_info')
+    readonly_fields = ('route_info',)
+
+    actions = ['export_csv', 'export_columnar']
+
+    def get_queryset(self, request):
+        # 列表页不读取路线数据，编辑页的 route_info 用到时再加载
+        return super().get_queryset(request).defer('route_data')
+
+    def export(self, queryset, fmt):
+        # 流式输出：边查询边编码，选中（或“全选”）多少行内存占用都不变
+        response = StreamingHttpResponse(exports.stream(queryset, fmt), content_type=exports.CONTENT_TYPES[fmt])
+        filename = f"orders-{timezone.localtime():%Y%m%d-%H%M%S}.{exports.EXTENSIONS[fmt]}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='导出所选订单（CSV）')
+    def export_csv(self, request, queryset):
+        return self.export(queryset, 'csv')
+
+    @admin.action(description='导出所选订单（列式 gzip）')
+    def export_columnar(self, request, queryset):
+        return self.export(queryset, 'columnar')
+
     # 自定义方法保持不变
     def trip_request_info(self, obj):
         # 增加一个try-except以防止关联对象被删除后报错
@@ -134,16 +182,115 @@ class TripOrderAdmin(admin.ModelAdmin):
             return "N/A"
     driver_info.short_description = '接单司机' # 这是列表页显示的列名
 
+    def route_info(self, obj):
+        route = obj.route
+        if route is None:
+            return "N/A"
+        return f"{len(route)} 个点，编码后 {len(obj.route_data)} 字节"
+    route_info.short_description = '行驶路线'
+
+class ArchiveAdmin(LargeTableAdmin):
+    # 归档表只读，由 archive_trips 命令写入
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedTripRequest)
+class ArchivedTripRequestAdmin(ArchiveAdmin):
+    list_display = ('id', 'account', 'trip_type', 'status', 'pickup_address', 'dropoff_address', 'request_time',
+                    'archived_at')
+    list_select_related = ('account',)
+    raw_id_fields = ('account',)
+    search_fields = ('account__phone',)
+
+
+@admin.register(ArchivedTripOrder)
+class ArchivedTripOrderAdmin(ArchiveAdmin):
+    list_display = ('id', 'trip_request', 'driver', 'actual_price', 'payment_status', 'start_time', 'end_time',
+                    'archived_at')
+    list_select_related = ('trip_request', 'driver')
+    raw_id_fields = ('trip_request', 'driver', 'user_coupon', 'ride')
+    list_filter = ('payment_status',)
+    search_fields = ('trip_request__account__phone', 'driver__account__phone')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('route_data')
+
+
+@admin.register(RideMembership)
+class RideMembershipAdmin(LargeTableAdmin):
+    list_display = ('id', 'ride', 'account', 'trip_order', 'created_at')
+    list_select_related = ('ride', 'account', 'trip_order')
+    search_fields = ('account__phone',)
+    raw_id_fields = ('ride', 'account', 'trip_order')
+
+
+@admin.register(SupplyDemandCounter)
+class SupplyDemandCounterAdmin(admin.ModelAdmin):
+    # 当前及之后时间段的供需与加价倍数（只读）
+    list_display = ('cell', 'bucket_start', 'demand_seats', 'supply_seats', 'surge_multiplier')
+    search_fields = ('cell',)
+    ordering = ('bucket_start', '-demand_seats')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(bucket_start__gte=surge.bucket_start(timezone.now()))
+
+    def surge_multiplier(self, obj):
+        return surge.multiplier(obj.demand_seats, obj.supply_seats)
+    surge_multiplier.short_description = '加价倍数'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DriverDailyStats)
+class DriverDailyStatsAdmin(admin.ModelAdmin):
+    # 司机日汇总（只读），列表上方显示当前筛选条件下的合计
+    list_display = ('day', 'driver', 'trip_count', 'revenue', 'discount', 'average_rating')
+    list_select_related = ('driver__account',)
+    date_hierarchy = 'day'
+    search_fields = ('driver__account__phone',)
+    ordering = ('-day', 'driver')
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            response.context_data['summary'] = rollups.summarize(changelist.queryset)
+        return response
+
+    def average_rating(self, obj):
+        return obj.average_rating
+    average_rating.short_description = '平均评分'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(LargeTableAdmin):
     list_display = ('id', 'sender', 'receiver', 'timestamp')
+    list_select_related = ('sender', 'receiver')
+    raw_id_fields = ('sender', 'receiver')
     search_fields = ('sender__phone', 'receiver__phone', 'content')
     list_filter = ('timestamp',)
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order', 'reviewer', 'reviewee', 'rating', 'created_at')
+class ReviewAdmin(LargeTableAdmin):
+    # 订单可能已归档（Review.order 没有外键约束），列表只显示订单 id
+    list_display = ('id', 'order_id', 'reviewer', 'reviewee', 'rating', 'created_at')
+    list_select_related = ('reviewer', 'reviewee')
+    raw_id_fields = ('order', 'reviewer', 'reviewee')
     list_filter = ('rating',)
     search_fields = ('reviewer__phone', 'reviewee__phone', 'comment')
 
@@ -151,14 +298,18 @@ class ReviewAdmin(admin.ModelAdmin):
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'name', 'discount_type', 'discount_value', 'min_spend', 'valid_from', 'valid_until', 'created_by')
+        'id', 'name', 'discount_type', 'discount_value', 'min_spend', 'valid_from', 'valid_until', 'total_quantity',
+        'issued_count', 'per_user_limit', 'created_by')
     list_filter = ('discount_type', 'valid_from', 'valid_until')
+    readonly_fields = ('issued_count',)
     search_fields = ('name', 'description')
 
 
 @admin.register(UserCoupon)
-class UserCouponAdmin(admin.ModelAdmin):
-    list_display = ('id', 'account', 'coupon', 'status', 'acquired_at', 'used_at')
+class UserCouponAdmin(LargeTableAdmin):
+    list_display = ('id', 'account', 'coupon', 'claim_no', 'status', 'acquired_at', 'used_at')
+    list_select_related = ('account', 'coupon')
+    raw_id_fields = ('account', 'coupon')
     list_filter = ('status', 'acquired_at')
     search_fields = ('account__phone', 'coupon__name')
 
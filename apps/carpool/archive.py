@@ -0,0 +1,77 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, route_codec
+from .models import ArchivedTripOrder, ArchivedTripRequest, RideMembership, RoutePoint, TripOrder, TripRequest
+
+# 冷热分离：请求处于终态、其订单也都处于终态，且请求时间早于期限的，连同订单按原主键移入归档表。
+# 热表只保留近期和进行中的数据，行数（以及索引深度、缓冲池占用）不再随历史增长。
+# 每批在一个事务中完成“复制到归档表 + 从热表删除”，历史接口同时读取两张表（KeysetPagination.paginate_querysets）
+
+ARCHIVE_AFTER = timedelta(days=90)
+ARCHIVE_CHUNK_SIZE = 1000
+
+REQUEST_FIELDS = [field.attname for field in TripRequest._meta.concrete_fields]
+ORDER_FIELDS = [field.attname for field in TripOrder._meta.concrete_fields]
+
+
+def archivable_requests(cutoff):
+    return TripRequest.objects.filter(status__in=TripRequest.TERMINAL_STATUSES, request_time__lt=cutoff)
+
+
+def archive_chunk(ids, cutoff):
+    """归档 ids 中仍满足条件的请求及其订单，返回 (归档的请求数, 归档的订单数)"""
+    with transaction.atomic():
+        requests = list(archivable_requests(cutoff).select_for_update().filter(id__in=ids).values(*REQUEST_FIELDS))
+        orders = list(TripOrder.objects.select_for_update().filter(
+            trip_request_id__in=[request['id'] for request in requests]).values(*ORDER_FIELDS))
+        # 还有未结束的订单（如待支付）的请求留在热表
+        unsettled = {order['trip_request_id'] for order in orders
+                     if order['payment_status'] not in TripOrder.TERMINAL_STATUSES}
+        requests = [request for request in requests if request['id'] not in unsettled]
+        orders = [order for order in orders if order['trip_request_id'] not in unsettled]
+        if not requests:
+            return 0, 0
+        request_ids = [request['id'] for request in requests]
+        order_ids = [order['id'] for order in orders]
+        rides = dict(RideMembership.objects.filter(trip_order_id__in=order_ids).values_list('trip_order_id', 'ride_id'))
+
+        fill_routes(orders)
+
+        ArchivedTripRequest.objects.bulk_create([ArchivedTripRequest(**request) for request in requests])
+        ArchivedTripOrder.objects.bulk_create([ArchivedTripOrder(ride_id=rides.get(order['id']), **order)
+                                               for order in orders])
+        # 轨迹已在 route_data 中；拼车关系记在归档订单的 ride 上
+        RoutePoint.objects.filter(order_id__in=order_ids).delete()
+        RideMembership.objects.filter(trip_order_id__in=order_ids).delete()
+        # 归档不改变司机日汇总，删除时不让 post_delete 扣减；Review 保留（on_delete=DO_NOTHING），仍指向原订单 id
+        with rollups.suspended():
+            TripOrder.objects.filter(id__in=order_ids).delete()
+            TripRequest.objects.filter(id__in=request_ids).delete()
+    return len(requests), len(orders)
+
+
+def fill_routes(orders):
+    """没有收到行程结束上报（final）的订单 route_data 为空，用已写入的轨迹点生成"""
+    missing = {order['id']: order for order in orders if order['route_data'] is None}
+    if not missing:
+        return
+    points = RoutePoint.objects.filter(order_id__in=list(missing)).order_by('order_id', 'recorded_at', 'id')
+    for order_id, rows in groupby(points.values_list('order_id', 'lat', 'lng'), key=lambda row: row[0]):
+        missing[order_id]['route_data'] = route_codec.encode_route([[lat, lng] for _, lat, lng in rows])
+
+
+def archive_trips(now=None, after=ARCHIVE_AFTER, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """按主键顺序分批归档请求时间早于 now - after 的终态请求，每处理一批产出 (归档的请求数, 归档的订单数)"""
+    cutoff = (now or timezone.now()) - after
+    candidates = archivable_requests(cutoff).order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id)[:chunk_size])
+        if not ids:
+            return
+        yield archive_chunk(ids, cutoff)
+        last_id = ids[-1]
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# 版本化缓存：缓存键中带有版本号，数据变化时只需递增版本号，旧版本的缓存项不再被读取、等待过期。
+# 只使用 get / set / add / incr，适用于本地内存缓存和 Redis、Memcached 等共享缓存
+
+
+class VersionedCache:
+    def __init__(self, namespace, timeout):
+        self.namespace = namespace
+        self.timeout = timeout  # 缓存项的最长有效期（秒），作为漏掉版本递增时的兜底
+        self.version_key = f'{namespace}:version'
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # 版本号丢失（首次使用或被淘汰）时以当前毫秒时间为初值，避免与仍未过期的旧缓存项撞键
+            cache.add(self.version_key, int(time.time() * 1000), timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self, **kwargs):
+        """
+        递增版本号，可直接作为信号处理函数。
+        在事务提交后执行，否则并发的读请求可能在提交前把旧数据写入新版本
+        """
+        transaction.on_commit(self._incr)
+
+    def _incr(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, int(time.time() * 1000), timeout=None)
+
+    def key(self, suffix):
+        return f'{self.namespace}:{self.version()}:{suffix}'
+
+    def get(self, key):
+        value = cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        cache.set(key, value, timeout=self.timeout)
+
+    def stats(self):
+        """本进程的命中统计（benchmarks/bench_open_rides_cache.py 按不同读写比例输出命中率）"""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / total if total else 0.0}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+# 开放行程列表（ListOpenRidesView）：Ride 的保存、删除以及座位扣减时失效
+open_rides_cache = VersionedCache('carpool:open_rides', timeout=60)
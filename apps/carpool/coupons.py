@@ -0,0 +1,295 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+
+from .caching import VersionedCache
+from .models import Coupon, TripOrder, UserCoupon
+from .serializers import CatalogCouponSerializer
+
+# 平台优惠券目录：当前有效的优惠券序列化后缓存在进程内存中，到最近的有效期边界（某张券开始生效或过期）时重建。
+# Coupon 保存或删除时递增共享缓存（Django cache）中的版本号，各进程读取目录时比较版本号，其他进程的修改也能立即生效。
+# 领取用 update() 递增 issued_count、不触发信号，因此目录中不含 issued_count
+
+# 缓存的最长有效期，作为共享缓存中的版本号丢失时的兜底
+CATALOG_MAX_TTL = timedelta(minutes=5)
+
+catalog_version = VersionedCache('carpool:coupon_catalog', timeout=int(CATALOG_MAX_TTL.total_seconds()))
+
+
+class Catalog:
+    def __init__(self, data, expires_at, version):
+        self.data = data
+        self.expires_at = expires_at
+        self.version = version
+
+
+_catalog_lock = threading.Lock()
+_catalog = None
+_generation = 0
+
+
+def _load_catalog(now, version):
+    coupons = list(Coupon.objects.filter(valid_from__lte=now, valid_until__gte=now).order_by('id'))
+    # valid_until 当刻仍然有效，之后才过期
+    boundaries = [coupon.valid_until + timedelta(microseconds=1) for coupon in coupons]
+    next_start = Coupon.objects.filter(valid_from__gt=now).aggregate(next_start=Min('valid_from'))['next_start']
+    if next_start is not None:
+        boundaries.append(next_start)
+    return Catalog(CatalogCouponSerializer(coupons, many=True).data, min(boundaries + [now + CATALOG_MAX_TTL]),
+                   version)
+
+
+def active_catalog(now=None):
+    """当前有效的平台优惠券（已序列化的列表）"""
+    global _catalog
+    now = now or timezone.now()
+    version = catalog_version.version()
+    catalog = _catalog
+    if catalog is None or now >= catalog.expires_at or catalog.version != version:
+        with _catalog_lock:
+            catalog = _catalog
+            if catalog is None or now >= catalog.expires_at or catalog.version != version:
+                generation = _generation
+                catalog = _load_catalog(now, version)
+                # 加载期间优惠券被修改时不保存，下次请求重新加载
+                if generation == _generation:
+                    _catalog = catalog
+    return catalog.data
+
+
+def invalidate_catalog(**kwargs):
+    """Coupon 保存或删除时调用（signals.py 中注册）：本进程立即丢弃目录，其他进程在事务提交、版本号递增后重建"""
+    global _catalog, _generation
+    _generation += 1
+    _catalog = None
+    catalog_version.bump()
+
+
+# 领取优惠券（ReceiveCouponView）：抢券时所有请求都落在同一行 Coupon 上，
+# 总量用一条条件 UPDATE 扣减（WHERE issued_count < total_quantity），这条 UPDATE 持有的行锁让同一张券的
+# 领取依次执行，每人限领在锁内按已有领取记录判断，(account, coupon, claim_no) 唯一约束兜底
+
+CLAIMED = 'claimed'
+NOT_FOUND = 'not_found'
+NOT_ACTIVE = 'not_active'
+SOLD_OUT = 'sold_out'
+LIMIT_REACHED = 'limit_reached'
+
+
+def claim(account, coupon_id, now=None):
+    """领取一张优惠券，返回上面的结果之一"""
+    now = now or timezone.now()
+    try:
+        with transaction.atomic():
+            # 条件 UPDATE 同时锁住优惠券行：同一张券的领取在这里排队，之后读到的领取记录不会被并发修改
+            issued = Coupon.objects.filter(
+                Q(total_quantity__isnull=True) | Q(issued_count__lt=F('total_quantity')),
+                pk=coupon_id, valid_from__lte=now, valid_until__gte=now,
+            ).update(issued_count=F('issued_count') + 1)
+            if not issued:
+                return _claim_failure(coupon_id, now)
+            claims = UserCoupon.objects.filter(account=account, coupon_id=coupon_id).aggregate(
+                count=Count('id'), last=Max('claim_no'))
+            if claims['count'] >= Coupon.objects.values_list('per_user_limit', flat=True).get(pk=coupon_id):
+                # 撤销已递增的 issued_count
+                transaction.set_rollback(True)
+                return LIMIT_REACHED
+            # 序号取已有最大序号 + 1：删除过领取记录时按数量计算会与现有序号冲突
+            UserCoupon.objects.create(account=account, coupon_id=coupon_id, claim_no=(claims['last'] or 0) + 1,
+                                      acquired_at=now, status='active')
+    except IntegrityError:
+        # 唯一约束冲突：事务回滚，已递增的 issued_count 一并撤销
+        return LIMIT_REACHED
+    return CLAIMED
+
+
+def _claim_failure(coupon_id, now):
+    """条件 UPDATE 未命中时读出优惠券，判断失败原因"""
+    coupon = Coupon.objects.filter(pk=coupon_id).only('valid_from', 'valid_until').first()
+    if coupon is None:
+        return NOT_FOUND
+    if not coupon.valid_from <= now <= coupon.valid_until:
+        return NOT_ACTIVE
+    return SOLD_OUT
+
+
+
+# 过期清理（expire_coupons 命令）：按主键区间分批执行 UPDATE ... SET status='expired'，
+# 每批是一条独立提交的语句，行锁只持有一条语句的时间；数据不经过 Python
+
+def expire_user_coupons(now=None, chunk_size=10000):
+    """逐个主键区间把已过期优惠券的 active 记录改为 expired，每处理一个区间产出本区间更新的行数"""
+    now = now or timezone.now()
+    bounds = UserCoupon.objects.filter(status='active').aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    # 过期的券以子查询给出，UPDATE 不需要连接 carpool_coupon（MySQL 下连接更新会先把主键读到 Python 中）
+    expired = Coupon.objects.filter(valid_until__lt=now).values('id')
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        # status='active' 条件保证不会覆盖并发结算刚标记的 used
+        yield UserCoupon.objects.filter(id__gte=start, id__lt=start + chunk_size, status='active',
+                                        coupon_id__in=expired).update(status='expired')
+
+# 结算选券：对订单价格与乘客所有可用优惠券一次性向量化计算优惠金额（单位：分），取优惠最大的一张。
+# 批量结算时所有订单的候选券展开为 (订单, 用户优惠券) 对一起计算
+
+# 并发结算冲突（订单已被结算或优惠券已被使用）时重新选券的次数
+SETTLE_RETRIES = 3
+
+
+class SettlementConflict(RuntimeError):
+    """重试 SETTLE_RETRIES 次后仍与并发结算冲突"""
+# 查询用户优惠券时每批的账号数
+ACCOUNT_CHUNK_SIZE = 500
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def discount_cents(price, percentage, value, min_spend, max_discount):
+    """
+    各参数为等长数组（或可广播）：price、min_spend、max_discount 以分为单位；
+    value 对满减券为减免金额（分），对折扣券为减免的百分比（20 表示减 20%）。
+    折扣券的优惠不超过 max_discount（max_discount 不大于 0 时不封顶），任何券的优惠都不超过订单价格；
+    未达到 min_spend 的返回 -1
+    """
+    price = np.asarray(price, dtype=np.int64)
+    by_percentage = np.floor(price * np.asarray(value, dtype=float) / 100 + 0.5).astype(np.int64)
+    by_percentage = np.where(max_discount > 0, np.minimum(by_percentage, max_discount), by_percentage)
+    discount = np.minimum(np.where(percentage, by_percentage, np.asarray(value).astype(np.int64)), price)
+    return np.where(price >= min_spend, discount, -1)
+
+
+class CandidateCoupons:
+    """
+    一批账号的可用优惠券：券的参数按 Coupon 去重后存为数组（金额以分为单位），
+    by_account 记录每个账号持有的 (用户优惠券 id 列表, 券下标列表)
+    """
+    def __init__(self):
+        self.by_account = {}
+        self._coupon_index = {}
+        self._percentage, self._value, self._min_spend, self._max_discount = [], [], [], []
+
+    def add(self, account_id, user_coupon_id, coupon_id, discount_type, value, min_spend, max_discount):
+        index = self._coupon_index.get(coupon_id)
+        if index is None:
+            index = self._coupon_index[coupon_id] = len(self._percentage)
+            is_percentage = discount_type == 'percentage'
+            self._percentage.append(is_percentage)
+            self._value.append(float(value) if is_percentage else to_cents(value))
+            self._min_spend.append(to_cents(min_spend))
+            self._max_discount.append(to_cents(max_discount))
+        ids, indexes = self.by_account.setdefault(account_id, ([], []))
+        ids.append(user_coupon_id)
+        indexes.append(index)
+
+    def arrays(self):
+        return (np.array(self._percentage, dtype=bool), np.array(self._value, dtype=float),
+                np.array(self._min_spend, dtype=np.int64), np.array(self._max_discount, dtype=np.int64))
+
+
+def active_user_coupons(account_ids, now):
+    account_ids = sorted(set(account_ids))
+    candidates = CandidateCoupons()
+    for start in range(0, len(account_ids), ACCOUNT_CHUNK_SIZE):
+        rows = UserCoupon.objects.filter(
+            account_id__in=account_ids[start:start + ACCOUNT_CHUNK_SIZE], status='active',
+            coupon__valid_from__lte=now, coupon__valid_until__gte=now,
+        ).values_list('account_id', 'id', 'coupon_id', 'coupon__discount_type', 'coupon__discount_value',
+                      'coupon__min_spend', 'coupon__max_discount')
+        for row in rows:
+            candidates.add(*row)
+    return candidates
+
+
+def choose_coupons(accounts, prices, candidates, excluded=()):
+    """
+    为每个订单选出优惠最大的券，同一张用户优惠券在一批订单中只使用一次。
+    accounts、prices（分）为订单的账号与价格，返回 [(user_coupon_id, discount_cents) 或 None]
+    """
+    order_index, coupon_ids, coupon_index = [], [], []
+    for i, account_id in enumerate(accounts):
+        entry = candidates.by_account.get(account_id)
+        if entry:
+            order_index.extend([i] * len(entry[0]))
+            coupon_ids.extend(entry[0])
+            coupon_index.extend(entry[1])
+
+    chosen = [None] * len(accounts)
+    if not order_index:
+        return chosen
+    order_index, coupon_ids, coupon_index = np.array(order_index), np.array(coupon_ids), np.array(coupon_index)
+    if excluded:
+        keep = ~np.isin(coupon_ids, list(excluded))
+        order_index, coupon_ids, coupon_index = order_index[keep], coupon_ids[keep], coupon_index[keep]
+    percentage, value, min_spend, max_discount = candidates.arrays()
+    discounts = discount_cents(np.asarray(prices, dtype=np.int64)[order_index], percentage[coupon_index],
+                               value[coupon_index], min_spend[coupon_index], max_discount[coupon_index])
+
+    # 按订单、优惠金额从大到小排序，每个订单的第一行即最优券
+    order = np.lexsort((-discounts, order_index))
+    order_index, coupon_ids, discounts = order_index[order], coupon_ids[order], discounts[order]
+    _, first = np.unique(order_index, return_index=True)
+    best = first[discounts[first] > 0]
+    if len(np.unique(coupon_ids[best])) == len(best):
+        for k in best.tolist():
+            chosen[order_index[k]] = (int(coupon_ids[k]), int(discounts[k]))
+        return chosen
+
+    # 同一乘客的多个订单选中了同一张券：依次取每个订单第一张未被占用的券
+    used = set()
+    for i, user_coupon_id, discount in zip(order_index.tolist(), coupon_ids.tolist(), discounts.tolist()):
+        if chosen[i] is not None or discount <= 0 or user_coupon_id in used:
+            continue
+        chosen[i] = (user_coupon_id, discount)
+        used.add(user_coupon_id)
+    return chosen
+
+
+def settle_orders(orders, prices, now=None):
+    """
+    批量结算：为每个订单（需 select_related('trip_request')）选出最优优惠券，
+    在同一个事务中把优惠券由 active 改为 used 并写入订单的 user_coupon、discount_amount 与 actual_price。
+    已结算过（discount_amount 不为空）或不是待支付状态的订单跳过。返回本次结算的订单，
+    重试后仍冲突时抛出 SettlementConflict
+    """
+    now = now or timezone.now()
+    items = list(zip(orders, prices))
+    excluded = set()
+    for _ in range(SETTLE_RETRIES):
+        with transaction.atomic():
+            # 只结算待支付的订单：bulk_update 不触发信号，已支付订单的金额变化不会进入司机日汇总
+            unsettled = set(TripOrder.objects.filter(pk__in=[order.pk for order, _ in items], payment_status='pending',
+                                                     discount_amount__isnull=True).values_list('id', flat=True))
+            items = [(order, price) for order, price in items if order.pk in unsettled]
+            if not items:
+                return []
+            accounts = [order.trip_request.account_id for order, _ in items]
+            price_cents = [to_cents(price) for _, price in items]
+            chosen = choose_coupons(accounts, price_cents, active_user_coupons(accounts, now), excluded)
+            coupon_ids = [choice[0] for choice in chosen if choice is not None]
+
+            # 两条条件 UPDATE：受影响的行数不符说明有并发结算，回滚后重新选券
+            claimed = TripOrder.objects.filter(pk__in=[order.pk for order, _ in items], payment_status='pending',
+                                               discount_amount__isnull=True).update(discount_amount=0)
+            used = UserCoupon.objects.filter(pk__in=coupon_ids, status='active').update(status='used', used_at=now)
+            if claimed == len(items) and used == len(coupon_ids):
+                for (order, price), cents, choice in zip(items, price_cents, chosen):
+                    discount = choice[1] if choice else 0
+                    order.user_coupon_id = choice[0] if choice else None
+                    order.discount_amount = Decimal(discount).scaleb(-2)
+                    order.actual_price = Decimal(cents - discount).scaleb(-2)
+                TripOrder.objects.bulk_update([order for order, _ in items],
+                                              ['user_coupon', 'discount_amount', 'actual_price'], batch_size=500)
+                return [order for order, _ in items]
+            transaction.set_rollback(True)
+        # 回滚后排除已被其他结算使用的券
+        excluded.update(UserCoupon.objects.filter(pk__in=coupon_ids).exclude(status='active')
+                        .values_list('id', flat=True))
+    raise SettlementConflict('并发结算冲突，请重试')
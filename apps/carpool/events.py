@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Ride, RideMembership
+
+# 实时事件：业务代码在事务提交后发布事件，WebSocket 连接（realtime.py）按主题订阅。
+# 主题：account:<账号ID> 推送给相关的乘客/司机；cell:<粗网格> 推送该区域新的待处理请求
+
+
+def account_topic(account_id):
+    return f'account:{account_id}'
+
+
+def cell_topic(cell):
+    return f'cell:{cell}'
+
+
+class Subscription:
+    def __init__(self, loop, topics, maxsize):
+        self.loop = loop
+        self.topics = frozenset(topics)
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, event):
+        # 客户端消费过慢时丢弃最旧的事件
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def offer(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InMemoryBroker:
+    """
+    进程内的发布/订阅，作为 Redis 等消息中间件的替身。
+    只能推送到同一进程内的连接，多 worker 部署时需要替换为共享的中间件
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, topics):
+        """在事件循环中调用，返回 Subscription"""
+        subscription = Subscription(asyncio.get_running_loop(), topics, self.queue_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, topics, event):
+        """线程安全，可在同步视图中调用"""
+        with self._lock:
+            targets = set()
+            for topic in topics:
+                targets.update(self._subscribers.get(topic, ()))
+        for subscription in targets:
+            subscription.offer(event)
+        return len(targets)
+
+
+broker = InMemoryBroker()
+
+
+def _publish_on_commit(topics, event):
+    # 只推送已提交的变化；事务回滚时回调被丢弃
+    transaction.on_commit(lambda: broker.publish(topics, event))
+
+
+def trip_request_status(request_id, account_id, status, driver_account_id=None):
+    """打车请求状态变化：推送给乘客与接单司机"""
+    topics = [account_topic(account_id)]
+    if driver_account_id is not None:
+        topics.append(account_topic(driver_account_id))
+    _publish_on_commit(topics, {'type': 'trip_request.status', 'id': request_id, 'status': status})
+
+
+def trip_request_created(trip_request):
+    """新的 pending 请求：推送给订阅了上车点所在粗网格的司机"""
+    if not trip_request.pickup_cell_coarse:
+        return
+    _publish_on_commit([cell_topic(trip_request.pickup_cell_coarse)], {
+        'type': 'trip_request.created',
+        'id': trip_request.pk,
+        'trip_type': trip_request.trip_type,
+        'pickup_address': trip_request.pickup_address,
+        'dropoff_address': trip_request.dropoff_address,
+        'seats_needed': trip_request.seats_needed,
+        'pickup_cell': trip_request.pickup_cell,
+    })
+
+
+def ride_seats_changed(ride_id):
+    """行程座位或状态变化：推送给司机与已加入的乘客。没有任何连接时不查询数据库"""
+    if not broker.has_subscribers():
+        return
+
+    def send():
+        ride = Ride.objects.filter(pk=ride_id).values('account_id', 'available_seats', 'status').first()
+        if ride is None:
+            return
+        members = RideMembership.objects.filter(ride_id=ride_id).values_list('account_id', flat=True)
+        broker.publish(
+            [account_topic(ride['account_id'])] + [account_topic(account_id) for account_id in members],
+            {'type': 'ride.seats', 'id': ride_id, 'available_seats': ride['available_seats'],
+             'status': ride['status']},
+        )
+
+    transaction.on_commit(send)
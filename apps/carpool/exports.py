@@ -0,0 +1,142 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.utils import timezone
+
+# 订单导出（后台动作与 export_orders 命令共用）：按主键分批读取 values_list，关联字段在 SQL 中连接得到，
+# 每批编码后立即输出，内存占用只与批大小有关。两种格式：
+#   csv       UTF-8（带 BOM，Excel 可直接打开）
+#   columnar  gzip 压缩的 JSON Lines：首行为表头 {"format": ..., "columns": [...]}，
+#             之后每行是一批数据，按列存放 [[列 1 的值...], [列 2 的值...], ...]，可用 read_columnar() 读回
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EXPORT_CHUNK_SIZE = 5000
+# 以这些字符开头的单元格会被 Excel 等当作公式执行（CSV 注入），导出 CSV 时在前面加 ' 使其按文本显示
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+COLUMNAR_FORMAT = 'carpool-columnar/1'
+
+# (列名, values_list 查询的字段)，第一列必须是 id（用于分批）
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('payment_status', 'payment_status'),
+    ('actual_price', 'actual_price'),
+    ('discount_amount', 'discount_amount'),
+    ('coupon', 'user_coupon__coupon__name'),
+    ('driver_phone', 'driver__account__phone'),
+    ('passenger_phone', 'trip_request__account__phone'),
+    ('trip_type', 'trip_request__trip_type'),
+    ('pickup_address', 'trip_request__pickup_address'),
+    ('dropoff_address', 'trip_request__dropoff_address'),
+]
+HEADERS = [name for name, _ in ORDER_COLUMNS]
+
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'columnar': 'application/gzip'}
+EXTENSIONS = {'csv': 'csv', 'columnar': 'jsonl.gz'}
+
+
+def order_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+    按主键分批（WHERE id > 上一批最后的 id ORDER BY id LIMIT n）读取订单。
+    不依赖服务端游标：MySQL 驱动执行 iterator() 时仍会把整个结果集读入内存。
+    queryset 也可以是多个 queryset 的列表（如归档表与热表），依次导出。
+    progress(行数) 在每批读出后调用，用于统计导出行数而无需再次 COUNT
+    """
+    if isinstance(queryset, (list, tuple)):
+        for part in queryset:
+            yield from order_chunks(part, chunk_size, progress)
+        return
+    rows = queryset.order_by('id').values_list(*[lookup for _, lookup in ORDER_COLUMNS])
+    last_id = None
+    while True:
+        chunk = list((rows if last_id is None else rows.filter(id__gt=last_id))[:chunk_size])
+        if not chunk:
+            return
+        if progress is not None:
+            progress(len(chunk))
+        yield chunk
+        last_id = chunk[-1][0]
+
+
+def _columns(chunk, tz, escape_formulas=False):
+    """
+    一批行转换为列，时间转为本地时区的 ISO 8601 字符串，金额转为字符串。
+    escape_formulas 时文本列中以公式字符开头的值前加 '（金额等数值列不受影响）
+    """
+    columns = [list(column) for column in zip(*chunk)]
+    for column in columns:
+        sample = next((value for value in column if value is not None), None)
+        if isinstance(sample, datetime):
+            column[:] = [value.astimezone(tz).isoformat() if value is not None else None for value in column]
+        elif isinstance(sample, Decimal):
+            column[:] = [str(value) if value is not None else None for value in column]
+        elif escape_formulas and isinstance(sample, str):
+            column[:] = [escape_formula(value) for value in column]
+    return columns
+
+
+def escape_formula(value):
+    if value and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    tz = timezone.get_current_timezone()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    yield ('\ufeff' + buffer.getvalue()).encode()
+    for chunk in order_chunks(queryset, chunk_size, progress):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(*_columns(chunk, tz, escape_formulas=True)))
+        yield buffer.getvalue().encode()
+
+
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value) + b'\n'
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def iter_columnar(queryset, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    tz = timezone.get_current_timezone()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+    yield compressor.compress(_dumps({'format': COLUMNAR_FORMAT, 'columns': HEADERS}))
+    for chunk in order_chunks(queryset, chunk_size, progress):
+        data = compressor.compress(_dumps(_columns(chunk, tz)))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(queryset, fmt, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    if fmt == 'csv':
+        return iter_csv(queryset, chunk_size, progress)
+    if fmt == 'columnar':
+        return iter_columnar(queryset, chunk_size, progress)
+    raise ValueError(f'不支持的导出格式：{fmt}')
+
+
+def read_columnar(fileobj):
+    """读取 columnar 格式（二进制文件对象，gzip 压缩），产出 dict 形式的行"""
+    with gzip.open(fileobj, 'rt', encoding='utf-8') as lines:
+        header = json.loads(next(lines))
+        if header.get('format') != COLUMNAR_FORMAT:
+            raise ValueError(f"不支持的文件格式：{header.get('format')}")
+        columns = header['columns']
+        for line in lines:
+            for row in zip(*json.loads(line)):
+                yield dict(zip(columns, row))
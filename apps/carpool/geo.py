@@ -0,0 +1,136 @@
+import math
+
+# 地理网格工具：使用 geohash 将经纬度映射为字符串网格编号，
+# 便于按网格等值查询（可走普通 B-Tree 索引）
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 网格精度：细网格约 1.2km x 0.6km，粗网格约 39km x 19.5km
+FINE_PRECISION = 6
+COARSE_PRECISION = 4
+
+# 供需统计（动态调价）使用的网格精度，约 4.9km x 4.9km，取细网格的前缀
+SURGE_PRECISION = 5
+
+# 细网格覆盖所需格子数超过该值时改用粗网格
+MAX_FINE_CELLS = 64
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(lat, lng, precision=FINE_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """返回指定精度下单个网格的 (纬度跨度, 经度跨度)，单位为度"""
+    lng_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def parse_point(location):
+    """
+    从 pickup_location 等 JSON 字段中解析出 (lat, lng)。
+    支持 {'lat': .., 'lng': ..} 以及 GeoJSON Point，无法解析时返回 None
+    """
+    try:
+        if isinstance(location, dict):
+            if location.get('type') == 'Point':
+                lng, lat = location['coordinates'][:2]
+            else:
+                lat = location['lat']
+                lng = location.get('lng', location.get('lon'))
+            lat, lng = float(lat), float(lng)
+        else:
+            return None
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def location_cells(location):
+    """返回位置对应的 (细网格, 粗网格)，位置无效时返回 (None, None)"""
+    point = parse_point(location)
+    if point is None:
+        return None, None
+    fine = encode(*point, precision=FINE_PRECISION)
+    return fine, fine[:COARSE_PRECISION]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _bounds(lat, lng, radius_km):
+    """以 (lat, lng) 为圆心、radius_km 为半径的圆的外接矩形 (south, north, west, east)，经度可能超出 ±180"""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    d_lng = min(180.0, math.degrees(radius_km / EARTH_RADIUS_KM) / cos_lat)
+    return max(-90.0, lat - d_lat), min(90.0, lat + d_lat), lng - d_lng, lng + d_lng
+
+
+def estimate_cells(lat, lng, radius_km, precision):
+    """covering_cells 返回的网格数的上界，只按外接矩形和网格大小计算，不枚举网格"""
+    south, north, west, east = _bounds(lat, lng, radius_km)
+    step_lat, step_lng = cell_size(precision)
+    rows = int((north - south) / step_lat) + 2
+    cols = min(int((east - west) / step_lng) + 2, int(round(360.0 / step_lng)))
+    return rows * cols
+
+
+def covering_cells(lat, lng, radius_km, precision):
+    """返回完整覆盖以 (lat, lng) 为圆心、radius_km 为半径的圆的所有网格"""
+    south, north, west, east = _bounds(lat, lng, radius_km)
+    step_lat, step_lng = cell_size(precision)
+    cells = set()
+    y = south
+    while True:
+        x = west
+        while True:
+            wrapped = (x + 180.0) % 360.0 - 180.0
+            cells.add(encode(min(y, 90.0 - 1e-9), wrapped, precision))
+            if x >= east:
+                break
+            x = min(x + step_lng, east)
+        if y >= north:
+            break
+        y = min(y + step_lat, north)
+    return cells
+
+
+def nearby_cell_filter(lat, lng, radius_km):
+    """
+    选择合适的网格精度，返回 (字段名, 网格集合)，用于 `field__in=cells` 查询。
+    先按半径估算细网格数量再决定精度，大半径时不会先枚举上万个细网格
+    """
+    if estimate_cells(lat, lng, radius_km, FINE_PRECISION) <= MAX_FINE_CELLS:
+        return 'pickup_cell', covering_cells(lat, lng, radius_km, FINE_PRECISION)
+    return 'pickup_cell_coarse', covering_cells(lat, lng, radius_km, COARSE_PRECISION)
@@ -0,0 +1,126 @@
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+# 幂等请求：客户端在请求头中带上 Idempotency-Key，同一用户使用同一个键重试时直接返回第一次的响应。
+# 查找只需在 (account, key) 唯一索引上探测一次；第一次请求处理期间先写入占位记录，
+# 并发的重试因唯一约束冲突而得到 409，不会重复执行。处理请求的进程崩溃时占位记录不会被删除，
+# 超过 PLACEHOLDER_TIMEOUT 后由下一次重试接管
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# 保存响应的时长，超过后同一个键视为新请求
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# 占位记录超过该时长仍未完成，视为处理它的进程已经退出
+PLACEHOLDER_TIMEOUT = timedelta(seconds=60)
+# 保存并在重放时还原的响应头
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def response_headers(response):
+    # DRF 的 Content-Type 在渲染时才确定，这里只能取到视图显式指定的 content_type
+    headers = {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+    if response.content_type:
+        headers['Content-Type'] = response.content_type
+    return headers or None
+
+
+def replay(record):
+    headers = dict(record.response_headers or {})
+    response = Response(record.response_data, status=record.status_code,
+                        content_type=headers.pop('Content-Type', None), headers=headers)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def take_over(record, now):
+    """接管超时的占位记录，成功时返回 True（并发的重试中只有一个能成功）"""
+    if record.status_code is not None or record.created_at > now - PLACEHOLDER_TIMEOUT:
+        return False
+    taken = IdempotencyRecord.objects.filter(pk=record.pk, status_code__isnull=True,
+                                             created_at=record.created_at).update(created_at=now)
+    record.created_at = now
+    return taken == 1
+
+
+def _existing_response(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return Response({"detail": f"{HEADER} 已用于其他请求"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.status_code is None:
+        return Response({"detail": "相同的请求正在处理中，请稍后重试"}, status=status.HTTP_409_CONFLICT)
+    return replay(record)
+
+
+def idempotent(view_method):
+    """
+    用于 APIView 的 post 等方法。没有 Idempotency-Key 时行为不变；
+    服务器错误（5xx）与异常不保存，允许客户端用同一个键重试
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"detail": f"{HEADER} 长度不能超过 {MAX_KEY_LENGTH}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_fingerprint = fingerprint(request)
+        now = timezone.now()
+        record = IdempotencyRecord.objects.filter(account=request.user, key=key).first()
+        if record is not None and record.created_at <= now - IDEMPOTENCY_TTL:
+            record.delete()
+            record = None
+
+        if record is None:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyRecord.objects.create(account=request.user, key=key,
+                                                              fingerprint=request_fingerprint)
+            except IntegrityError:
+                # 并发的同键请求已经写入占位记录
+                record = IdempotencyRecord.objects.filter(account=request.user, key=key).first()
+                if record is None:
+                    return Response({"detail": "相同的请求正在处理中，请稍后重试"}, status=status.HTTP_409_CONFLICT)
+                return _existing_response(record, request_fingerprint)
+        elif record.fingerprint != request_fingerprint or not take_over(record, now):
+            return _existing_response(record, request_fingerprint)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_data = response.data
+            record.response_headers = response_headers(response)
+            record.save(update_fields=['status_code', 'response_data', 'response_headers'])
+        return response
+
+    return wrapper
+
+
+def purge_expired(now=None, chunk_size=1000):
+    """删除过期的记录，返回删除的行数"""
+    cutoff = (now or timezone.now()) - IDEMPOTENCY_TTL
+    deleted = 0
+    while True:
+        ids = list(IdempotencyRecord.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
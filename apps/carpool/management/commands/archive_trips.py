@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.carpool import archive
+
+
+class Command(BaseCommand):
+    help = '把超过期限的终态打车请求及其订单移入归档表（按主键分批，每批一个事务），可与线上读写并发执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive.ARCHIVE_AFTER.days,
+                            help='请求时间早于多少天前的终态请求才归档')
+        parser.add_argument('--chunk-size', type=int, default=archive.ARCHIVE_CHUNK_SIZE, help='每批处理的请求数')
+        parser.add_argument('--pause', type=float, default=0, help='两批之间暂停的秒数，用于限制对线上库的压力')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        chunks = requests = orders = 0
+        for chunk_requests, chunk_orders in archive.archive_trips(after=timedelta(days=options['days']),
+                                                                  chunk_size=options['chunk_size']):
+            chunks += 1
+            requests += chunk_requests
+            orders += chunk_orders
+            if options['pause']:
+                time.sleep(options['pause'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'归档请求 {requests} 条、订单 {orders} 条，{chunks} 批，耗时 {elapsed:.3f}s'
+            f'（{(requests + orders) / elapsed if elapsed else 0:,.0f} rows/s）'
+        ))
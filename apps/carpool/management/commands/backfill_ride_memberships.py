@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from apps.carpool.models import Ride, RideMembership, TripOrder
+
+
+class Command(BaseCommand):
+    help = '根据已有的拼车订单回填 RideMembership（可重复执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        orders = (
+            TripOrder.objects.filter(trip_request__trip_type='拼车', ride_membership__isnull=True)
+            .order_by('id')
+            .values_list('id', 'trip_request__account_id', 'driver__account_id', 'start_time',
+                         'trip_request__pickup_address', 'trip_request__dropoff_address',
+                         'trip_request__pickup_location', 'trip_request__dropoff_location')
+        )
+
+        matched = unmatched = 0
+        last_id = 0
+        while True:
+            chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+
+            # 订单的司机与出发时间确定候选行程，再按起终点（文字地址或 JoinRideView 写入的位置）确认
+            rides = defaultdict(list)
+            for ride_id, account_id, departure_time, start, end in Ride.objects.filter(
+                account_id__in={row[2] for row in chunk},
+                departure_time__in={row[3] for row in chunk if row[3] is not None},
+            ).values_list('id', 'account_id', 'departure_time', 'start_location', 'end_location'):
+                rides[(account_id, departure_time)].append((ride_id, start, end))
+
+            memberships = []
+            for (order_id, passenger_id, driver_account_id, start_time,
+                 pickup_address, dropoff_address, pickup_location, dropoff_location) in chunk:
+                for ride_id, start, end in rides.get((driver_account_id, start_time), ()):
+                    if (start, end) in ((pickup_address, dropoff_address), (pickup_location, dropoff_location)):
+                        memberships.append(RideMembership(ride_id=ride_id, account_id=passenger_id,
+                                                          trip_order_id=order_id))
+                        break
+                else:
+                    unmatched += 1
+
+            # 同一乘客在同一行程上的重复订单只保留第一条
+            RideMembership.objects.bulk_create(memberships, ignore_conflicts=True)
+            matched += len(memberships)
+
+        self.stdout.write(self.style.SUCCESS(f'匹配到行程的订单 {matched} 个，{unmatched} 个订单未找到对应行程'))
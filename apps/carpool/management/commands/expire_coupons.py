@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.carpool import coupons
+
+
+class Command(BaseCommand):
+    help = '把已过期优惠券的用户领取记录标记为 expired（按主键区间分批更新，可与领券、结算并发执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='每条 UPDATE 覆盖的主键区间大小')
+        parser.add_argument('--pause', type=float, default=0, help='两批之间暂停的秒数，用于限制对线上库的压力')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='大于 0 时常驻运行，每隔多少秒清理一次；默认只执行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options['chunk_size'], options['pause'])
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
+
+    def sweep(self, chunk_size, pause):
+        started = time.perf_counter()
+        chunks = expired = 0
+        for updated in coupons.expire_user_coupons(chunk_size=chunk_size):
+            chunks += 1
+            expired += updated
+            if pause:
+                time.sleep(pause)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'过期 {expired} 条，{chunks} 批，耗时 {elapsed:.3f}s（{expired / elapsed if elapsed else 0:,.0f} rows/s）'
+        ))
@@ -0,0 +1,134 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from apps.carpool import geo
+from apps.carpool.models import (
+    ArchivedTripOrder, ArchivedTripRequest, Coupon, DriverDailyStats, Ride, RideMembership, RoutePoint,
+    SupplyDemandCounter, TripOrder, TripRequest, UserCoupon
+)
+from apps.carpool.pagination import KeysetPagination
+
+# SQLite：只有 SEARCH 是按索引定位；SCAN <表>（旧版本为 SCAN TABLE <表>）都是从头到尾扫描，
+# 带 USING [COVERING] INDEX 时也只是改为扫描整个索引
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+# MySQL：ALL 为全表扫描，index 为全索引扫描
+MYSQL_FULL_SCAN_TYPES = ('ALL', 'index')
+
+
+def pages(name, queryset, ordering, now, size=51):
+    """
+    游标分页的查询：第一页，以及带游标（KeysetPagination.after() 的范围条件）的下一页。
+    size 为 KeysetPagination 每页多取一行后的行数
+    """
+    paginator = KeysetPagination(ordering)
+    queryset = queryset.order_by(*ordering)
+    return [
+        (name, queryset[:size]),
+        (f'{name} (cursor)', queryset.filter(paginator.after((now, 1)))[:size]),
+    ]
+
+
+def hot_queries(now):
+    """各视图与后台任务的热点查询，参数取任意值即可（只看执行计划）；合并热表与归档表的视图两张表都列出"""
+    account_id = 1
+    near_cells = [geo.encode(31.23, 121.47)]
+    return [
+        *pages('ListOpenRidesView', Ride.objects.filter(status='open'), ('departure_time', 'id'), now),
+        *pages('MyTripsView', Ride.objects.filter(account_id=account_id), ('-departure_time', '-id'), now),
+        ('AcceptTripRequestView ride', Ride.objects.filter(
+            account_id=account_id, start_location='A', end_location='B', departure_time=now, status='open')[:1]),
+        *pages('ListPendingTripRequestsView', TripRequest.objects.filter(status='pending'),
+               ('-request_time', '-id'), now),
+        *pages('ListPendingTripRequestsView near', TripRequest.objects.filter(
+            status='pending', pickup_cell__in=near_cells), ('-request_time', '-id'), now),
+        *pages('TripRequestStatusView', TripRequest.objects.filter(account_id=account_id),
+               ('-request_time', '-id'), now),
+        *pages('TripRequestStatusView archived', ArchivedTripRequest.objects.filter(account_id=account_id),
+               ('-request_time', '-id'), now),
+        ('passenger requests by status', TripRequest.objects.filter(account_id=account_id, status='pending')),
+        *pages('PassengerOrderHistoryView', TripOrder.objects.filter(passenger_account_id=account_id),
+               ('-created_at', '-id'), now),
+        *pages('PassengerOrderHistoryView archived', ArchivedTripOrder.objects.filter(
+            passenger_account_id=account_id), ('-created_at', '-id'), now),
+        *pages('DriverOrderHistoryView', TripOrder.objects.filter(driver__account_id=account_id),
+               ('-created_at', '-id'), now),
+        *pages('DriverOrderHistoryView archived', ArchivedTripOrder.objects.filter(driver__account_id=account_id),
+               ('-created_at', '-id'), now),
+        ('DriverEarningsView', DriverDailyStats.objects.filter(
+            driver__account_id=account_id, day__gte=now.date(), day__lte=now.date()).order_by('day')),
+        *pages('PassengerCouponsView', UserCoupon.objects.select_related('coupon').filter(account_id=account_id),
+               ('-acquired_at', '-id'), now),
+        ('user coupons by status', UserCoupon.objects.filter(account_id=account_id, status='active')),
+        ('coupon catalog', Coupon.objects.filter(valid_from__lte=now, valid_until__gte=now)),
+        ('coupon catalog next start', Coupon.objects.filter(valid_from__gt=now).order_by('valid_from')[:1]),
+        ('JoinRideView membership', RideMembership.objects.filter(ride_id=1, account_id=account_id)),
+        ('matching rides', Ride.objects.filter(
+            status='open', available_seats__gt=0, departure_time__gte=now, departure_time__lte=now)),
+        ('matching requests', TripRequest.objects.filter(
+            status='pending', trip_type='拼车', seats_needed__gt=0,
+            scheduled_time__gte=now, scheduled_time__lte=now).order_by('request_time', 'id')),
+        ('surge counters', SupplyDemandCounter.objects.filter(cell__in=['wtw3s'], bucket_start=now)),
+        ('route points', RoutePoint.objects.filter(order_id=1).order_by('recorded_at', 'id')),
+    ]
+
+
+def sqlite_full_scans(plan):
+    return [match.group(1) for match in SQLITE_FULL_SCAN.finditer(plan)]
+
+
+def mysql_full_scans(plan):
+    """MySQL 的 JSON 执行计划中 access_type 为 ALL / index 的表"""
+    tables = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get('access_type') in MYSQL_FULL_SCAN_TYPES:
+                tables.append(node.get('table_name'))
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(plan))
+    return tables
+
+
+class Command(BaseCommand):
+    help = '对热点查询执行 EXPLAIN，存在全表或全索引扫描时以非零状态退出（支持 SQLite 与 MySQL）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--verbose-plans', action='store_true', help='输出完整的执行计划')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        vendor = connections[alias].vendor
+        if vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'不支持的数据库：{vendor}')
+
+        failures = []
+        for name, queryset in hot_queries(timezone.now()):
+            queryset = queryset.using(alias)
+            if vendor == 'sqlite':
+                plan = queryset.explain()
+                full_scans = sqlite_full_scans(plan)
+            else:
+                plan = queryset.explain(format='json')
+                full_scans = mysql_full_scans(plan)
+
+            if full_scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {", ".join(full_scans)}'))
+            else:
+                self.stdout.write(f'ok         {name}')
+            if options['verbose_plans'] or full_scans:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        if failures:
+            raise CommandError(f'{len(failures)} 个查询存在全表扫描：{", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS(f'{vendor}：所有热点查询均使用索引'))
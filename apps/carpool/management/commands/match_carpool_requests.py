@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.carpool import matching
+
+
+class Command(BaseCommand):
+    help = '批量匹配 pending 拼车请求与 open 行程（建议由 cron 等定时任务周期性调用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=matching.DEFAULT_WINDOW_MINUTES,
+                            help='只匹配未来多少分钟内出发的行程')
+        parser.add_argument('--max-wait', type=int, default=matching.DEFAULT_MAX_WAIT_MINUTES,
+                            help='预约时间与出发时间允许的最大差值（分钟）')
+        parser.add_argument('--dry-run', action='store_true', help='只计算匹配方案，不写入数据库')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        requests, rides, matched = matching.run_matching(
+            window=timedelta(minutes=options['window']),
+            max_wait=timedelta(minutes=options['max_wait']),
+            dry_run=options['dry_run'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'请求 {requests} 个，行程 {rides} 个，匹配 {matched} 个，耗时 {elapsed:.3f}s'
+            + ('（dry run）' if options['dry_run'] else '')
+        ))
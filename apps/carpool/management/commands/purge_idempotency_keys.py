@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.carpool import idempotency
+
+
+class Command(BaseCommand):
+    help = f'删除超过 {idempotency.IDEMPOTENCY_TTL} 的 Idempotency-Key 记录（可定时执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'已删除 {deleted} 条过期记录'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.carpool import ratings
+
+
+class Command(BaseCommand):
+    help = '根据 Review 重建司机与乘客的评分（rating_sum / rating_count / rating），可重复执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每批处理的账号 id 区间大小')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checked = fixed = 0
+        for chunk_checked, chunk_fixed in ratings.rebuild(chunk_size=options['chunk_size']):
+            checked += chunk_checked
+            fixed += chunk_fixed
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'检查 {checked} 份资料，修正 {fixed} 份，耗时 {elapsed:.3f}s'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.carpool import coupons
+from apps.carpool.models import TripOrder
+
+
+class Command(BaseCommand):
+    help = '批量结算已结束且未结算的订单：为每个订单选用乘客优惠最大的优惠券'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+        orders = (
+            TripOrder.objects.select_related('trip_request')
+            .filter(end_time__isnull=False, payment_status='pending', discount_amount__isnull=True)
+            .annotate(price=Coalesce(F('actual_price'), F('trip_request__estimated_price')))
+            .filter(price__isnull=False)
+            .order_by('id')
+        )
+
+        settled = discounted = 0
+        last_id = 0
+        while True:
+            chunk = list(orders.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            done = coupons.settle_orders(chunk, [order.price for order in chunk], now)
+            settled += len(done)
+            discounted += sum(order.user_coupon_id is not None for order in done)
+
+        self.stdout.write(self.style.SUCCESS(f'结算 {settled} 个订单，其中 {discounted} 个使用了优惠券'))
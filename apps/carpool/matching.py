@@ -0,0 +1,241 @@
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, surge
+from .models import Driver, Ride, RideMembership, TripOrder, TripRequest
+from .seats import reserve_seats
+
+# 拼车批量匹配引擎：
+# 一次性加载时间窗口内的 pending 拼车请求与 open 行程，按路线拆分为互不相关的子问题，
+# 每个子问题用最小费用流求解（先最大化匹配数，再最小化总时间差），最后批量提交订单与座位扣减
+
+# 默认时间窗口（分钟）：只匹配该时间范围内出发的行程
+DEFAULT_WINDOW_MINUTES = 120
+# 默认最大等待（分钟）：请求预约时间与行程出发时间之差的上限
+DEFAULT_MAX_WAIT_MINUTES = 30
+
+PendingRequest = namedtuple('PendingRequest', 'id account_id route scheduled_time seats_needed pickup_cell')
+OpenRide = namedtuple('OpenRide', 'id account_id route departure_time available_seats start_cell')
+
+
+def min_cost_assignment(costs, capacities):
+    """
+    带容量的二分图最小费用最大匹配（逐次最短路 + Dijkstra 势函数）。
+
+    costs: 每个请求一个 {行程下标: 费用} 的字典，费用需非负
+    capacities: 每个行程可容纳的请求数
+    返回每个请求匹配到的行程下标，未匹配为 None
+    """
+    n, m = len(costs), len(capacities)
+    source, sink = n + m, n + m + 1
+    size = n + m + 2
+    # 邻接表中的边：[终点, 剩余容量, 费用, 反向边下标]
+    graph = [[] for _ in range(size)]
+
+    def add_edge(u, v, cap, cost):
+        graph[u].append([v, cap, cost, len(graph[v])])
+        graph[v].append([u, 0, -cost, len(graph[u]) - 1])
+
+    for i, row in enumerate(costs):
+        add_edge(source, i, 1, 0)
+        for j, cost in row.items():
+            add_edge(i, n + j, 1, cost)
+    for j, cap in enumerate(capacities):
+        if cap > 0:
+            add_edge(n + j, sink, cap, 0)
+
+    potential = [0] * size
+    inf = float('inf')
+    while True:
+        dist = [inf] * size
+        prev = [None] * size
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for idx, (v, cap, cost, _) in enumerate(graph[u]):
+                if cap <= 0:
+                    continue
+                nd = d + cost + potential[u] - potential[v]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    prev[v] = (u, idx)
+                    heapq.heappush(heap, (nd, v))
+        if dist[sink] == inf:
+            break
+        for v in range(size):
+            if dist[v] < inf:
+                potential[v] += dist[v]
+        # 每个请求的供给为 1，因此每次增广恰好 1 个单位
+        v = sink
+        while v != source:
+            u, idx = prev[v]
+            edge = graph[u][idx]
+            edge[1] -= 1
+            graph[v][edge[3]][1] += 1
+            v = u
+
+    assignment = [None] * n
+    for i in range(n):
+        for v, cap, _, _ in graph[i]:
+            if n <= v < n + m and cap == 0:
+                assignment[i] = v - n
+                break
+    return assignment
+
+
+def plan_matches(requests, rides, max_wait=timedelta(minutes=DEFAULT_MAX_WAIT_MINUTES)):
+    """
+    计算匹配方案，返回 [(PendingRequest, OpenRide), ...]。
+
+    候选边与 AcceptTripRequestView 的规则一致：上下车地点与行程起终点相同，
+    且不能匹配到自己发布的行程；费用为预约时间与出发时间之差（秒）。
+    Ride 目前只有文字地址，路线相同即视为绕路为 0。
+    """
+    rides_by_route = defaultdict(list)
+    for ride in rides:
+        rides_by_route[ride.route].append(ride)
+    requests_by_route = defaultdict(list)
+    for trip_request in requests:
+        if trip_request.route in rides_by_route:
+            requests_by_route[trip_request.route].append(trip_request)
+
+    max_wait_seconds = max_wait.total_seconds()
+    matches = []
+    for route, route_requests in requests_by_route.items():
+        route_rides = rides_by_route[route]
+        remaining = [ride.available_seats for ride in route_rides]
+
+        # 按所需座位数分组，大的先排，同组内每个请求占用相同座位数，问题保持整数性
+        by_seats = defaultdict(list)
+        for trip_request in route_requests:
+            by_seats[trip_request.seats_needed].append(trip_request)
+
+        for seats in sorted(by_seats, reverse=True):
+            group = by_seats[seats]
+            costs = []
+            for trip_request in group:
+                row = {}
+                for j, ride in enumerate(route_rides):
+                    if ride.account_id == trip_request.account_id or remaining[j] < seats:
+                        continue
+                    diff = abs((ride.departure_time - trip_request.scheduled_time).total_seconds())
+                    if diff <= max_wait_seconds:
+                        row[j] = int(diff)
+                costs.append(row)
+
+            assignment = min_cost_assignment(costs, [r // seats for r in remaining])
+            for trip_request, j in zip(group, assignment):
+                if j is not None:
+                    remaining[j] -= seats
+                    matches.append((trip_request, route_rides[j]))
+    return matches
+
+
+def load_candidates(now=None, window=timedelta(minutes=DEFAULT_WINDOW_MINUTES),
+                    max_wait=timedelta(minutes=DEFAULT_MAX_WAIT_MINUTES)):
+    """加载时间窗口内的 pending 拼车请求与 open 行程"""
+    now = now or timezone.now()
+    rides = [
+        OpenRide(pk, account_id, (start, end), departure_time, seats, cell)
+        for pk, account_id, start, end, departure_time, seats, cell in Ride.objects.filter(
+            status='open', available_seats__gt=0,
+            departure_time__gte=now, departure_time__lte=now + window,
+        ).values_list('id', 'account_id', 'start_location', 'end_location', 'departure_time', 'available_seats',
+                      'start_cell')
+    ]
+    requests = [
+        PendingRequest(pk, account_id, (pickup, dropoff), scheduled_time, seats, cell)
+        for pk, account_id, pickup, dropoff, scheduled_time, seats, cell in TripRequest.objects.filter(
+            status='pending', trip_type='拼车', seats_needed__gt=0,
+            scheduled_time__gte=now - max_wait, scheduled_time__lte=now + window + max_wait,
+        ).order_by('request_time', 'id').values_list(
+            'id', 'account_id', 'pickup_address', 'dropoff_address', 'scheduled_time', 'seats_needed', 'pickup_cell')
+    ]
+    return requests, rides
+
+
+def commit_matches(matches):
+    """
+    在一个事务中批量提交匹配结果，返回实际成交的 (请求, 行程) 列表。
+    已被其他流程处理的请求、座位已变化的行程会被跳过。
+    """
+    if not matches:
+        return []
+
+    with transaction.atomic():
+        still_pending = set(
+            TripRequest.objects.select_for_update()
+            .filter(pk__in=[trip_request.id for trip_request, _ in matches], status='pending')
+            .values_list('id', flat=True)
+        )
+        drivers = dict(
+            Driver.objects.filter(account_id__in={ride.account_id for _, ride in matches})
+            .values_list('account_id', 'id')
+        )
+        # 已是行程成员的乘客不再重复加入（包括同一批次内的重复）
+        members = set(
+            RideMembership.objects.filter(
+                ride_id__in={ride.id for _, ride in matches},
+                account_id__in={trip_request.account_id for trip_request, _ in matches},
+            ).values_list('ride_id', 'account_id')
+        )
+        by_ride = defaultdict(list)
+        for trip_request, ride in matches:
+            if trip_request.id not in still_pending or ride.account_id not in drivers:
+                continue
+            if (ride.id, trip_request.account_id) in members:
+                continue
+            members.add((ride.id, trip_request.account_id))
+            by_ride[ride].append(trip_request)
+
+        committed = []
+        for ride, ride_requests in by_ride.items():
+            seats = sum(trip_request.seats_needed for trip_request in ride_requests)
+            # 条件扣减：座位在规划之后被占用时整体放弃该行程上的匹配，留给下一轮
+            if reserve_seats(ride.id, seats):
+                committed.extend((trip_request, ride) for trip_request in ride_requests)
+        if not committed:
+            return []
+
+        TripRequest.objects.filter(pk__in=[trip_request.id for trip_request, _ in committed]).update(status='matched')
+        TripOrder.objects.bulk_create([
+            TripOrder(
+                trip_request_id=trip_request.id,
+                passenger_account_id=trip_request.account_id,
+                driver_id=drivers[ride.account_id],
+                payment_status='pending',
+                start_time=ride.departure_time,
+            )
+            for trip_request, ride in committed
+        ])
+        # bulk_create 在 MySQL 上不回填主键，按请求 ID 查回订单
+        order_ids = dict(
+            TripOrder.objects.filter(trip_request_id__in=[trip_request.id for trip_request, _ in committed])
+            .values_list('trip_request_id', 'id')
+        )
+        RideMembership.objects.bulk_create([
+            RideMembership(ride_id=ride.id, account_id=trip_request.account_id,
+                           trip_order_id=order_ids[trip_request.id])
+            for trip_request, ride in committed
+        ])
+        surge.record_matches(committed)
+        for trip_request, ride in committed:
+            events.trip_request_status(trip_request.id, trip_request.account_id, 'matched', ride.account_id)
+    return committed
+
+
+def run_matching(now=None, window=timedelta(minutes=DEFAULT_WINDOW_MINUTES),
+                 max_wait=timedelta(minutes=DEFAULT_MAX_WAIT_MINUTES), dry_run=False):
+    """执行一轮匹配，返回 (请求数, 行程数, 成交数)"""
+    requests, rides = load_candidates(now=now, window=window, max_wait=max_wait)
+    matches = plan_matches(requests, rides, max_wait=max_wait)
+    if not dry_run:
+        matches = commit_matches(matches)
+    return len(requests), len(rides), len(matches)
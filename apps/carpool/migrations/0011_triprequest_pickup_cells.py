@@ -0,0 +1,48 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:33
+
+from django.db import migrations, models
+
+from apps.carpool import geo
+
+
+def backfill_pickup_cells(apps, schema_editor):
+    TripRequest = apps.get_model('carpool', 'TripRequest')
+    batch = []
+    for trip_request in TripRequest.objects.only('id', 'pickup_location').iterator(chunk_size=2000):
+        trip_request.pickup_cell, trip_request.pickup_cell_coarse = geo.location_cells(trip_request.pickup_location)
+        if trip_request.pickup_cell is not None:
+            batch.append(trip_request)
+        if len(batch) >= 2000:
+            TripRequest.objects.bulk_update(batch, ['pickup_cell', 'pickup_cell_coarse'])
+            batch = []
+    if batch:
+        TripRequest.objects.bulk_update(batch, ['pickup_cell', 'pickup_cell_coarse'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0010_ride_total_seats_alter_ride_available_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triprequest',
+            name='pickup_cell',
+            field=models.CharField(blank=True, editable=False, max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='triprequest',
+            name='pickup_cell_coarse',
+            field=models.CharField(blank=True, editable=False, max_length=4, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='triprequest',
+            index=models.Index(fields=['status', 'pickup_cell'], name='triprequest_status_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triprequest',
+            index=models.Index(fields=['status', 'pickup_cell_coarse'], name='triprequest_status_coarse_idx'),
+        ),
+        migrations.RunPython(backfill_pickup_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0011_triprequest_pickup_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='carpool.ride')),
+                ('trip_order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ride_membership', to='carpool.triporder')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ridemembership',
+            constraint=models.UniqueConstraint(fields=('ride', 'account'), name='unique_ride_membership'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0012_ridemembership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplyDemandCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(max_length=5)),
+                ('bucket_start', models.DateTimeField()),
+                ('demand_seats', models.IntegerField(default=0)),
+                ('supply_seats', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='start_cell',
+            field=models.CharField(blank=True, editable=False, max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='start_point',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='supplydemandcounter',
+            constraint=models.UniqueConstraint(fields=('cell', 'bucket_start'), name='unique_supply_demand_cell_bucket'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0013_surge_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat', models.FloatField()),
+                ('lng', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_points', to='carpool.triporder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'recorded_at'], name='routepoint_order_time_idx')],
+            },
+        ),
+    ]
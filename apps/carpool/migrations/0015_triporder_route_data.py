@@ -0,0 +1,51 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+from apps.carpool import route_codec
+
+
+def encode_routes(apps, schema_editor):
+    TripOrder = apps.get_model('carpool', 'TripOrder')
+    batch = []
+    for order in TripOrder.objects.filter(route__isnull=False).only('id', 'route').iterator(chunk_size=1000):
+        order.route_data = route_codec.encode_route(order.route)
+        batch.append(order)
+        if len(batch) >= 1000:
+            TripOrder.objects.bulk_update(batch, ['route_data'])
+            batch = []
+    if batch:
+        TripOrder.objects.bulk_update(batch, ['route_data'])
+
+
+def decode_routes(apps, schema_editor):
+    TripOrder = apps.get_model('carpool', 'TripOrder')
+    batch = []
+    for order in TripOrder.objects.filter(route_data__isnull=False).only('id', 'route_data').iterator(chunk_size=1000):
+        order.route = route_codec.decode_route(order.route_data)
+        batch.append(order)
+        if len(batch) >= 1000:
+            TripOrder.objects.bulk_update(batch, ['route'])
+            batch = []
+    if batch:
+        TripOrder.objects.bulk_update(batch, ['route'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0014_routepoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triporder',
+            name='route_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(encode_routes, decode_routes),
+        migrations.RemoveField(
+            model_name='triporder',
+            name='route',
+        ),
+    ]
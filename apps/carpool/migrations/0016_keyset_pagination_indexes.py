@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0015_triporder_route_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'departure_time', 'id'], name='ride_status_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['account', 'departure_time', 'id'], name='ride_account_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triporder',
+            index=models.Index(fields=['driver', 'created_at', 'id'], name='triporder_driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triporder',
+            index=models.Index(fields=['created_at', 'id'], name='triporder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triprequest',
+            index=models.Index(fields=['status', 'request_time', 'id'], name='triprequest_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triprequest',
+            index=models.Index(fields=['account', 'request_time', 'id'], name='triprequest_account_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercoupon',
+            index=models.Index(fields=['account', 'acquired_at', 'id'], name='usercoupon_account_time_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0016_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['valid_until', 'valid_from'], name='coupon_valid_until_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['valid_from'], name='coupon_valid_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triprequest',
+            index=models.Index(fields=['account', 'status'], name='triprequest_account_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercoupon',
+            index=models.Index(fields=['account', 'status'], name='usercoupon_account_status_idx'),
+        ),
+    ]
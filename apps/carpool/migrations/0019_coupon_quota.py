@@ -0,0 +1,66 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:04
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def number_existing_claims(apps, schema_editor):
+    """已有的领取记录按领取顺序编号，并据此回填 issued_count"""
+    Coupon = apps.get_model('carpool', 'Coupon')
+    UserCoupon = apps.get_model('carpool', 'UserCoupon')
+    claims = Counter()
+    issued = Counter()
+    batch = []
+    for user_coupon in UserCoupon.objects.only('id', 'account_id', 'coupon_id').order_by('id').iterator(chunk_size=2000):
+        claims[(user_coupon.account_id, user_coupon.coupon_id)] += 1
+        issued[user_coupon.coupon_id] += 1
+        user_coupon.claim_no = claims[(user_coupon.account_id, user_coupon.coupon_id)]
+        if user_coupon.claim_no > 1:
+            batch.append(user_coupon)
+        if len(batch) >= 2000:
+            UserCoupon.objects.bulk_update(batch, ['claim_no'])
+            batch = []
+    if batch:
+        UserCoupon.objects.bulk_update(batch, ['claim_no'])
+    for coupon_id, count in issued.items():
+        Coupon.objects.filter(pk=coupon_id).update(issued_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0018_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='issued_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='per_user_limit',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='total_quantity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usercoupon',
+            name='claim_no',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(number_existing_claims, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='coupon',
+            constraint=models.CheckConstraint(check=models.Q(('total_quantity__isnull', True), ('issued_count__lte', models.F('total_quantity')), _connector='OR'), name='coupon_issued_within_quantity'),
+        ),
+        migrations.AddConstraint(
+            model_name='usercoupon',
+            constraint=models.UniqueConstraint(fields=('account', 'coupon', 'claim_no'), name='unique_user_coupon_claim'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0020_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('trip_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=10)),
+                ('rating_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='triporder',
+            index=models.Index(fields=['end_time'], name='triporder_end_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='driverdailystats',
+            name='driver',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='carpool.driver'),
+        ),
+        migrations.AddIndex(
+            model_name='driverdailystats',
+            index=models.Index(fields=['day'], name='driverdailystats_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='driverdailystats',
+            constraint=models.UniqueConstraint(fields=('driver', 'day'), name='unique_driver_daily_stats'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0021_driver_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='carpool.triporder'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTripRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trip_type', models.CharField(choices=[('打车', '打车'), ('拼车', '拼车')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('matched', 'Matched'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('pickup_location', models.JSONField()),
+                ('pickup_address', models.CharField(max_length=255)),
+                ('dropoff_location', models.JSONField()),
+                ('dropoff_address', models.CharField(max_length=255)),
+                ('request_time', models.DateTimeField()),
+                ('scheduled_time', models.DateTimeField(blank=True, null=True)),
+                ('estimated_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('seats_needed', models.IntegerField(blank=True, null=True)),
+                ('pets_needed', models.BooleanField(default=False)),
+                ('pickup_cell', models.CharField(blank=True, editable=False, max_length=6, null=True)),
+                ('pickup_cell_coarse', models.CharField(blank=True, editable=False, max_length=4, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedTripOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actual_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('discount_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('payment_status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded')], max_length=20)),
+                ('start_time', models.DateTimeField(null=True)),
+                ('end_time', models.DateTimeField(null=True)),
+                ('route_data', models.BinaryField(blank=True, null=True)),
+                ('passenger_rating', models.DecimalField(blank=True, decimal_places=1, max_digits=2, null=True)),
+                ('passenger_comment', models.TextField(blank=True, null=True)),
+                ('driver_rating', models.DecimalField(blank=True, decimal_places=1, max_digits=2, null=True)),
+                ('driver_comment', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('last_modified_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carpool.driver')),
+                ('ride', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='carpool.ride')),
+                ('trip_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carpool.archivedtriprequest')),
+                ('user_coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='carpool.usercoupon')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedtriprequest',
+            index=models.Index(fields=['account', 'request_time', 'id'], name='archivedrequest_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtriporder',
+            index=models.Index(fields=['driver', 'created_at', 'id'], name='archivedorder_driver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtriporder',
+            index=models.Index(fields=['created_at', 'id'], name='archivedorder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtriporder',
+            index=models.Index(fields=['end_time'], name='archivedorder_end_time_idx'),
+        ),
+    ]
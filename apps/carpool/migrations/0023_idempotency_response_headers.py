@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0022_trip_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='response_headers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
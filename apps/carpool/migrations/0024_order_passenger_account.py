@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_passenger_accounts(apps, schema_editor):
+    """按订单所属请求的乘客回填 passenger_account"""
+    for order_name, request_name in (('TripOrder', 'TripRequest'), ('ArchivedTripOrder', 'ArchivedTripRequest')):
+        orders = apps.get_model('carpool', order_name).objects
+        requests = apps.get_model('carpool', request_name).objects
+        orders.filter(passenger_account__isnull=True).update(passenger_account_id=models.Subquery(
+            requests.filter(pk=models.OuterRef('trip_request_id')).values('account_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0023_idempotency_response_headers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtriporder',
+            name='passenger_account',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='triporder',
+            name='passenger_account',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_passenger_accounts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='archivedtriporder',
+            index=models.Index(fields=['passenger_account', 'created_at', 'id'], name='archivedorder_passenger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='triporder',
+            index=models.Index(fields=['passenger_account', 'created_at', 'id'], name='triporder_passenger_idx'),
+        ),
+    ]
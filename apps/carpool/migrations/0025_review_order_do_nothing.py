@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carpool', '0024_order_passenger_account'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reviews', to='carpool.triporder'),
+        ),
+    ]
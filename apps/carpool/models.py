@@ -1,10 +1,22 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
+from . import geo, route_codec
+
 
 # Create your models here.
 
 
+def rating_average(rating_sum, rating_count):
+    """平均评分：保留一位小数、四舍五入（ROUND_HALF_UP），资料评分与日汇总都用它计算；没有评价时为 None"""
+    if not rating_count:
+        return None
+    return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+
+
 # 自定义用户管理器
 class AccountManager(BaseUserManager):
     def create_user(self, phone, password=None, **extra_fields):
@@ -56,14 +68,18 @@ class Account(AbstractBaseUser, PermissionsMixin):
 class Passenger(models.Model):
     account = models.OneToOneField(Account, on_delete=models.CASCADE)
     nickname = models.CharField(max_length=50)
-    rating = models.DecimalField(max_digits=2, decimal_places=1)
+    rating = models.DecimalField(max_digits=2, decimal_places=1)  # 收到评价后为 rating_sum / rating_count
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)  # 收到的评分之和
+    rating_count = models.PositiveIntegerField(default=0)  # 收到的评价数
     created_at = models.DateTimeField(auto_now_add=True)
 
 
 # 司机表
 class Driver(models.Model):
     account = models.OneToOneField(Account, on_delete=models.CASCADE)
-    rating = models.DecimalField(max_digits=2, decimal_places=1)
+    rating = models.DecimalField(max_digits=2, decimal_places=1)  # 收到评价后为 rating_sum / rating_count
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)  # 收到的评分之和
+    rating_count = models.PositiveIntegerField(default=0)  # 收到的评价数
     created_at = models.DateTimeField(auto_now_add=True)
     services = models.ManyToManyField('RideService', through='DriverService')
 
@@ -142,10 +158,26 @@ class Ride(models.Model):
     total_seats = models.IntegerField(default=0)  # 总座位数
     available_seats = models.IntegerField(default=0)  # 目前可用座位数
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    start_point = models.JSONField(null=True, blank=True)  # 出发点坐标（可选），用于按网格统计运力
+    start_cell = models.CharField(max_length=geo.FINE_PRECISION, null=True, blank=True, editable=False)
 
-
-# 打车请求表
-class TripRequest(models.Model):
+    class Meta:
+        # 与列表接口的游标分页排序一致
+        indexes = [
+            models.Index(fields=['status', 'departure_time', 'id'], name='ride_status_departure_idx'),
+            models.Index(fields=['account', 'departure_time', 'id'], name='ride_account_departure_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.start_cell = geo.location_cells(self.start_point)[0]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'start_point' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'start_cell'}
+        super().save(*args, **kwargs)
+
+
+# 打车请求的字段，由热表 TripRequest 与归档表 ArchivedTripRequest 共用
+class AbstractTripRequest(models.Model):
     TRIP_TYPE_CHOICES = [('打车', '打车'), ('拼车', '拼车')]
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -166,10 +198,42 @@ class TripRequest(models.Model):
     estimated_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     seats_needed = models.IntegerField(null=True, blank=True)
     pets_needed = models.BooleanField(default=False)
+    # 由 pickup_location 派生的 geohash 网格，保存时自动同步
+    pickup_cell = models.CharField(max_length=geo.FINE_PRECISION, null=True, blank=True, editable=False)
+    pickup_cell_coarse = models.CharField(max_length=geo.COARSE_PRECISION, null=True, blank=True, editable=False)
 
+    class Meta:
+        abstract = True
 
-# 订单记录表
-class TripOrder(models.Model):
+
+# 打车请求表
+class TripRequest(AbstractTripRequest):
+    # 进入这些状态且超过归档期限后，由 archive_trips 移入 ArchivedTripRequest
+    TERMINAL_STATUSES = ('completed', 'cancelled')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'pickup_cell'], name='triprequest_status_cell_idx'),
+            models.Index(fields=['status', 'pickup_cell_coarse'], name='triprequest_status_coarse_idx'),
+            models.Index(fields=['status', 'request_time', 'id'], name='triprequest_status_time_idx'),
+            models.Index(fields=['account', 'request_time', 'id'], name='triprequest_account_time_idx'),
+            models.Index(fields=['account', 'status'], name='triprequest_account_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # 注意：bulk_create / update() 不会经过这里，需要自行调用 sync_pickup_cells()
+        self.sync_pickup_cells()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'pickup_location' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'pickup_cell', 'pickup_cell_coarse'}
+        super().save(*args, **kwargs)
+
+    def sync_pickup_cells(self):
+        self.pickup_cell, self.pickup_cell_coarse = geo.location_cells(self.pickup_location)
+
+
+# 订单的字段，由热表 TripOrder 与归档表 ArchivedTripOrder 共用
+class AbstractTripOrder(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),  # 等待支付
         ('paid', 'Paid'),  # 已支付
@@ -177,6 +241,9 @@ class TripOrder(models.Model):
         ('refunded', 'Refunded'),  # 已退款
     ]
     trip_request = models.ForeignKey(TripRequest, on_delete=models.CASCADE)  # 对应的打车请求
+    # 乘客账号（trip_request.account 的冗余副本，保存时自动填充），乘客历史订单按它的索引分页
+    passenger_account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True, editable=False,
+                                          related_name='+')
     driver = models.ForeignKey(Driver, on_delete=models.CASCADE)  # 对应的司机
     actual_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # 实际支付金额
     user_coupon = models.ForeignKey('UserCoupon', on_delete=models.SET_NULL, null=True, blank=True)  # 使用的优惠券（可为空）
@@ -184,7 +251,7 @@ class TripOrder(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES)  # 支付状态
     start_time = models.DateTimeField(null=True)  # 出发时间
     end_time = models.DateTimeField(null=True)  # 到达时间
-    route = models.JSONField(null=True, blank=True)  # 行驶路线（GeoJSON 格式或坐标序列）
+    route_data = models.BinaryField(null=True, blank=True)  # 行驶路线（route_codec 紧凑编码，通过 route 属性读写）
 
     # 用户与司机的评分、评价
     passenger_rating = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)  # 乘客对司机评分
@@ -192,9 +259,161 @@ class TripOrder(models.Model):
     driver_rating = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)  # 司机对乘客评分
     driver_comment = models.TextField(null=True, blank=True)  # 司机评论
 
+    class Meta:
+        abstract = True
+
+    @property
+    def route(self):
+        # 坐标序列 [[lat, lng], ...]，读取时才解码
+        return route_codec.decode_route(self.route_data)
+
+    @route.setter
+    def route(self, value):
+        self.route_data = route_codec.encode_route(value)
+
+
+# 订单记录表
+class TripOrder(AbstractTripOrder):
+    # 终态订单随所属的打车请求一起归档
+    TERMINAL_STATUSES = ('paid', 'cancelled', 'refunded')
+
     created_at = models.DateTimeField(auto_now_add=True)
     last_modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # 司机、乘客历史订单分别按 (driver, created_at, id)、(passenger_account, created_at, id) 分页
+        indexes = [
+            models.Index(fields=['driver', 'created_at', 'id'], name='triporder_driver_created_idx'),
+            models.Index(fields=['passenger_account', 'created_at', 'id'], name='triporder_passenger_idx'),
+            models.Index(fields=['created_at', 'id'], name='triporder_created_idx'),
+            # 重建司机日汇总时按 end_time（为空时按 created_at）的日期区间扫描
+            models.Index(fields=['end_time'], name='triporder_end_time_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记下加载时的字段值，保存时据此计算司机日汇总的变化（rollups.py）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 注意：bulk_create 不会经过这里，需要自行设置 passenger_account_id
+        if self.passenger_account_id is None and self.trip_request_id is not None:
+            self.passenger_account_id = self.trip_request.account_id
+        super().save(*args, **kwargs)
+
+
+# 归档表：archive_trips 把超过期限的终态请求连同订单按原主键移到这里（archive.py），热表大小保持稳定。
+# 归档行只读，时间字段按原值保存
+class ArchivedTripRequest(AbstractTripRequest):
+    archived_at = models.DateTimeField(auto_now_add=True)  # 归档时间
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'request_time', 'id'], name='archivedrequest_account_idx'),
+        ]
+
+
+class ArchivedTripOrder(AbstractTripOrder):
+    trip_request = models.ForeignKey(ArchivedTripRequest, on_delete=models.CASCADE)  # 对应的打车请求（已归档）
+    # 拼车订单所属的行程（归档时 RideMembership 随订单删除，行程记在这里）
+    ride = models.ForeignKey(Ride, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    last_modified_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)  # 归档时间
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['driver', 'created_at', 'id'], name='archivedorder_driver_idx'),
+            models.Index(fields=['passenger_account', 'created_at', 'id'], name='archivedorder_passenger_idx'),
+            models.Index(fields=['created_at', 'id'], name='archivedorder_created_idx'),
+            models.Index(fields=['end_time'], name='archivedorder_end_time_idx'),
+        ]
+
+
+# 供需统计表：按网格与 15 分钟时间段累计待匹配的请求座位数与开放座位数，用于动态调价
+class SupplyDemandCounter(models.Model):
+    cell = models.CharField(max_length=geo.SURGE_PRECISION)  # geohash 网格
+    bucket_start = models.DateTimeField()  # 时间段起点
+    demand_seats = models.IntegerField(default=0)  # 待匹配请求所需座位数
+    supply_seats = models.IntegerField(default=0)  # 开放行程的可用座位数
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cell', 'bucket_start'], name='unique_supply_demand_cell_bucket'),
+        ]
+
+
+# 司机日汇总表：按 (司机, 日期) 累计已支付订单数、收入、优惠金额与评分，
+# 由订单与评价的变化增量维护（rollups.py），收入接口与后台汇总只读取本表
+class DriverDailyStats(models.Model):
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='daily_stats')  # 司机
+    day = models.DateField()  # 日期（订单结束时间所在的本地日期，未结束时为创建日期）
+    trip_count = models.IntegerField(default=0)  # 已支付订单数
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # 收入（actual_price 之和）
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # 优惠金额（discount_amount 之和）
+    rating_sum = models.DecimalField(max_digits=10, decimal_places=1, default=0)  # 当日订单收到的评分之和
+    rating_count = models.IntegerField(default=0)  # 当日订单收到的评价数
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'day'], name='unique_driver_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='driverdailystats_day_idx'),
+        ]
+
+    @property
+    def average_rating(self):
+        return rating_average(self.rating_sum, self.rating_count)
+
+
+# 行程轨迹点表：司机上报的定位点，由内存缓冲批量写入
+class RoutePoint(models.Model):
+    order = models.ForeignKey(TripOrder, on_delete=models.CASCADE, related_name='route_points')  # 所属订单
+    lat = models.FloatField()
+    lng = models.FloatField()
+    recorded_at = models.DateTimeField()  # 定位时间（司机端时间）
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'recorded_at'], name='routepoint_order_time_idx'),
+        ]
+
+
+# 行程成员表：记录乘客通过哪个订单加入了哪个拼车行程
+class RideMembership(models.Model):
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='memberships')  # 拼车行程
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)  # 乘客
+    trip_order = models.OneToOneField(TripOrder, on_delete=models.CASCADE, related_name='ride_membership')  # 对应订单
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # 同一乘客只能加入同一行程一次，由数据库拒绝并发的重复加入
+            models.UniqueConstraint(fields=['ride', 'account'], name='unique_ride_membership'),
+        ]
+
+
+# 幂等请求记录：按 (账号, Idempotency-Key) 保存第一次请求的响应，客户端重试时直接返回
+class IdempotencyRecord(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)  # 客户端生成的 Idempotency-Key
+    fingerprint = models.CharField(max_length=64)  # 请求方法、路径与请求体的 SHA-256，防止同一个键用于不同请求
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # 为空表示第一次请求仍在处理中
+    response_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(null=True, blank=True)  # 重放时需要还原的响应头（Content-Type、Location）
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
 
 # 聊天记录表
 class Message(models.Model):
@@ -212,13 +431,25 @@ class Review(models.Model):
     rating = models.DecimalField(max_digits=2, decimal_places=1)  # 评分（1~5）
     comment = models.TextField()  # 评论内容
     created_at = models.DateTimeField(auto_now_add=True)  # 创建时间
-    order = models.ForeignKey(TripOrder, on_delete=models.CASCADE, related_name='reviews')  # 所属订单
+    # 所属订单。订单归档或删除后评价保留（评分汇总依赖它），因此不建外键约束，order_id 可能指向 ArchivedTripOrder
+    order = models.ForeignKey(TripOrder, on_delete=models.DO_NOTHING, db_constraint=False, related_name='reviews')
     reviewer = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='given_reviews')
     reviewee = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='received_reviews')
 
     def __str__(self):
         return f"Review for Order {self.order_id} - {self.rating} stars"
 
+    @property
+    def trip_order(self):
+        """
+        所属订单：仍在热表中时为 TripOrder，已归档时为 ArchivedTripOrder（带 driver），都不存在时为 None。
+        订单可能已归档，需要读取订单时使用它而不是 order
+        """
+        try:
+            return self.order
+        except TripOrder.DoesNotExist:
+            return ArchivedTripOrder.objects.select_related('driver').filter(pk=self.order_id).first()
+
     class Meta:
         unique_together = ('order', 'reviewer')
 
@@ -237,6 +468,21 @@ class Coupon(models.Model):
     valid_until = models.DateTimeField()  # 有效期结束
     created_by = models.ForeignKey(Account, on_delete=models.CASCADE)  # 创建者（管理员）
     created_at = models.DateTimeField(auto_now_add=True)  # 创建时间
+    total_quantity = models.PositiveIntegerField(null=True, blank=True)  # 发放总量（为空则不限量）
+    issued_count = models.PositiveIntegerField(default=0)  # 已领取数量，只通过条件 UPDATE 递增
+    per_user_limit = models.PositiveSmallIntegerField(default=1)  # 每人限领张数
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(total_quantity__isnull=True) |
+                                   models.Q(issued_count__lte=models.F('total_quantity')),
+                                   name='coupon_issued_within_quantity'),
+        ]
+        # 优惠券目录：当前有效的券（valid_until >= now）与下一张开始生效的券（valid_from > now）
+        indexes = [
+            models.Index(fields=['valid_until', 'valid_from'], name='coupon_valid_until_idx'),
+            models.Index(fields=['valid_from'], name='coupon_valid_from_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -251,6 +497,17 @@ class UserCoupon(models.Model):
     acquired_at = models.DateTimeField(auto_now_add=True)  # 领取时间
     used_at = models.DateTimeField(null=True, blank=True)  # 使用时间（未使用则为空）
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)  # 状态
+    claim_no = models.PositiveSmallIntegerField(default=1)  # 该用户领取同一张券的序号（1 ~ per_user_limit）
+
+    class Meta:
+        # 同一序号只能领取一次：并发的重复领取由唯一约束拦截
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'coupon', 'claim_no'], name='unique_user_coupon_claim'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'acquired_at', 'id'], name='usercoupon_account_time_idx'),
+            models.Index(fields=['account', 'status'], name='usercoupon_account_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.account.phone} - {self.coupon.name} ({self.status})"
@@ -0,0 +1,178 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# 游标（keyset）分页：按 (排序字段, id) 记住上一页最后一行，下一页用
+#   WHERE (key, id) < (上一页最后的 key, id) ORDER BY key, id LIMIT n
+# 只走复合索引的一段范围，翻到多深都和第一页一样快。
+# 响应体仍是列表（与未分页时相同），下一页的游标放在响应头：
+#   X-Next-Cursor: <cursor>
+#   Link: <...?cursor=<cursor>>; rel="next"
+
+
+class KeysetPagination(BasePagination):
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    # 带过滤条件（predicate）分页时每次从数据库读取的行数
+    scan_batch_size = 200
+
+    def __init__(self, ordering=None):
+        # (排序字段, 'id')，方向相同，例如 ('-request_time', '-id')；
+        # 通用视图未传入时使用视图的 keyset_ordering
+        self.ordering = ordering
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        key_field = self.ordering[0].lstrip('-')
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(raw.encode()).decode())
+            value = model._meta.get_field(key_field).to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, ValidationError, UnicodeDecodeError):
+            raise NotFound('cursor 无效')
+        # 排序字段都不为空，游标中的空值只能是伪造的（否则生成 key__lt=None 查询时报错）
+        if value is None:
+            raise NotFound('cursor 无效')
+        return value, pk
+
+    def encode_cursor(self, row):
+        value, pk = self.position(row)
+        # 时间保留到微秒（DjangoJSONEncoder 会截断到毫秒，导致同一毫秒内的行被跳过）
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        data = json.dumps([value, pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def position(self, row):
+        # row 可以是模型实例，也可以是 values_list(named=True) 的具名元组
+        return getattr(row, self.ordering[0].lstrip('-')), row.id
+
+    def fetch(self, queryset, position, limit):
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return list(queryset[:limit])
+
+    def after(self, position):
+        key_field, descending = self.ordering[0].lstrip('-'), self.ordering[0].startswith('-')
+        op = 'lt' if descending else 'gt'
+        value, pk = position
+        # 外层的 key <= value 让数据库可以直接在索引上定位范围起点；只写 OR 条件时 SQLite / MySQL 会从头扫描
+        return Q(**{f'{key_field}__{op}e': value}) & (Q(**{f'{key_field}__{op}': value}) | Q(**{f'id__{op}': pk}))
+
+    def paginate_queryset(self, queryset, request, view=None, predicate=None):
+        """
+        返回当前页的对象列表。predicate 用于无法写成 SQL 的过滤条件（如按实际距离），
+        此时按顺序分批读取，直到凑满一页
+        """
+        if self.ordering is None:
+            self.ordering = view.keyset_ordering
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+
+        if predicate is None:
+            rows = self.fetch(queryset, position, size + 1)
+        else:
+            rows = []
+            while len(rows) <= size:
+                chunk = self.fetch(queryset, position, self.scan_batch_size)
+                rows.extend(row for row in chunk if predicate(row))
+                if len(chunk) < self.scan_batch_size:
+                    break
+                position = self.position(chunk[-1])
+
+        page = rows[:size]
+        self.next_cursor = self.encode_cursor(page[-1]) if len(rows) > size else None
+        return page
+
+    def paginate_querysets(self, querysets, request):
+        """
+        合并分页字段相同、主键互不重复的多个 queryset（热表与归档表）：
+        每个 queryset 从同一游标起各取一页，归并排序后截取，查询数等于 queryset 数
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request, querysets[0].model)
+        rows = []
+        for queryset in querysets:
+            rows.extend(self.fetch(queryset.order_by(*self.ordering), position, size + 1))
+        rows.sort(key=self.position, reverse=self.ordering[0].startswith('-'))
+
+        page = rows[:size]
+        self.next_cursor = self.encode_cursor(page[-1]) if len(rows) > size else None
+        return page
+
+    def resume(self, request, next_cursor):
+        """使用缓存的分页结果时恢复分页状态，之后可以直接调用 get_paginated_response"""
+        self.request = request
+        self.next_cursor = next_cursor
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        if self.next_cursor is not None:
+            response['X-Next-Cursor'] = self.next_cursor
+            response['Link'] = f'<{self.get_next_link()}>; rel="next"'
+        return response
+
+
+# 后台列表的分页器：没有筛选条件时，大表的总行数使用数据库的估算值，避免每次翻页都 COUNT(*) 全表。
+# 估算值低于阈值（或数据库不支持估算）时仍精确计数；有筛选条件时的计数由条件上的索引保证
+
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+def estimated_count(model, using='default'):
+    """表行数的估算值，无法估算时返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                           'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # 最大 rowid 只需读取主键 B 树最右侧的页；删除过的行会让估算偏大
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
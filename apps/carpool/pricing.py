@@ -0,0 +1,115 @@
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.utils import timezone
+
+from . import geo, surge
+from .models import RideService
+
+# 车费估算：按 RideService 的起步价 + 里程费 + 时长费计价，
+# 一次对多条行程、多种服务类型做向量化计算
+
+# 直线距离到道路距离的折算系数
+ROAD_FACTOR = 1.3
+# 估算时长使用的平均车速（公里/小时）
+AVERAGE_SPEED_KMH = 30.0
+# 服务类型缓存的最长有效期（秒），作为跨进程修改时的兜底
+SERVICE_CACHE_TTL = 300
+
+_cache_lock = threading.Lock()
+_service_cache = None
+
+
+class ServiceTable:
+    """RideService 表在内存中的列式副本，费率以分为单位"""
+
+    def __init__(self, services):
+        self.names = [service.name for service in services]
+        self.base = np.array([float(service.base_fare) * 100 for service in services])
+        self.per_km = np.array([float(service.per_km_rate) * 100 for service in services])
+        self.per_minute = np.array([float(service.per_minute_rate) * 100 for service in services])
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, name):
+        try:
+            return self.names.index(name)
+        except ValueError:
+            return None
+
+
+def get_services():
+    global _service_cache
+    table = _service_cache
+    if table is None or time.monotonic() - table.loaded_at > SERVICE_CACHE_TTL:
+        with _cache_lock:
+            table = _service_cache
+            if table is None or time.monotonic() - table.loaded_at > SERVICE_CACHE_TTL:
+                table = _service_cache = ServiceTable(list(RideService.objects.order_by('id')))
+    return table
+
+
+def invalidate_service_cache(**kwargs):
+    """RideService 保存或删除时调用（signals.py 中注册）"""
+    global _service_cache
+    _service_cache = None
+
+
+def trip_metrics(pickups, dropoffs):
+    """
+    根据上下车点的 (lat, lng) 序列计算预估道路距离（公里）与时长（分钟）数组
+    """
+    start = np.radians(np.asarray(pickups, dtype=float).reshape(-1, 2))
+    end = np.radians(np.asarray(dropoffs, dtype=float).reshape(-1, 2))
+    d_lat = end[:, 0] - start[:, 0]
+    d_lng = end[:, 1] - start[:, 1]
+    a = np.sin(d_lat / 2) ** 2 + np.cos(start[:, 0]) * np.cos(end[:, 0]) * np.sin(d_lng / 2) ** 2
+    distance = 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a))) * ROAD_FACTOR
+    duration = distance / AVERAGE_SPEED_KMH * 60
+    return distance, duration
+
+
+def quote_cents(distance, duration, services=None, multipliers=None):
+    """
+    返回 len(distance) x len(services) 的报价矩阵（整数，单位：分，四舍五入），
+    multipliers 为每条行程的动态加价倍数
+    """
+    services = services or get_services()
+    cents = (services.base[np.newaxis, :]
+             + np.asarray(distance)[:, np.newaxis] * services.per_km[np.newaxis, :]
+             + np.asarray(duration)[:, np.newaxis] * services.per_minute[np.newaxis, :])
+    if multipliers is not None:
+        cents = cents * np.asarray(multipliers, dtype=float)[:, np.newaxis]
+    return np.floor(cents + 0.5).astype(np.int64)
+
+
+def cents_to_decimal(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def quote_trips(pickups, dropoffs, when=None):
+    """
+    批量报价：返回 (services, distance, duration, multipliers, cents)，
+    cents[i, j] 为第 i 条行程使用第 j 种服务的价格（已包含上车网格的动态加价）
+    """
+    services = get_services()
+    distance, duration = trip_metrics(pickups, dropoffs)
+    multipliers = surge.surge_multipliers([geo.encode(*point) for point in pickups], when or timezone.now())
+    return services, distance, duration, multipliers, quote_cents(distance, duration, services, multipliers)
+
+
+def estimate_price(trip_type, pickup_location, dropoff_location, when=None):
+    """
+    估算单个打车请求的价格：优先使用与 trip_type 同名的服务类型，否则使用第一个服务类型。
+    位置无法解析或尚未配置服务类型时返回 None
+    """
+    pickup = geo.parse_point(pickup_location)
+    dropoff = geo.parse_point(dropoff_location)
+    if pickup is None or dropoff is None or not len(get_services()):
+        return None
+    services, _, _, _, cents = quote_trips([pickup], [dropoff], when=when)
+    return cents_to_decimal(cents[0, services.index(trip_type) or 0])
@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from django.db.models import BooleanField, Count, Exists, ExpressionWrapper, F, Max, OuterRef, Q, Sum
+
+from . import rollups
+from .models import Account, ArchivedTripOrder, Driver, Passenger, Review, TripOrder, rating_average
+
+# 司机与乘客的评分：资料上保存收到的评分之和与评价数，提交评价时在同一事务内累加，
+# 读取资料时无需对 Review 做 AVG。rebuild_ratings 命令按 Review 重新核对。
+# 显示的评分（rating）在累加与重建时都由 models.rating_average() 计算，与司机日汇总的舍入一致
+
+
+def profile_model(review):
+    """被评价者是订单的司机时更新 Driver，否则更新 Passenger（订单可能已归档，通过 Review.trip_order 读取）"""
+    return Driver if review.reviewee_id == review.trip_order.driver.account_id else Passenger
+
+
+def record_review(review):
+    """在插入评价的同一事务中调用：用 F() 原子累加被评价者的评分合计；司机收到的评价同时计入当日汇总"""
+    model = profile_model(review)
+    if model is Driver:
+        rollups.record_rating(review)
+    profiles = model.objects.filter(account_id=review.reviewee_id)
+    if not profiles.update(rating_sum=F('rating_sum') + review.rating, rating_count=F('rating_count') + 1):
+        return
+    # 累加的 UPDATE 已锁住该行（SQLite 锁住整个库）直到事务结束，读回的合计不会被并发评价改动
+    rating_sum, rating_count = profiles.values_list('rating_sum', 'rating_count').get()
+    profiles.update(rating=rating_average(rating_sum, rating_count))
+
+
+def driven_by_reviewee(order_model):
+    """评价所属订单（在 order_model 表中）的司机是被评价者"""
+    return Exists(order_model.objects.filter(pk=OuterRef('order_id'), driver__account_id=OuterRef('reviewee_id')))
+
+
+def rebuild(chunk_size=5000):
+    """
+    按账号 id 区间重建评分：每个区间用一条分组聚合查询统计 Review，只写回与统计结果不一致的资料。
+    每处理一个区间产出 (检查的资料数, 修正的资料数)
+    """
+    high = Account.objects.aggregate(high=Max('id'))['high'] or 0
+    for start in range(1, high + 1, chunk_size):
+        end = start + chunk_size
+        totals = {
+            (reviewee_id, of_driver): (total, count)
+            for reviewee_id, of_driver, total, count in Review.objects.filter(
+                reviewee_id__gte=start, reviewee_id__lt=end,
+            ).annotate(
+                # Review.order 没有外键约束（订单可能已归档），在热表与归档表中分别判断被评价者是否为订单的司机
+                of_driver=ExpressionWrapper(Q(driven_by_reviewee(TripOrder)) | Q(driven_by_reviewee(ArchivedTripOrder)),
+                                            output_field=BooleanField()),
+            ).values('reviewee_id', 'of_driver').annotate(
+                total=Sum('rating'), count=Count('id'),
+            ).values_list('reviewee_id', 'of_driver', 'total', 'count')
+        }
+
+        checked = fixed = 0
+        for model, of_driver in ((Driver, True), (Passenger, False)):
+            changed = []
+            profiles = model.objects.filter(account_id__gte=start, account_id__lt=end).only(
+                'account_id', 'rating', 'rating_sum', 'rating_count')
+            for profile in profiles:
+                checked += 1
+                total, count = totals.get((profile.account_id, of_driver), (Decimal('0.0'), 0))
+                rating = rating_average(total, count) if count else profile.rating
+                if (profile.rating_sum, profile.rating_count, profile.rating) != (total, count, rating):
+                    profile.rating_sum, profile.rating_count, profile.rating = total, count, rating
+                    changed.append(profile)
+            model.objects.bulk_update(changed, ['rating', 'rating_sum', 'rating_count'])
+            fixed += len(changed)
+        yield checked, fixed
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import events, geo
+from .models import Account
+
+# WebSocket 推送通道（直接实现 ASGI 协议，不依赖 Channels）：
+#   ws/trips/?token=<access token>                      乘客/司机接收与自己相关的状态变化
+#   ws/trips/?token=<access token>&near=lat,lng&radius=km  司机额外接收附近新的打车请求
+# 推送内容见 events.py，连接只负责订阅与转发
+
+WEBSOCKET_PATH = '/ws/trips/'
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 50.0
+
+# 自定义关闭码
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_BAD_REQUEST = 4400
+
+
+@sync_to_async
+def authenticate(token):
+    """校验 access token，返回 Account；无效时返回 None"""
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+    return Account.objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True).first()
+
+
+def subscription_topics(account, params):
+    """返回连接订阅的主题列表，参数错误时抛出 ValueError"""
+    topics = [events.account_topic(account.pk)]
+    near = params.get('near')
+    if near:
+        if not account.is_driver:
+            raise ValueError('只有司机可以订阅附近的请求')
+        lat, lng = (float(v) for v in near.split(','))
+        radius = float(params.get('radius', DEFAULT_RADIUS_KM))
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius <= MAX_RADIUS_KM:
+            raise ValueError('near 或 radius 参数超出范围')
+        topics.extend(events.cell_topic(cell) for cell in geo.covering_cells(lat, lng, radius, geo.COARSE_PRECISION))
+    return topics
+
+
+async def websocket_application(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope.get('path') != WEBSOCKET_PATH:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    params = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+    account = await authenticate(params.get('token', ''))
+    if account is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    try:
+        topics = subscription_topics(account, params)
+    except ValueError:
+        await send({'type': 'websocket.close', 'code': CLOSE_BAD_REQUEST})
+        return
+
+    await send({'type': 'websocket.accept'})
+    subscription = events.broker.subscribe(topics)
+    next_message = asyncio.ensure_future(receive())
+    next_event = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_message, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                await send({'type': 'websocket.send',
+                            'text': json.dumps(next_event.result(), ensure_ascii=False)})
+                next_event = asyncio.ensure_future(subscription.get())
+            if next_message in done:
+                # 客户端发来的消息只用于保活，忽略内容
+                if next_message.result()['type'] == 'websocket.disconnect':
+                    break
+                next_message = asyncio.ensure_future(receive())
+    finally:
+        events.broker.unsubscribe(subscription)
+        next_message.cancel()
+        next_event.cancel()
@@ -0,0 +1,191 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import ArchivedTripOrder, DriverDailyStats, Review, TripOrder, rating_average
+
+# 司机日汇总：订单进入或离开已支付状态、金额或日期变化时，把差值累加到 (司机, 日期) 行上，
+# 评价提交时累加评分。读取方只查汇总表，耗时与历史订单数无关
+
+COUNTED_STATUSES = ('paid',)
+# 重建时统计的订单表（已归档的订单仍计入汇总）
+ORDER_MODELS = (TripOrder, ArchivedTripOrder)
+# 计入汇总需要读取的订单字段
+SNAPSHOT_FIELDS = ('driver_id', 'payment_status', 'end_time', 'created_at', 'actual_price', 'discount_amount')
+
+
+def order_day(order):
+    return timezone.localdate(order.end_time or order.created_at)
+
+
+def contribution(order):
+    """订单计入汇总的部分：((driver_id, day), revenue, discount)，不计入时为 None"""
+    if order.payment_status not in COUNTED_STATUSES or (order.end_time or order.created_at) is None:
+        return None
+    return (order.driver_id, order_day(order)), order.actual_price or Decimal(0), order.discount_amount or Decimal(0)
+
+
+def apply_deltas(deltas):
+    """
+    deltas: {(driver_id, day): [订单数, 收入, 优惠金额, 评分之和, 评价数] 的变化}。
+    应在与业务写入相同的事务中调用
+    """
+    for (driver_id, day), (trips, revenue, discount, rating_sum, rating_count) in deltas.items():
+        if not any((trips, revenue, discount, rating_sum, rating_count)):
+            continue
+        rows = DriverDailyStats.objects.filter(driver_id=driver_id, day=day)
+        values = {
+            'trip_count': F('trip_count') + trips, 'revenue': F('revenue') + revenue,
+            'discount': F('discount') + discount, 'rating_sum': F('rating_sum') + rating_sum,
+            'rating_count': F('rating_count') + rating_count,
+        }
+        if rows.update(**values):
+            continue
+        try:
+            with transaction.atomic():
+                DriverDailyStats.objects.create(driver_id=driver_id, day=day, trip_count=trips, revenue=revenue,
+                                                discount=discount, rating_sum=rating_sum, rating_count=rating_count)
+        except IntegrityError:
+            # 并发创建了同一汇总行，改为累加
+            rows.update(**values)
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0), 0])
+
+
+def _saved_contribution(instance):
+    """订单保存前（数据库中）计入汇总的部分"""
+    if instance._state.adding:
+        return None
+    if hasattr(instance, '_rollup_contribution'):
+        return instance._rollup_contribution
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and all(field in loaded for field in SNAPSHOT_FIELDS):
+        return contribution(TripOrder(**{field: loaded[field] for field in SNAPSHOT_FIELDS}))
+    # 加载时字段不全（only() / defer()）：从数据库读出保存前的状态
+    old = TripOrder.objects.filter(pk=instance.pk).only(*SNAPSHOT_FIELDS).first()
+    return contribution(old) if old else None
+
+
+def order_saving(instance, **kwargs):
+    """TripOrder 的 pre_save"""
+    instance._rollup_before = _saved_contribution(instance)
+
+
+def order_saved(instance, **kwargs):
+    """TripOrder 的 post_save：按保存前后计入部分的差值更新汇总"""
+    before, after = instance._rollup_before, contribution(instance)
+    if before != after:
+        deltas = _new_deltas()
+        for part, sign in ((before, -1), (after, 1)):
+            if part is not None:
+                key, revenue, discount = part
+                deltas[key][0] += sign
+                deltas[key][1] += sign * revenue
+                deltas[key][2] += sign * discount
+        apply_deltas(deltas)
+    instance._rollup_contribution = after
+
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """在此范围内删除订单不更新汇总（归档：订单移到 ArchivedTripOrder，仍计入汇总）"""
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = False
+
+
+def order_deleted(instance, **kwargs):
+    """TripOrder 的 post_delete"""
+    if getattr(_state, 'suspended', False):
+        return
+    before = _saved_contribution(instance)
+    if before is not None:
+        key, revenue, discount = before
+        apply_deltas({key: [-1, -revenue, -discount, Decimal(0), 0]})
+
+
+def record_rating(review):
+    """司机收到评价时调用（ratings.record_review），评分计入订单所在的日期"""
+    order = review.trip_order
+    if order.end_time or order.created_at:
+        apply_deltas({(order.driver_id, order_day(order)): [0, Decimal(0), Decimal(0), review.rating, 1]})
+
+
+def day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _in_day(day):
+    start, end = day_range(day)
+    return Q(end_time__gte=start, end_time__lt=end) | Q(end_time__isnull=True, created_at__gte=start, created_at__lt=end)
+
+
+def rebuild(first_day, last_day):
+    """
+    按天重建 [first_day, last_day] 的汇总：每天在一个事务中删除旧行，
+    再对热表与归档表各用两条分组聚合查询（订单、评价）统计后批量写入。每处理一天产出 (day, 写入行数)
+    """
+    day = first_day
+    while day <= last_day:
+        rows = {}
+
+        def row(driver_id):
+            if driver_id not in rows:
+                rows[driver_id] = DriverDailyStats(driver_id=driver_id, day=day)
+            return rows[driver_id]
+
+        with transaction.atomic():
+            DriverDailyStats.objects.filter(day=day).delete()
+            for model in ORDER_MODELS:
+                orders = model.objects.filter(_in_day(day))
+                for driver_id, trips, revenue, discount in orders.filter(
+                    payment_status__in=COUNTED_STATUSES,
+                ).values('driver_id').annotate(
+                    trips=Count('id'), revenue=Sum('actual_price', default=Decimal(0)),
+                    discount=Sum('discount_amount', default=Decimal(0)),
+                ).values_list('driver_id', 'trips', 'revenue', 'discount'):
+                    stats = row(driver_id)
+                    stats.trip_count += trips
+                    stats.revenue += revenue
+                    stats.discount += discount
+                # Review.order 没有外键约束（可能指向归档订单），用子查询取订单的司机，只统计司机收到的评价
+                order_driver = model.objects.filter(pk=OuterRef('order_id'), driver__account_id=OuterRef('reviewee_id'))
+                for driver_id, rating_sum, rating_count in Review.objects.filter(
+                    order_id__in=orders.values('id'),
+                ).annotate(
+                    order_driver_id=Subquery(order_driver.values('driver_id')),
+                ).filter(order_driver_id__isnull=False).values('order_driver_id').annotate(
+                    rating_sum=Sum('rating'), rating_count=Count('id'),
+                ).values_list('order_driver_id', 'rating_sum', 'rating_count'):
+                    stats = row(driver_id)
+                    stats.rating_sum += rating_sum
+                    stats.rating_count += rating_count
+            DriverDailyStats.objects.bulk_create(rows.values(), batch_size=1000)
+        yield day, len(rows)
+        day += timedelta(days=1)
+
+
+def summarize(queryset):
+    """汇总若干日汇总行（一条聚合查询）"""
+    totals = queryset.aggregate(
+        trip_count=Sum('trip_count', default=0), revenue=Sum('revenue', default=Decimal(0)),
+        discount=Sum('discount', default=Decimal(0)), rating_sum=Sum('rating_sum', default=Decimal(0)),
+        rating_count=Sum('rating_count', default=0),
+    )
+    rating_sum, rating_count = totals.pop('rating_sum'), totals.pop('rating_count')
+    totals['average_rating'] = rating_average(rating_sum, rating_count)
+    return totals
@@ -0,0 +1,85 @@
+import json
+import math
+
+# 行程轨迹的紧凑二进制编码：
+#   版本号 0x01：坐标按 1e-5 度（约 1 米，与 Google polyline 精度相同）取整，
+#                逐点记录与上一点的差值，差值经 zigzag 变换后写成 varint
+#   版本号 0x00：不是 [[lat, lng], ...] 的 JSON（带时间戳的点、GeoJSON 等）原样保存（UTF-8），保证迁移时不丢数据
+
+FORMAT_JSON = 0
+FORMAT_DELTA_VARINT = 1
+PRECISION = 100000
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag：让小的负数也只占少量字节
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(data, offset):
+    value = shift = 0
+    for byte in data[offset:]:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            yield (value >> 1) ^ -(value & 1)
+            value = shift = 0
+
+
+def _is_coordinate(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def to_points(route):
+    """
+    [[lat, lng], ...] 返回 [(lat, lng), ...]；点带有额外元素（如时间戳）、GeoJSON LineString 等
+    其他结构返回 None，由调用方按 JSON 原样保存，不丢弃任何数据
+    """
+    if not isinstance(route, list):
+        return None
+    points = []
+    for point in route:
+        if not isinstance(point, (list, tuple)) or len(point) != 2 or not all(map(_is_coordinate, point)):
+            return None
+        points.append((float(point[0]), float(point[1])))
+    return points
+
+
+def encode_route(route):
+    if route is None:
+        return None
+    points = to_points(route)
+    if points is None:
+        return bytes([FORMAT_JSON]) + json.dumps(route, ensure_ascii=False, separators=(',', ':')).encode()
+
+    out = bytearray([FORMAT_DELTA_VARINT])
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat, lng = round(lat * PRECISION), round(lng * PRECISION)
+        _write_varint(out, lat - prev_lat)
+        _write_varint(out, lng - prev_lng)
+        prev_lat, prev_lng = lat, lng
+    return bytes(out)
+
+
+def decode_route(data):
+    """解码为 [[lat, lng], ...]（或原样保存的 JSON）"""
+    if data is None:
+        return None
+    data = bytes(data)
+    if not data:
+        return None
+    if data[0] == FORMAT_JSON:
+        return json.loads(data[1:].decode())
+
+    points = []
+    lat = lng = 0
+    values = _read_varints(data, 1)
+    for d_lat in values:
+        lat += d_lat
+        lng += next(values)
+        points.append([lat / PRECISION, lng / PRECISION])
+    return points
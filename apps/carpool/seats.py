@@ -0,0 +1,27 @@
+from django.db.models import Case, F, Value, When
+
+from . import events
+from .caching import open_rides_cache
+from .models import Ride
+
+
+# 座位预留服务：JoinRideView、AcceptTripRequestView 与批量匹配共用
+
+def reserve_seats(ride_id, seats=1):
+    """
+    原子地为行程扣减 seats 个座位，座位恰好用完时同时将状态置为 full。
+
+    只执行一条条件 UPDATE（WHERE available_seats >= seats），不加行锁、不先读后写，
+    并发下不会超卖。返回是否预留成功。
+    """
+    # status 放在 available_seats 之前：MySQL 按从左到右的顺序计算 SET 子句，
+    # 这样 CASE 读到的是扣减前的座位数（SQLite / PostgreSQL 始终读取旧值）
+    updated = Ride.objects.filter(pk=ride_id, status='open', available_seats__gte=seats).update(
+        status=Case(When(available_seats=seats, then=Value('full')), default=F('status')),
+        available_seats=F('available_seats') - seats,
+    )
+    if updated:
+        # update() 不触发 post_save，需要单独让开放行程列表的缓存失效
+        open_rides_cache.bump()
+        events.ride_seats_changed(ride_id)
+    return updated == 1
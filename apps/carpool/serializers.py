@@ -1,8 +1,11 @@
+import copy
+
 from rest_framework import serializers
 from django.core.validators import RegexValidator, EmailValidator
+from . import geo
 from .models import (
     Account, Passenger, Driver, Advertiser, IdentityVerification, Vehicle, TripRequest, TripOrder, Review, Coupon,
-    UserCoupon, Ride
+    UserCoupon, Ride, ArchivedTripRequest, ArchivedTripOrder
 )
 
 
@@ -107,7 +110,8 @@ class DriverSerializer(serializers.ModelSerializer):
 class TripRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = TripRequest
-        fields = '__all__'
+        # 网格编号只用于查询，由 save() 维护，不对外输出
+        exclude = ['pickup_cell', 'pickup_cell_coarse']
         read_only_fields = ['account', 'status', 'request_time', 'estimated_price']
 
     def create(self, validated_data):
@@ -132,6 +136,29 @@ class TripRequestSerializer(serializers.ModelSerializer):
         return data
 
 
+# 已归档的打车请求（只读，输出与 TripRequestSerializer 相同）
+class ArchivedTripRequestSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedTripRequest
+        exclude = ['archived_at', 'pickup_cell', 'pickup_cell_coarse']
+
+
+# 乘客批量报价序列化器
+class TripQuoteSerializer(serializers.Serializer):
+    pickup_location = serializers.JSONField()
+    dropoff_location = serializers.JSONField()
+
+    def validate_pickup_location(self, value):
+        if geo.parse_point(value) is None:
+            raise serializers.ValidationError("上车位置格式不正确")
+        return value
+
+    def validate_dropoff_location(self, value):
+        if geo.parse_point(value) is None:
+            raise serializers.ValidationError("下车位置格式不正确")
+        return value
+
+
 # 乘客查看司机行程序列化器
 class RideListSerializer(serializers.ModelSerializer):
     driver_phone = serializers.CharField(source='account.phone', read_only=True)
@@ -149,20 +176,111 @@ class RideListSerializer(serializers.ModelSerializer):
         ]
 
 
+# 只读列表的快速路径：用 values_list() 直接取元组，按预先编译的字段转换函数生成与 serializer_class 完全相同的输出，
+# 省去逐行构造模型实例和 Serializer 的开销。只支持普通字段、跨关联的 source（如 account.phone）和主键关联字段
+class ValuesSerializer:
+    # 数据库取出的值已经是输出形式、to_representation 不会改变它的字段类型
+    PASSTHROUGH_FIELDS = (serializers.CharField, serializers.ChoiceField, serializers.BooleanField,
+                          serializers.IntegerField)
+
+    def __init__(self, serializer_class):
+        self.names, self.paths, self.converters = [], [], []
+        # 未指定时区的 DateTimeField 每次转换都会读取当前时区（asgiref Local，开销很大），改为每次 serialize 读取一次
+        self.datetime_fields = {}
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+                raise TypeError(f'{serializer_class.__name__}.{name} 不支持 values() 快速路径')
+            self.names.append(name)
+            self.paths.append('__'.join(field.source_attrs))
+            self.converters.append(self.compile(field))
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                self.datetime_fields[len(self.converters) - 1] = field
+
+    @classmethod
+    def compile(cls, field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return lambda pk: field.to_representation(serializers.PKOnlyObject(pk=pk))
+        if isinstance(field, serializers.RelatedField):
+            raise TypeError(f'{field.field_name} 不支持 values() 快速路径')
+        if isinstance(field, cls.PASSTHROUGH_FIELDS) or (isinstance(field, serializers.JSONField) and not field.binary):
+            return None
+        return field.to_representation
+
+    def values(self, queryset):
+        """返回具名元组的 queryset，属性名即字段路径，可直接交给 KeysetPagination"""
+        return queryset.values_list(*self.paths, named=True)
+
+    def serialize(self, rows):
+        names, converters = self.names, list(self.converters)
+        for index, field in self.datetime_fields.items():
+            field = copy.copy(field)
+            field.timezone = field.default_timezone()
+            converters[index] = field.to_representation
+        return [
+            {
+                name: value if converter is None or value is None else converter(value)
+                for name, converter, value in zip(names, converters, row)
+            }
+            for row in rows
+        ]
+
+
 # 乘客行程订单序列化器
 class TripOrderSerializer(serializers.ModelSerializer):
+    # 路线只在请求带有 ?include=route 时才解码返回
+    route = serializers.SerializerMethodField()
+
     class Meta:
         model = TripOrder
-        fields = '__all__'
+        exclude = ['route_data', 'passenger_account']
         read_only_fields = ['trip_request', 'driver', 'payment_status', 'created_at']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or 'route' not in request.query_params.get('include', '').split(','):
+            fields.pop('route')
+        return fields
+
+    def get_route(self, obj):
+        return obj.route
+
+
+# 已归档的订单（只读，输出与 TripOrderSerializer 相同）
+class ArchivedTripOrderSerializer(TripOrderSerializer):
+    class Meta(TripOrderSerializer.Meta):
+        model = ArchivedTripOrder
+        exclude = ['route_data', 'passenger_account', 'ride', 'archived_at']
+
+
+def serialize_rows(rows, serializer_classes, context=None):
+    """
+    序列化热表与归档表混合的一页（KeysetPagination.paginate_querysets 的结果）：
+    serializer_classes 为 {模型: 序列化器}，按模型分组批量序列化，结果保持原顺序
+    """
+    data = [None] * len(rows)
+    for model, serializer_class in serializer_classes.items():
+        positions = [i for i, row in enumerate(rows) if type(row) is model]
+        if positions:
+            serialized = serializer_class([rows[i] for i in positions], many=True, context=context or {}).data
+            for i, item in zip(positions, serialized):
+                data[i] = item
+    return data
+
 
 # 乘客评价序列化器
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = "__all__"
-        read_only_fields = ['created_at', 'reviewer']
+        # 被评价者由订单确定：乘客评价司机，司机评价乘客
+        read_only_fields = ['created_at', 'reviewer', 'reviewee']
+        # validate() 会访问订单的乘客与司机账号，随订单一起查出
+        extra_kwargs = {
+            'order': {'queryset': TripOrder.objects.select_related('trip_request__account', 'driver__account')},
+        }
 
     def validate(self, data):
         user = self.context['request'].user
@@ -180,6 +298,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         if Review.objects.filter(order=order, reviewer=user).exists():
             raise serializers.ValidationError("你已经评价过这个订单了。")
 
+        data['reviewee'] = driver_account if user == passenger_account else passenger_account
         # 检查是否在评价自己
         if user == data['reviewee']:
             raise serializers.ValidationError("不能评价自己。")
@@ -192,6 +311,14 @@ class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = '__all__'
+        read_only_fields = ['issued_count']
+
+
+# 优惠券目录（coupons.active_catalog 缓存的内容）：领取时 issued_count 随时变化，不放入缓存
+class CatalogCouponSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Coupon
+        exclude = ['issued_count']
 
 
 # 乘客优惠券领取记录序列化器
@@ -210,7 +337,8 @@ class UserCouponSerializer(serializers.ModelSerializer):
 class TripSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ride
-        fields = '__all__'
+        # 起点网格编号只用于供需统计与匹配，由 save() 维护，不对外输出
+        exclude = ['start_cell']
         read_only_fields = ['account', 'status']
 
     def validate(self, data):
@@ -234,3 +362,8 @@ class ReviewPassengerSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'rating', 'comment', 'created_at', 'order', 'reviewer', 'reviewee']
         read_only_fields = ['created_at']
+
+
+# 列表接口的快速路径实例
+ride_list_values = ValuesSerializer(RideListSerializer)
+trip_request_values = ValuesSerializer(TripRequestSerializer)
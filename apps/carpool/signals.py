@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import coupons, pricing, rollups
+from .caching import open_rides_cache
+from .models import Coupon, Ride, RideService, TripOrder
+
+
+# 在 CarpoolConfig.ready() 中导入本模块以注册信号处理函数
+
+post_save.connect(pricing.invalidate_service_cache, sender=RideService, dispatch_uid='pricing_service_saved')
+post_delete.connect(pricing.invalidate_service_cache, sender=RideService, dispatch_uid='pricing_service_deleted')
+
+post_save.connect(coupons.invalidate_catalog, sender=Coupon, dispatch_uid='coupon_catalog_saved')
+post_delete.connect(coupons.invalidate_catalog, sender=Coupon, dispatch_uid='coupon_catalog_deleted')
+
+post_save.connect(open_rides_cache.bump, sender=Ride, dispatch_uid='open_rides_ride_saved')
+post_delete.connect(open_rides_cache.bump, sender=Ride, dispatch_uid='open_rides_ride_deleted')
+
+pre_save.connect(rollups.order_saving, sender=TripOrder, dispatch_uid='driver_stats_order_saving')
+post_save.connect(rollups.order_saved, sender=TripOrder, dispatch_uid='driver_stats_order_saved')
+post_delete.connect(rollups.order_deleted, sender=TripOrder, dispatch_uid='driver_stats_order_deleted')
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import geo
+from .models import SupplyDemandCounter
+
+# 动态调价：按网格 + 时间段增量维护供需计数，报价时一次索引查找即可得到加价倍数
+
+BUCKET_SECONDS = 15 * 60
+# 需求座位数低于该值时不加价，避免数据稀疏时的抖动
+SURGE_MIN_DEMAND = 5
+# 供需比每超出 1 倍，价格上浮的比例
+SURGE_SENSITIVITY = 0.5
+SURGE_MAX_MULTIPLIER = 2.0
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def bucket_start(when):
+    seconds = int((when - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % BUCKET_SECONDS)
+
+
+def surge_cell(cell):
+    return cell[:geo.SURGE_PRECISION] if cell else None
+
+
+def apply_deltas(deltas):
+    """
+    deltas: {(cell, bucket_start): [需求座位变化, 供给座位变化]}。
+    应在与业务写入相同的事务中调用，使计数与已提交的数据保持一致
+    """
+    for (cell, start), (demand, supply) in deltas.items():
+        if not demand and not supply:
+            continue
+        counters = SupplyDemandCounter.objects.filter(cell=cell, bucket_start=start)
+        values = {'demand_seats': F('demand_seats') + demand, 'supply_seats': F('supply_seats') + supply}
+        if counters.update(**values):
+            continue
+        try:
+            with transaction.atomic():
+                SupplyDemandCounter.objects.create(cell=cell, bucket_start=start,
+                                                   demand_seats=demand, supply_seats=supply)
+        except IntegrityError:
+            # 并发创建了同一计数行，改为累加
+            counters.update(**values)
+
+
+def _add_demand(deltas, trip_request, sign):
+    cell = surge_cell(trip_request.pickup_cell)
+    when = trip_request.scheduled_time or trip_request.request_time
+    if cell and when:
+        deltas[(cell, bucket_start(when))][0] += sign * (trip_request.seats_needed or 1)
+
+
+def _add_supply(deltas, ride, seats):
+    cell = surge_cell(ride.start_cell)
+    if cell and ride.departure_time:
+        deltas[(cell, bucket_start(ride.departure_time))][1] += seats
+
+
+def record_demand(trip_request, sign=1):
+    """请求进入（sign=1）或离开（sign=-1）pending 状态"""
+    deltas = defaultdict(lambda: [0, 0])
+    _add_demand(deltas, trip_request, sign)
+    apply_deltas(deltas)
+
+
+def record_supply(ride, seats):
+    """行程的开放座位数变化了 seats 个"""
+    deltas = defaultdict(lambda: [0, 0])
+    _add_supply(deltas, ride, seats)
+    apply_deltas(deltas)
+
+
+def record_matches(matches):
+    """批量匹配成交后，按网格汇总需求与供给的减少量再写入"""
+    deltas = defaultdict(lambda: [0, 0])
+    for trip_request, ride in matches:
+        _add_demand(deltas, trip_request, -1)
+        _add_supply(deltas, ride, -(trip_request.seats_needed or 1))
+    apply_deltas(deltas)
+
+
+def multiplier(demand, supply):
+    if demand < SURGE_MIN_DEMAND or demand <= supply:
+        return 1.0
+    ratio = demand / max(supply, 1)
+    return round(min(SURGE_MAX_MULTIPLIER, 1 + SURGE_SENSITIVITY * (ratio - 1)), 1)
+
+
+def surge_multipliers(cells, when):
+    """返回每个网格在 when 所在时间段的加价倍数，所有网格只查询一次"""
+    keys = {surge_cell(cell) for cell in cells if cell}
+    counters = dict(
+        (cell, (demand, supply)) for cell, demand, supply in SupplyDemandCounter.objects.filter(
+            cell__in=keys, bucket_start=bucket_start(when)
+        ).values_list('cell', 'demand_seats', 'supply_seats')
+    ) if keys else {}
+    return [multiplier(*counters.get(surge_cell(cell), (0, 0))) for cell in cells]
@@ -1,16 +1,51 @@
 # 文件路径: yourapp/tests.py
 # 包含了针对 DriverAPITest.setUp 的修正
 
-from rest_framework.test import APITestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework.views import APIView
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+import asyncio
+import base64
+import csv
+import io
+import msgpack
+import numpy as np
 import json
+import os
+import tempfile
 from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
 from .models import (
-    IdentityVerification, Passenger, TripRequest, Ride, Coupon, UserCoupon, Driver, Vehicle, TripOrder
+    IdentityVerification, Passenger, TripRequest, Ride, Coupon, UserCoupon, Driver, Vehicle, TripOrder, RideMembership,
+    RideService, SupplyDemandCounter, RoutePoint, IdempotencyRecord, Review, DriverDailyStats, Message,
+    ArchivedTripRequest, ArchivedTripOrder
 )
+from djangoCarpool.asgi import application
+from ext.renderers import FastJSONRenderer
+from .caching import open_rides_cache
+from .management.commands import explain_hot_queries
+from .pagination import EstimatedCountPaginator, KeysetPagination
+from .serializers import (
+    RideListSerializer, TripRequestSerializer, UserCouponSerializer, ValuesSerializer, ride_list_values,
+    trip_request_values
+)
+from . import archive, coupons, events, exports, geo, idempotency, matching, pricing, ratings, realtime, rollups, \
+    route_codec, seats, surge, tracking
 
 Account = get_user_model()
 
@@ -206,4 +241,1482 @@ class DriverAPITest(APITestCase):
         print(f"Response Body <-- {json.dumps(response.data, ensure_ascii=False, indent=2)}")
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertEqual(response.data['detail'], '拼车请求剩余座位不足')
\ No newline at end of file
+        self.assertEqual(response.data['detail'], '拼车请求剩余座位不足')
+
+class PendingTripRequestNearbyTest(APITestCase):
+    """
+    司机按位置查询附近的待处理打车请求
+    """
+    def setUp(self):
+        self.user = Account.objects.create_user(phone='13500006666', password='DriverPassword123')
+        Driver.objects.create(account=self.user, rating=5.0)
+        self.user.is_driver = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+
+        self.passenger_user = Account.objects.create_user(phone='13600007777', password='PassengerPassword')
+        now = timezone.now()
+        # 同济大学嘉定校区附近、约 3km 外、以及上海市区（约 30km 外）
+        for address, lat, lng in [('近', 31.2850, 121.2150), ('中', 31.3120, 121.2150), ('远', 31.2304, 121.4737)]:
+            TripRequest.objects.create(
+                account=self.passenger_user, trip_type='打车', status='pending', seats_needed=1,
+                pickup_address=address, pickup_location={'lat': lat, 'lng': lng},
+                dropoff_address='B', dropoff_location={'lat': 31.0, 'lng': 121.0}, request_time=now
+            )
+
+    def test_pickup_cells_synced_on_save(self):
+        trip_request = TripRequest.objects.get(pickup_address='近')
+        self.assertEqual(len(trip_request.pickup_cell), 6)
+        self.assertTrue(trip_request.pickup_cell.startswith(trip_request.pickup_cell_coarse))
+
+        trip_request.pickup_location = {'lat': 31.2304, 'lng': 121.4737}
+        trip_request.save(update_fields=['pickup_location'])
+        trip_request.refresh_from_db()
+        self.assertEqual(trip_request.pickup_cell, TripRequest.objects.get(pickup_address='远').pickup_cell)
+
+    def test_near_filters_by_radius(self):
+        url = '/api/driver/trip/requests/'
+        response = self.client.get(url, {'near': '31.2850,121.2150', 'radius': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['pickup_address'] for r in response.data], ['近'])
+
+        response = self.client.get(url, {'near': '31.2850,121.2150', 'radius': 10})
+        self.assertEqual(sorted(r['pickup_address'] for r in response.data), ['中', '近'])
+        self.assertNotIn('pickup_cell', response.data[0])
+        self.assertNotIn('pickup_cell_coarse', response.data[0])
+
+    def test_cell_precision_chosen_before_enumerating(self):
+        # 估算值是实际网格数的上界，大半径直接使用粗网格
+        for radius in (0.5, 1, 2, 10):
+            self.assertGreaterEqual(geo.estimate_cells(31.2850, 121.2150, radius, geo.FINE_PRECISION),
+                                    len(geo.covering_cells(31.2850, 121.2150, radius, geo.FINE_PRECISION)))
+        self.assertEqual(geo.nearby_cell_filter(31.2850, 121.2150, 1)[0], 'pickup_cell')
+        with mock.patch.object(geo, 'covering_cells', wraps=geo.covering_cells) as covering:
+            field, cells = geo.nearby_cell_filter(31.2850, 121.2150, 50)
+        self.assertEqual(field, 'pickup_cell_coarse')
+        covering.assert_called_once_with(31.2850, 121.2150, 50, geo.COARSE_PRECISION)
+
+    def test_near_rejects_invalid_params(self):
+        response = self.client.get('/api/driver/trip/requests/', {'near': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CarpoolMatchingTest(TestCase):
+    """
+    拼车批量匹配引擎
+    """
+    def test_min_cost_assignment_beats_greedy(self):
+        # 贪心会把请求 0 分给行程 0（费用 1），导致请求 1 无法匹配
+        assignment = matching.min_cost_assignment([{0: 1, 1: 2}, {0: 3}], [1, 1])
+        self.assertEqual(assignment, [1, 0])
+
+    def test_run_matching_commits_orders_and_seats(self):
+        now = timezone.now()
+        driver_user = Account.objects.create_user(phone='13500007777', password='DriverPassword123')
+        Driver.objects.create(account=driver_user, rating=5.0)
+        early = Ride.objects.create(account=driver_user, start_location='A', end_location='B',
+                                    departure_time=now + timedelta(minutes=30), total_seats=2, available_seats=2)
+        late = Ride.objects.create(account=driver_user, start_location='A', end_location='B',
+                                   departure_time=now + timedelta(minutes=50), total_seats=3, available_seats=3)
+
+        requests = [
+            TripRequest.objects.create(
+                account=Account.objects.create_user(phone=f'1360000888{seats}{minutes}', password='PassengerPassword'),
+                trip_type='拼车', status='pending', seats_needed=seats,
+                pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+                dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2},
+                request_time=now, scheduled_time=now + timedelta(minutes=minutes)
+            )
+            for seats, minutes in [(2, 30), (2, 35), (1, 50)]
+        ]
+
+        self.assertEqual(matching.run_matching(now=now), (3, 2, 3))
+        early.refresh_from_db()
+        late.refresh_from_db()
+        self.assertEqual((early.available_seats, early.status), (0, 'full'))
+        self.assertEqual((late.available_seats, late.status), (0, 'full'))
+        self.assertEqual(TripOrder.objects.get(trip_request=requests[0]).start_time, early.departure_time)
+        self.assertEqual(TripRequest.objects.filter(status='matched').count(), 3)
+        self.assertEqual(RideMembership.objects.filter(ride=late).count(), 2)
+
+        # 再次运行不会重复匹配
+        self.assertEqual(matching.run_matching(now=now), (0, 0, 0))
+
+
+class SeatReservationTest(APITestCase):
+    """
+    条件扣减座位，JoinRideView 与 AcceptTripRequestView 共用
+    """
+    def setUp(self):
+        self.driver_user = Account.objects.create_user(phone='13500008888', password='DriverPassword123')
+        Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.ride = Ride.objects.create(
+            account=self.driver_user, start_location='A', end_location='B',
+            departure_time=timezone.now() + timedelta(hours=1), total_seats=2, available_seats=2
+        )
+
+    def test_reserve_seats_is_conditional_and_marks_full(self):
+        self.assertFalse(seats.reserve_seats(self.ride.pk, 3))
+        self.assertTrue(seats.reserve_seats(self.ride.pk, 2))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'full'))
+        self.assertFalse(seats.reserve_seats(self.ride.pk, 1))
+
+    def test_join_ride_decrements_seats(self):
+        passenger_user = Account.objects.create_user(phone='13600009999', password='PassengerPassword')
+        passenger_user.is_passenger = True
+        passenger_user.save()
+        self.client.force_authenticate(user=passenger_user)
+
+        response = self.client.post(f'/api/passenger/rides/{self.ride.pk}/join/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (1, 'open'))
+        self.assertEqual(TripOrder.objects.filter(trip_request__account=passenger_user).count(), 1)
+
+    def test_join_ride_is_idempotent(self):
+        passenger_user = Account.objects.create_user(phone='13600009998', password='PassengerPassword')
+        passenger_user.is_passenger = True
+        passenger_user.save()
+        self.client.force_authenticate(user=passenger_user)
+
+        for _ in range(2):
+            response = self.client.post(f'/api/passenger/rides/{self.ride.pk}/join/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 1)
+        self.assertEqual(RideMembership.objects.filter(ride=self.ride, account=passenger_user).count(), 1)
+
+    def test_cancel_does_not_overwrite_concurrent_join(self):
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.client.force_authenticate(user=self.driver_user)
+        first = QuerySet.first
+
+        def first_then_join(queryset):
+            # 取消视图读取行程之后、更新之前有乘客加入
+            ride = first(queryset)
+            seats.reserve_seats(self.ride.pk)
+            return ride
+
+        with mock.patch.object(QuerySet, 'first', first_then_join):
+            response = self.client.post(f'/api/driver/ride/{self.ride.pk}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (1, 'open'))
+
+        # 没有乘客时可以取消
+        Ride.objects.filter(pk=self.ride.pk).update(available_seats=2)
+        response = self.client.post(f'/api/driver/ride/{self.ride.pk}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Ride.objects.get(pk=self.ride.pk).status, 'canceled')
+
+    def test_concurrent_duplicate_accept_conflicts(self):
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        passenger_user = Account.objects.create_user(phone='13600009996', password='PassengerPassword')
+        trip_request = TripRequest.objects.create(
+            account=passenger_user, trip_type='拼车', status='pending', seats_needed=1,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2},
+            request_time=timezone.now(), scheduled_time=self.ride.departure_time
+        )
+        joined = TripRequest.objects.create(
+            account=passenger_user, trip_type='拼车', status='matched', seats_needed=1,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=timezone.now()
+        )
+        RideMembership.objects.create(ride=self.ride, account=passenger_user, trip_order=TripOrder.objects.create(
+            trip_request=joined, driver=self.driver_user.driver, payment_status='pending'))
+        self.client.force_authenticate(user=self.driver_user)
+
+        # 并发接单：检查时乘客尚未加入，写入时被唯一约束拒绝
+        with mock.patch.object(QuerySet, 'exists', return_value=False):
+            response = self.client.post(f'/api/driver/trip/{trip_request.id}/accept/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 2)
+        trip_request.refresh_from_db()
+        self.assertEqual(trip_request.status, 'pending')
+
+    def test_backfill_ride_memberships(self):
+        passenger_user = Account.objects.create_user(phone='13600009997', password='PassengerPassword')
+        trip_request = TripRequest.objects.create(
+            account=passenger_user, trip_type='拼车', status='matched', seats_needed=1,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2},
+            request_time=timezone.now(), scheduled_time=self.ride.departure_time
+        )
+        order = TripOrder.objects.create(trip_request=trip_request, driver=self.driver_user.driver,
+                                         payment_status='pending', start_time=self.ride.departure_time)
+
+        call_command('backfill_ride_memberships', stdout=io.StringIO())
+        call_command('backfill_ride_memberships', stdout=io.StringIO())
+        self.assertEqual(RideMembership.objects.get(trip_order=order).ride, self.ride)
+
+
+class PricingTest(APITestCase):
+    """
+    车费估算与批量报价
+    """
+    def setUp(self):
+        RideService.objects.create(name='打车', base_fare='10.00', per_km_rate='2.00', per_minute_rate='0.50')
+        RideService.objects.create(name='拼车', base_fare='6.00', per_km_rate='1.20', per_minute_rate='0.30')
+        self.user = Account.objects.create_user(phone='13600001111', password='PassengerPassword')
+        self.user.is_passenger = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.pickup = {'lat': 31.2850, 'lng': 121.2150}
+        self.dropoff = {'lat': 31.2304, 'lng': 121.4737}
+
+    def test_vectorized_quote_matches_decimal_formula(self):
+        distance, duration = pricing.trip_metrics([(31.2850, 121.2150)], [(31.2304, 121.4737)])
+        expected = (Decimal('10.00') + Decimal('2.00') * Decimal(repr(float(distance[0])))
+                    + Decimal('0.50') * Decimal(repr(float(duration[0])))).quantize(Decimal('0.01'))
+        self.assertEqual(pricing.estimate_price('打车', self.pickup, self.dropoff), expected)
+
+    def test_submit_trip_request_fills_estimated_price(self):
+        response = self.client.post('/api/passenger/trip/request/', {
+            'trip_type': '拼车', 'seats_needed': 1,
+            'pickup_location': self.pickup, 'pickup_address': 'A',
+            'dropoff_location': self.dropoff, 'dropoff_address': 'B',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.data['estimated_price']),
+                         pricing.estimate_price('拼车', self.pickup, self.dropoff))
+
+    def test_batch_quote_and_cache_invalidation(self):
+        trips = [{'pickup_location': self.pickup, 'dropoff_location': self.dropoff}] * 3
+        response = self.client.post('/api/passenger/trip/quote/', {'trips': trips}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(set(response.data[0]['quotes']), {'打车', '拼车'})
+
+        RideService.objects.create(name='专车', base_fare='20.00', per_km_rate='3.00', per_minute_rate='1.00')
+        response = self.client.post('/api/passenger/trip/quote/', {'trips': trips[:1]}, format='json')
+        self.assertIn('专车', response.data[0]['quotes'])
+
+        response = self.client.post('/api/passenger/trip/quote/', {'trips': [{'pickup_location': 'x'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SurgeCounterTest(APITestCase):
+    """
+    按网格与时间段增量维护供需计数，并据此动态加价
+    """
+    def setUp(self):
+        RideService.objects.create(name='打车', base_fare='10.00', per_km_rate='2.00', per_minute_rate='0.50')
+        self.passenger_user = Account.objects.create_user(phone='13600002222', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        self.driver_user = Account.objects.create_user(phone='13500002222', password='DriverPassword123')
+        Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.pickup = {'lat': 31.2850, 'lng': 121.2150}
+        self.dropoff = {'lat': 31.2304, 'lng': 121.4737}
+        self.when = timezone.now() + timedelta(hours=1)
+
+    def counter(self):
+        return SupplyDemandCounter.objects.get(cell=surge.surge_cell(geo.encode(31.2850, 121.2150)),
+                                               bucket_start=surge.bucket_start(self.when))
+
+    def submit(self, seats_needed):
+        self.client.force_authenticate(user=self.passenger_user)
+        return self.client.post('/api/passenger/trip/request/', {
+            'trip_type': '打车', 'seats_needed': seats_needed, 'scheduled_time': self.when.isoformat(),
+            'pickup_location': self.pickup, 'pickup_address': 'A',
+            'dropoff_location': self.dropoff, 'dropoff_address': 'B',
+        }, format='json')
+
+    def test_counters_follow_submit_cancel_and_rides(self):
+        first = self.submit(2)
+        self.submit(4)
+        self.assertEqual(self.counter().demand_seats, 6)
+
+        self.client.post(f"/api/passenger/trip/cancel/{first.data['id']}/")
+        self.assertEqual(self.counter().demand_seats, 4)
+
+        self.client.force_authenticate(user=self.driver_user)
+        response = self.client.post('/api/driver/ride/create/', {
+            'start_location': 'A', 'end_location': 'B', 'start_point': self.pickup,
+            'departure_time': self.when.isoformat(), 'total_seats': 3, 'available_seats': 3,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('start_cell', response.data)
+        self.assertEqual(self.counter().supply_seats, 3)
+        self.assertNotIn('start_cell', self.client.get('/api/driver/ride/').data[0])
+
+        self.client.post(f"/api/driver/ride/{response.data['id']}/cancel/")
+        self.assertEqual(self.counter().supply_seats, 0)
+
+    def test_surge_multiplier_raises_estimate(self):
+        base_price = pricing.estimate_price('打车', self.pickup, self.dropoff, when=self.when)
+        self.submit(4)
+        self.submit(4)
+        self.assertEqual(surge.multiplier(8, 0), surge.SURGE_MAX_MULTIPLIER)
+        self.assertEqual(surge.multiplier(8, 8), 1.0)
+        surged = pricing.estimate_price('打车', self.pickup, self.dropoff, when=self.when)
+        # 加价在取整之前计算，与先取整再乘最多相差 1 分
+        self.assertAlmostEqual(surged, base_price * Decimal(str(surge.SURGE_MAX_MULTIPLIER)), delta=Decimal('0.01'))
+
+
+class DriverLocationTest(APITestCase):
+    """
+    司机批量上报定位，缓冲后批量写入
+    """
+    def setUp(self):
+        self.driver_user = Account.objects.create_user(phone='13500003333', password='DriverPassword123')
+        driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        passenger_user = Account.objects.create_user(phone='13600003333', password='PassengerPassword')
+        trip_request = TripRequest.objects.create(
+            account=passenger_user, trip_type='打车', status='matched', seats_needed=1,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=timezone.now()
+        )
+        self.order = TripOrder.objects.create(trip_request=trip_request, driver=driver, payment_status='pending')
+        self.url = f'/api/driver/orders/{self.order.pk}/locations/'
+        self.client.force_authenticate(user=self.driver_user)
+
+    def test_points_are_buffered_until_trip_ends(self):
+        ts = timezone.now().timestamp()
+        response = self.client.post(self.url, {'points': [[31.0, 121.0, ts], [31.001, 121.001, ts + 1]]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(RoutePoint.objects.count(), 0)
+
+        response = self.client.post(self.url, {'points': [[31.002, 121.002, ts + 2]], 'final': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.route, [[31.0, 121.0], [31.001, 121.001], [31.002, 121.002]])
+        self.assertIsNotNone(self.order.end_time)
+        self.assertEqual(RoutePoint.objects.filter(order=self.order).count(), 3)
+
+    def test_rejects_other_drivers_and_bad_points(self):
+        for points in ([[91, 0, 0]], [{'lat': 31.0, 'lng': 121.0, 'ts': 0}], [[31.0, 121.0]]):
+            response = self.client.post(self.url, {'points': points}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, points)
+
+        other = Account.objects.create_user(phone='13500003334', password='DriverPassword123')
+        Driver.objects.create(account=other, rating=5.0)
+        other.is_driver = True
+        other.save()
+        self.client.force_authenticate(user=other)
+        response = self.client.post(self.url, {'points': [[31.0, 121.0, 0]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_idle_buffers_are_evicted_and_late_points_rebuild_route(self):
+        ts = timezone.now().timestamp()
+        self.client.post(self.url, {'points': [[31.0, 121.0, ts]]}, format='json')
+        buffer = tracking._buffers[self.order.pk]
+        buffer.last_seen -= tracking.IDLE_TIMEOUT
+        tracking._last_sweep -= tracking.FLUSH_INTERVAL
+        tracking.sweep_idle()
+        self.assertNotIn(self.order.pk, tracking._buffers)
+        self.assertEqual(RoutePoint.objects.filter(order=self.order).count(), 1)
+
+        # 另一个 worker 中的缓冲区在行程结束后才写入
+        other_worker = tracking.RouteBuffer(self.order.pk, self.driver_user.id)
+        other_worker.points.append((31.002, 121.002, timezone.now() + timedelta(seconds=2)))
+        self.client.post(self.url, {'points': [[31.001, 121.001, ts + 1]], 'final': True}, format='json')
+        tracking.flush(other_worker)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.route, [[31.0, 121.0], [31.001, 121.001], [31.002, 121.002]])
+
+
+class RouteEncodingTest(APITestCase):
+    """
+    TripOrder.route 的紧凑编码，仅在请求时解码返回
+    """
+    def test_codec_round_trip(self):
+        route = [[31.28501, 121.21502], [31.28, 121.2], [-33.86785, 151.20732]]
+        self.assertEqual(route_codec.decode_route(route_codec.encode_route(route)), route)
+        # 编码不了的结构原样保存：GeoJSON、带时间戳的点、非数值坐标
+        for other in ({'type': 'LineString', 'coordinates': [[121.2, 31.2], [121.3, 31.3]]},
+                      [[31.2, 121.2, '2026-10-18T08:00:00Z'], [31.3, 121.3, '2026-10-18T08:01:00Z']],
+                      [['31.2', '121.2']], {'foo': ['bar']}):
+            encoded = route_codec.encode_route(other)
+            self.assertEqual(encoded[0], route_codec.FORMAT_JSON)
+            self.assertEqual(route_codec.decode_route(encoded), other)
+
+    def test_history_includes_route_only_on_request(self):
+        user = Account.objects.create_user(phone='13600004444', password='PassengerPassword')
+        user.is_passenger = True
+        user.save()
+        driver_user = Account.objects.create_user(phone='13500004444', password='DriverPassword123')
+        driver = Driver.objects.create(account=driver_user, rating=5.0)
+        trip_request = TripRequest.objects.create(
+            account=user, trip_type='打车', status='matched', seats_needed=1,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=timezone.now()
+        )
+        TripOrder.objects.create(trip_request=trip_request, driver=driver, payment_status='pending',
+                                 route=[[31.0, 121.0], [31.1, 121.1]])
+        self.client.force_authenticate(user=user)
+
+        response = self.client.get('/api/passenger/orders/')
+        self.assertNotIn('route', response.data[0])
+        self.assertNotIn('route_data', response.data[0])
+        response = self.client.get('/api/passenger/orders/', {'include': 'route'})
+        self.assertEqual(response.data[0]['route'], [[31.0, 121.0], [31.1, 121.1]])
+
+
+class RealtimePushTest(APITestCase):
+    """
+    WebSocket 推送：直接驱动 ASGI 应用，检查订阅、推送与断开
+    """
+    def setUp(self):
+        self.passenger_user = Account.objects.create_user(phone='13600005555', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        self.driver_user = Account.objects.create_user(phone='13500005555', password='DriverPassword123')
+        Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+
+    def connect(self, query_string, action=None):
+        """建立连接并执行 action，返回连接期间收到的所有 ASGI 消息"""
+        async def scenario():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            await inbox.put({'type': 'websocket.connect'})
+            scope = {'type': 'websocket', 'path': '/ws/trips/', 'query_string': query_string.encode()}
+            app = asyncio.ensure_future(application(scope, inbox.get, outbox.put))
+            messages = [await asyncio.wait_for(outbox.get(), 5)]
+            if messages[0]['type'] == 'websocket.accept':
+                count = await sync_to_async(action)()
+                for _ in range(count):
+                    messages.append(await asyncio.wait_for(outbox.get(), 5))
+                await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(app, 5)
+            return messages
+        return async_to_sync(scenario)()
+
+    def test_rejects_invalid_token(self):
+        messages = self.connect('token=invalid')
+        self.assertEqual(messages, [{'type': 'websocket.close', 'code': realtime.CLOSE_UNAUTHORIZED}])
+
+    def test_driver_receives_new_and_matched_requests(self):
+        token = AccessToken.for_user(self.driver_user)
+
+        def submit_and_accept():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_authenticate(user=self.passenger_user)
+                response = self.client.post('/api/passenger/trip/request/', {
+                    'trip_type': '打车', 'seats_needed': 1,
+                    'pickup_location': {'lat': 31.2850, 'lng': 121.2150}, 'pickup_address': 'A',
+                    'dropoff_location': {'lat': 31.2304, 'lng': 121.4737}, 'dropoff_address': 'B',
+                }, format='json')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_authenticate(user=self.driver_user)
+                self.client.post(f"/api/driver/trip/{response.data['id']}/accept/")
+            self.request_id = response.data['id']
+            return 2
+
+        messages = self.connect(f'token={token}&near=31.28,121.21&radius=5', submit_and_accept)
+        self.assertEqual(messages[0], {'type': 'websocket.accept'})
+        created, matched = (json.loads(message['text']) for message in messages[1:])
+        self.assertEqual((created['type'], created['id']), ('trip_request.created', self.request_id))
+        self.assertEqual(matched, {'type': 'trip_request.status', 'id': self.request_id, 'status': 'matched'})
+        # 断开后不再保留订阅
+        self.assertFalse(events.broker.has_subscribers())
+
+
+class KeysetPaginationTest(APITestCase):
+    """
+    列表接口的游标分页：按游标翻页不重复、不遗漏
+    """
+    def setUp(self):
+        self.user = Account.objects.create_user(phone='13600006666', password='PassengerPassword')
+        self.user.is_passenger = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        same_time = timezone.now()
+        # 请求时间有重复，检验 (request_time, id) 联合游标
+        for i in range(7):
+            TripRequest.objects.create(
+                account=self.user, trip_type='打车', status='pending', seats_needed=1,
+                pickup_address='A', pickup_location={'lat': 31.2850 + i * 0.001, 'lng': 121.2150},
+                dropoff_address='B', dropoff_location={'lat': 31.2304, 'lng': 121.4737},
+                request_time=same_time - timedelta(minutes=i // 3),
+            )
+
+    def walk(self, url, params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(url, dict(params, **({'cursor': cursor} if cursor else {})))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data)
+            pages += 1
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return ids, pages
+            self.assertIn('rel="next"', response['Link'])
+
+    def test_cursor_walks_all_rows_in_order(self):
+        expected = list(TripRequest.objects.order_by('-request_time', '-id').values_list('id', flat=True))
+        ids, pages = self.walk('/api/passenger/trip/status/', {'page_size': 3})
+        self.assertEqual((ids, pages), (expected, 3))
+
+    def test_filtered_pages_and_invalid_cursor(self):
+        driver_user = Account.objects.create_user(phone='13500006666', password='DriverPassword123')
+        Driver.objects.create(account=driver_user, rating=5.0)
+        driver_user.is_driver = True
+        driver_user.save()
+        self.client.force_authenticate(user=driver_user)
+
+        # 半径 0.35 公里内只有前 4 个上车点
+        ids, _ = self.walk('/api/driver/trip/requests/',
+                           {'near': '31.2850,121.2150', 'radius': '0.35', 'page_size': 2})
+        self.assertEqual(len(ids), 4)
+        null_key = base64.urlsafe_b64encode(b'[null,1]').decode()
+        for cursor in ('not-a-cursor', null_key):
+            response = self.client.get('/api/driver/trip/requests/', {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, cursor)
+
+
+class QueryBudgetTest(APITestCase):
+    """
+    查询次数预算：每个接口分别在 N=1 与 N=500 行数据时记录查询次数，次数随 N 增长说明存在 N+1 查询
+    """
+    SMALL, LARGE = 1, 500
+
+    def setUp(self):
+        self.passenger_user = Account.objects.create_user(phone='13600007777', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        Passenger.objects.create(account=self.passenger_user, nickname='乘客', rating=5.0)
+        self.driver_user = Account.objects.create_user(phone='13500007777', password='DriverPassword123')
+        self.driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.now = timezone.now()
+
+    def accounts(self, start, count):
+        return Account.objects.bulk_create([Account(phone=f'1370{i:07d}') for i in range(start, start + count)])
+
+    def add_rides(self, start, count):
+        # 每个行程属于不同的司机账号
+        drivers = self.accounts(start, count)
+        accounts = Account.objects.filter(phone__in=[account.phone for account in drivers])
+        Ride.objects.bulk_create([
+            Ride(account=account, start_location='A', end_location='B', departure_time=self.now,
+                 total_seats=3, available_seats=3, status='open')
+            for account in accounts
+        ])
+
+    def add_my_rides(self, start, count):
+        Ride.objects.bulk_create([
+            Ride(account=self.driver_user, start_location='A', end_location='B', departure_time=self.now,
+                 total_seats=3, available_seats=3, status='open')
+            for _ in range(count)
+        ])
+
+    def add_requests(self, start, count, status='pending'):
+        return TripRequest.objects.bulk_create([
+            TripRequest(account=self.passenger_user, trip_type='打车', status=status, seats_needed=1,
+                        pickup_address='A', pickup_location={'lat': 31.2850, 'lng': 121.2150},
+                        dropoff_address='B', dropoff_location={'lat': 31.2304, 'lng': 121.4737},
+                        request_time=self.now)
+            for _ in range(count)
+        ])
+
+    def add_orders(self, start, count):
+        self.add_requests(start, count, status='completed')
+        request_ids = TripRequest.objects.filter(status='completed').order_by('-id').values_list('id', flat=True)
+        TripOrder.objects.bulk_create([
+            TripOrder(trip_request_id=request_id, passenger_account=self.passenger_user, driver=self.driver,
+                      payment_status='paid')
+            for request_id in request_ids[:count]
+        ])
+
+    def add_coupons(self, start, count):
+        Coupon.objects.bulk_create([
+            Coupon(name=f'券{i}', description='', discount_type='fixed amount', discount_value=5, min_spend=0,
+                   max_discount=5, valid_from=self.now - timedelta(days=1), valid_until=self.now + timedelta(days=1),
+                   created_by=self.driver_user)
+            for i in range(start, start + count)
+        ])
+        UserCoupon.objects.bulk_create([
+            UserCoupon(account=self.passenger_user, coupon=coupon, status='active')
+            for coupon in Coupon.objects.order_by('-id')[:count]
+        ])
+
+    def add_services(self, start, count):
+        services = RideService.objects.bulk_create([
+            RideService(name=f'服务{i}', base_fare=10, per_km_rate=2, per_minute_rate=0.5)
+            for i in range(start, start + count)
+        ])
+        self.driver.services.add(*RideService.objects.filter(name__in=[service.name for service in services]))
+
+    def assertConstantQueries(self, url, user, add_rows):
+        self.client.force_authenticate(user=user)
+        counts, created = [], 0
+        for n in (self.SMALL, self.LARGE):
+            add_rows(created, n - created)
+            created = n
+            # 测量未命中缓存时的查询次数
+            cache.clear()
+            coupons.invalidate_catalog()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'page_size': KeysetPagination.max_page_size})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1],
+                         f'{url}: N={self.SMALL} 时 {counts[0]} 次查询，N={self.LARGE} 时 {counts[1]} 次')
+
+    def test_list_endpoints_have_constant_query_counts(self):
+        endpoints = [
+            ('/api/passenger/rides/open/', self.passenger_user, self.add_rides),
+            ('/api/passenger/trip/status/', self.passenger_user, self.add_requests),
+            ('/api/driver/trip/requests/', self.driver_user, self.add_requests),
+            ('/api/passenger/orders/', self.passenger_user, self.add_orders),
+            ('/api/driver/orders/', self.driver_user, self.add_orders),
+            ('/api/driver/ride/', self.driver_user, self.add_my_rides),
+            ('/api/passenger/coupons/', self.passenger_user, self.add_coupons),
+            ('/api/driver/info/', self.driver_user, self.add_services),
+        ]
+        for url, user, add_rows in endpoints:
+            with self.subTest(url=url):
+                self.assertConstantQueries(url, user, add_rows)
+
+    def test_trip_passengers_is_a_single_query(self):
+        self.add_orders(0, 1)
+        order = TripOrder.objects.get()
+        self.client.force_authenticate(user=self.driver_user)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/driver/trip/{order.trip_request_id}/passengers/')
+        self.assertEqual(response.data['nickname'], '乘客')
+
+
+class ValuesSerializerTest(APITestCase):
+    """
+    values() 快速路径的输出必须与 ModelSerializer 逐字节一致
+    """
+    def setUp(self):
+        self.user = Account.objects.create_user(phone='13600008888', password='PassengerPassword')
+        now = timezone.now()
+        Ride.objects.create(account=self.user, start_location='起点', end_location='终点', departure_time=now,
+                            total_seats=4, available_seats=2)
+        TripRequest.objects.create(
+            account=self.user, trip_type='拼车', status='pending', seats_needed=2, estimated_price=Decimal('12.5'),
+            pickup_address='A', pickup_location={'lat': 31.2850, 'lng': 121.2150},
+            dropoff_address='B', dropoff_location={'type': 'Point', 'coordinates': [121.4737, 31.2304]},
+            request_time=now, scheduled_time=now + timedelta(hours=1),
+        )
+        # 可空字段为空、JSON 位置无法解析的情况
+        TripRequest.objects.create(
+            account=self.user, trip_type='打车', status='pending', pickup_address='C', pickup_location='未知',
+            dropoff_address='D', dropoff_location=[], request_time=now,
+        )
+
+    def assertSameBytes(self, values_serializer, serializer_class, queryset):
+        renderer = JSONRenderer()
+        expected = renderer.render(serializer_class(queryset.order_by('id'), many=True).data)
+        actual = renderer.render(values_serializer.serialize(values_serializer.values(queryset.order_by('id'))))
+        self.assertEqual(actual, expected)
+
+    def test_output_is_byte_identical(self):
+        self.assertSameBytes(ride_list_values, RideListSerializer, Ride.objects.all())
+        self.assertSameBytes(trip_request_values, TripRequestSerializer, TripRequest.objects.all())
+
+    def test_rejects_unsupported_fields(self):
+        with self.assertRaises(TypeError):
+            ValuesSerializer(UserCouponSerializer)
+
+
+class RendererTest(APITestCase):
+    """
+    orjson 编码的 JSON 与 DRF 默认输出一致；Accept: application/msgpack 时返回等价的 MessagePack
+    """
+    def test_fast_json_matches_drf_output(self):
+        data = {
+            'price': Decimal('12.50'), 'when': timezone.now(), 'naive': timezone.now().replace(tzinfo=None),
+            'text': '拼车 行程', 1: [1.5, None, True], 'big': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_msgpack_negotiated_by_accept_header(self):
+        user = Account.objects.create_user(phone='13600009999', password='PassengerPassword')
+        user.is_passenger = True
+        user.save()
+        TripRequest.objects.create(
+            account=user, trip_type='打车', status='pending', seats_needed=1, estimated_price=Decimal('9.90'),
+            pickup_address='A', pickup_location={'lat': 31.2850, 'lng': 121.2150},
+            dropoff_address='B', dropoff_location={'lat': 31.2304, 'lng': 121.4737}, request_time=timezone.now(),
+        )
+        self.client.force_authenticate(user=user)
+
+        as_json = self.client.get('/api/passenger/trip/status/', HTTP_ACCEPT='application/json')
+        as_msgpack = self.client.get('/api/passenger/trip/status/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(as_msgpack.content), json.loads(as_json.content))
+
+
+class OpenRidesCacheTest(APITestCase):
+    """
+    开放行程列表的版本化缓存：行程写入或座位扣减后失效
+    """
+    def setUp(self):
+        cache.clear()
+        self.passenger_user = Account.objects.create_user(phone='13600001010', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        self.driver_user = Account.objects.create_user(phone='13500001010', password='DriverPassword123')
+        Driver.objects.create(account=self.driver_user, rating=5.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ride = Ride.objects.create(account=self.driver_user, start_location='A', end_location='B',
+                                            departure_time=timezone.now(), total_seats=3, available_seats=3)
+        self.client.force_authenticate(user=self.passenger_user)
+
+    def get(self):
+        response = self.client.get('/api/passenger/rides/open/')
+        return response['X-Cache'], [(ride['id'], ride['available_seats']) for ride in response.data]
+
+    def test_hit_until_rides_change(self):
+        open_rides_cache.reset_stats()
+        self.assertEqual(self.get(), ('MISS', [(self.ride.id, 3)]))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(), ('HIT', [(self.ride.id, 3)]))
+        self.assertEqual(open_rides_cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+        # 座位扣减（update()，不触发 post_save）
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/passenger/rides/{self.ride.id}/join/')
+        self.assertEqual(self.get(), ('MISS', [(self.ride.id, 2)]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Ride.objects.create(account=self.driver_user, start_location='A', end_location='C',
+                                        departure_time=timezone.now(), total_seats=2, available_seats=2)
+        self.assertEqual(self.get(), ('MISS', [(self.ride.id, 2), (other.id, 2)]))
+        self.assertGreater(open_rides_cache.stats()['hit_ratio'], 0)
+
+
+class CouponCatalogCacheTest(APITestCase):
+    """
+    优惠券目录缓存到最近的有效期边界，Coupon 修改时失效
+    """
+    def setUp(self):
+        coupons.invalidate_catalog()
+        self.user = Account.objects.create_user(phone='13600001111', password='PassengerPassword')
+        self.user.is_passenger = True
+        self.user.save()
+        self.now = timezone.now()
+        self.active = self.coupon('满减券', self.now - timedelta(days=1), self.now + timedelta(hours=1))
+        self.upcoming = self.coupon('新人券', self.now + timedelta(minutes=30), self.now + timedelta(days=1))
+
+    def coupon(self, name, valid_from, valid_until):
+        return Coupon.objects.create(name=name, description='', discount_type='fixed amount', discount_value=5,
+                                     min_spend=0, max_discount=5, valid_from=valid_from, valid_until=valid_until,
+                                     created_by=self.user)
+
+    def names(self, now):
+        return [coupon['name'] for coupon in coupons.active_catalog(now)]
+
+    def test_catalog_expires_at_next_boundary(self):
+        self.assertEqual(self.names(self.now), ['满减券'])
+        # 最长缓存 CATALOG_MAX_TTL
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(self.now + coupons.CATALOG_MAX_TTL - timedelta(seconds=1)), ['满减券'])
+        self.assertEqual(self.names(self.now + timedelta(minutes=29)), ['满减券'])
+        # 新人券开始生效
+        self.assertEqual(self.names(self.now + timedelta(minutes=30)), ['满减券', '新人券'])
+        # 满减券过期
+        self.assertEqual(self.names(self.now + timedelta(hours=2)), ['新人券'])
+
+    def test_invalidated_on_save_and_only_user_coupons_queried(self):
+        self.assertEqual(self.names(self.now), ['满减券'])
+        self.active.name = '满100减5'
+        self.active.save()
+        self.assertEqual(self.names(self.now), ['满100减5'])
+
+        UserCoupon.objects.create(account=self.user, coupon=self.active, status='active')
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/passenger/coupons/')
+        self.assertEqual(response.data['my_coupons'][0]['coupon']['name'], '满100减5')
+        self.assertEqual([coupon['name'] for coupon in response.data['available']], ['满100减5'])
+
+    def test_changes_in_other_processes_seen_through_shared_version(self):
+        self.assertEqual(self.names(self.now), ['满减券'])
+        self.assertNotIn('issued_count', coupons.active_catalog(self.now)[0])
+        # 其他进程修改了优惠券：本进程的目录没有被清除，只有共享缓存中的版本号在提交后递增
+        Coupon.objects.filter(pk=self.active.pk).update(name='满100减5')
+        self.assertEqual(self.names(self.now), ['满减券'])
+        with self.captureOnCommitCallbacks(execute=True):
+            coupons.catalog_version.bump()
+        self.assertEqual(self.names(self.now), ['满100减5'])
+
+
+class ExplainHotQueriesTest(TestCase):
+    """
+    explain_hot_queries：热点查询都应使用索引，全表扫描能被识别出来
+    """
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+        # 游标翻页、归档表与日汇总的查询也在检查之列
+        for name in ('DriverOrderHistoryView (cursor)', 'PassengerOrderHistoryView archived (cursor)',
+                     'TripRequestStatusView archived', 'DriverEarningsView'):
+            self.assertIn(f'ok         {name}\n', out.getvalue())
+
+    def test_detects_full_scans(self):
+        plan = Ride.objects.filter(start_location='A').explain()
+        self.assertEqual(explain_hot_queries.sqlite_full_scans(plan), ['carpool_ride'])
+        # 扫描整个索引同样是全扫描，只有 SEARCH 算使用索引
+        self.assertEqual(explain_hot_queries.sqlite_full_scans('SCAN carpool_ride USING INDEX ride_status_idx'),
+                         ['carpool_ride'])
+        self.assertEqual(explain_hot_queries.sqlite_full_scans(
+            'SCAN carpool_coupon USING COVERING INDEX coupon_valid_from_idx'), ['carpool_coupon'])
+        self.assertEqual(explain_hot_queries.sqlite_full_scans(
+            'SEARCH carpool_ride USING INDEX ride_status_departure_idx (status=?)'), [])
+        mysql_plan = json.dumps({'query_block': {'nested_loop': [
+            {'table': {'table_name': 'carpool_ride', 'access_type': 'ref'}},
+            {'table': {'table_name': 'carpool_triporder', 'access_type': 'ALL'}},
+            {'table': {'table_name': 'carpool_coupon', 'access_type': 'index'}},
+        ]}})
+        self.assertEqual(explain_hot_queries.mysql_full_scans(mysql_plan), ['carpool_triporder', 'carpool_coupon'])
+
+
+class IdempotencyTest(APITestCase):
+    """
+    带 Idempotency-Key 的重试返回第一次的响应，不会重复创建数据
+    """
+    def setUp(self):
+        self.user = Account.objects.create_user(phone='13600003333', password='PassengerPassword')
+        self.user.is_passenger = True
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(name='满减券', description='', discount_type='fixed amount',
+                                            discount_value=5, min_spend=0, max_discount=5,
+                                            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+                                            created_by=self.user)
+        self.payload = {
+            'trip_type': '打车', 'seats_needed': 1, 'scheduled_time': (now + timedelta(hours=1)).isoformat(),
+            'pickup_location': {'lat': 31.2850, 'lng': 121.2150}, 'pickup_address': 'A',
+            'dropoff_location': {'lat': 31.2304, 'lng': 121.4737}, 'dropoff_address': 'B',
+        }
+
+    def submit(self, key, payload=None):
+        return self.client.post('/api/passenger/trip/request/', payload or self.payload, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.submit('trip-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        retry = self.submit('trip-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(TripRequest.objects.filter(account=self.user).count(), 1)
+
+        # 同一个键用于不同的请求体
+        other = self.submit('trip-1', dict(self.payload, seats_needed=2))
+        self.assertEqual(other.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        # 不带键的请求不受影响
+        self.client.post('/api/passenger/trip/request/', self.payload, format='json')
+        self.assertEqual(TripRequest.objects.filter(account=self.user).count(), 2)
+
+    def test_receive_coupon_once(self):
+        url = f'/api/passenger/coupons/receive/{self.coupon.id}/'
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='coupon-1')
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY='coupon-1')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(UserCoupon.objects.filter(account=self.user).count(), 1)
+
+    def test_in_progress_and_expired_keys(self):
+        request = APIRequestFactory().post('/api/passenger/trip/request/', self.payload, format='json')
+        record = IdempotencyRecord.objects.create(account=self.user, key='trip-2',
+                                                  fingerprint=idempotency.fingerprint(request))
+        self.assertEqual(self.submit('trip-2').status_code, status.HTTP_409_CONFLICT)
+
+        IdempotencyRecord.objects.filter(id=record.id).update(
+            created_at=timezone.now() - idempotency.IDEMPOTENCY_TTL - timedelta(seconds=1))
+        self.assertEqual(self.submit('trip-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(idempotency.purge_expired(now=timezone.now() + idempotency.IDEMPOTENCY_TTL * 2), 1)
+
+    def test_stale_placeholder_is_taken_over(self):
+        request = APIRequestFactory().post('/api/passenger/trip/request/', self.payload, format='json')
+        record = IdempotencyRecord.objects.create(account=self.user, key='trip-3',
+                                                  fingerprint=idempotency.fingerprint(request))
+        # 处理第一次请求的进程崩溃，占位记录超时后由重试接管
+        IdempotencyRecord.objects.filter(id=record.id).update(
+            created_at=timezone.now() - idempotency.PLACEHOLDER_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(self.submit('trip-3').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.submit('trip-3')['Idempotent-Replayed'], 'true')
+        self.assertEqual(TripRequest.objects.filter(account=self.user).count(), 1)
+
+    def test_replay_restores_headers(self):
+        class CreatedView(APIView):
+            @idempotency.idempotent
+            def post(self, request):
+                return Response({'id': 1}, status=status.HTTP_201_CREATED, headers={'Location': '/things/1/'},
+                                content_type='application/json; charset=utf-8')
+
+        def post():
+            request = APIRequestFactory().post('/things/', {}, format='json', HTTP_IDEMPOTENCY_KEY='thing-1')
+            force_authenticate(request, user=self.user)
+            return CreatedView.as_view()(request)
+
+        first, retry = post(), post()
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        for header in ('Location', 'Content-Type'):
+            self.assertEqual(retry[header], first[header])
+
+
+
+class CouponClaimTest(APITestCase):
+    """
+    领取优惠券：总量与每人限领由条件 UPDATE 和唯一约束保证
+    """
+    def setUp(self):
+        self.now = timezone.now()
+        self.admin = Account.objects.create_user(phone='13900004444', password='AdminPassword')
+        self.users = []
+        for i in range(3):
+            user = Account.objects.create_user(phone=f'1360000444{i}', password='PassengerPassword')
+            user.is_passenger = True
+            user.save()
+            self.users.append(user)
+
+    def coupon(self, **kwargs):
+        fields = dict(name='秒杀券', description='', discount_type='fixed amount', discount_value=5, min_spend=0,
+                      max_discount=5, valid_from=self.now - timedelta(hours=1), valid_until=self.now + timedelta(hours=1),
+                      created_by=self.admin)
+        fields.update(kwargs)
+        return Coupon.objects.create(**fields)
+
+    def test_quota_and_per_user_limit(self):
+        coupon = self.coupon(total_quantity=2, per_user_limit=1)
+        self.assertEqual(coupons.claim(self.users[0], coupon.id, self.now), coupons.CLAIMED)
+        self.assertEqual(coupons.claim(self.users[0], coupon.id, self.now), coupons.LIMIT_REACHED)
+        self.assertEqual(coupons.claim(self.users[1], coupon.id, self.now), coupons.CLAIMED)
+        self.assertEqual(coupons.claim(self.users[2], coupon.id, self.now), coupons.SOLD_OUT)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.issued_count, 2)
+        self.assertEqual(UserCoupon.objects.filter(coupon=coupon).count(), 2)
+
+    def test_unlimited_quantity_and_multiple_claims(self):
+        coupon = self.coupon(per_user_limit=2)
+        results = [coupons.claim(self.users[0], coupon.id, self.now) for _ in range(3)]
+        self.assertEqual(results, [coupons.CLAIMED, coupons.CLAIMED, coupons.LIMIT_REACHED])
+        self.assertEqual(list(UserCoupon.objects.filter(coupon=coupon).values_list('claim_no', flat=True)
+                              .order_by('claim_no')), [1, 2])
+
+    def test_limit_reached_rolls_back_counter(self):
+        coupon = self.coupon(total_quantity=10, per_user_limit=1)
+        coupons.claim(self.users[0], coupon.id, self.now)
+        self.assertEqual(coupons.claim(self.users[0], coupon.id, self.now), coupons.LIMIT_REACHED)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.issued_count, 1)
+
+    def test_claim_after_deleted_claim(self):
+        coupon = self.coupon(per_user_limit=2)
+        coupons.claim(self.users[0], coupon.id, self.now)
+        coupons.claim(self.users[0], coupon.id, self.now)
+        UserCoupon.objects.filter(coupon=coupon, claim_no=1).delete()
+        # 序号接着最大序号编，不与保留的 2 号冲突
+        self.assertEqual(coupons.claim(self.users[0], coupon.id, self.now), coupons.CLAIMED)
+        self.assertEqual(list(UserCoupon.objects.filter(coupon=coupon).values_list('claim_no', flat=True)
+                              .order_by('claim_no')), [2, 3])
+
+    def test_receive_view(self):
+        coupon = self.coupon(total_quantity=1)
+        expired = self.coupon(valid_until=self.now - timedelta(minutes=1))
+        self.client.force_authenticate(user=self.users[0])
+        self.assertEqual(self.client.post(f'/api/passenger/coupons/receive/{coupon.id}/').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.post(f'/api/passenger/coupons/receive/{expired.id}/').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/passenger/coupons/receive/0/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.users[1])
+        response = self.client.post(f'/api/passenger/coupons/receive/{coupon.id}/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['detail'], '优惠券已领完')
+
+
+class CouponSettlementTest(APITestCase):
+    """
+    结算时自动选用优惠最大的优惠券，并在同一事务中标记为已使用
+    """
+    def setUp(self):
+        self.now = timezone.now()
+        self.passenger_user = Account.objects.create_user(phone='13600005555', password='PassengerPassword')
+        self.other_user = Account.objects.create_user(phone='13600005556', password='PassengerPassword')
+        self.driver_user = Account.objects.create_user(phone='13500005555', password='DriverPassword123')
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+
+    def coupon(self, account, discount_type, value, min_spend=0, max_discount=0, **kwargs):
+        coupon = Coupon.objects.create(
+            name=f'{discount_type} {value}', description='', discount_type=discount_type, discount_value=value,
+            min_spend=min_spend, max_discount=max_discount, valid_from=self.now - timedelta(days=1),
+            valid_until=kwargs.pop('valid_until', self.now + timedelta(days=1)), created_by=self.driver_user)
+        return UserCoupon.objects.create(account=account, coupon=coupon, status='active', **kwargs)
+
+    def order(self, account, estimated_price=None):
+        trip_request = TripRequest.objects.create(
+            account=account, trip_type='打车', status='matched', estimated_price=estimated_price,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=self.now
+        )
+        order = TripOrder.objects.create(trip_request=trip_request, driver=self.driver, payment_status='pending')
+        return TripOrder.objects.select_related('trip_request').get(pk=order.pk)
+
+    def test_discount_rules(self):
+        price = np.array([10000, 10000, 10000, 3000, 500])
+        discounts = coupons.discount_cents(
+            price,
+            percentage=np.array([False, True, True, False, False]),
+            value=np.array([1500, 20, 20, 1000, 1000]),
+            min_spend=np.array([0, 0, 0, 5000, 0]),
+            max_discount=np.array([0, 1000, 0, 0, 0]),
+        )
+        # 满减 15 元；八折封顶 10 元；八折不封顶；未达最低消费；不超过订单价格
+        self.assertEqual(discounts.tolist(), [1500, 1000, 2000, -1, 500])
+
+    def test_best_coupon_applied_and_marked_used(self):
+        fixed = self.coupon(self.passenger_user, 'fixed amount', 15)
+        percent = self.coupon(self.passenger_user, 'percentage', 20, max_discount=30)
+        self.coupon(self.passenger_user, 'fixed amount', 50, min_spend=200)
+        self.coupon(self.passenger_user, 'fixed amount', 80, valid_until=self.now - timedelta(minutes=1))
+        order = self.order(self.passenger_user)
+
+        coupons.settle_orders([order], [Decimal('100.00')], self.now)
+        order.refresh_from_db()
+        self.assertEqual(order.user_coupon_id, percent.id)
+        self.assertEqual(order.discount_amount, Decimal('20.00'))
+        self.assertEqual(order.actual_price, Decimal('80.00'))
+        percent.refresh_from_db()
+        self.assertEqual((percent.status, percent.used_at), ('used', self.now))
+        fixed.refresh_from_db()
+        self.assertEqual(fixed.status, 'active')
+        # 已结算的订单不会再次结算
+        self.assertEqual(coupons.settle_orders([order], [Decimal('100.00')], self.now), [])
+
+    def test_batch_uses_each_coupon_once(self):
+        big = self.coupon(self.passenger_user, 'fixed amount', 30)
+        small = self.coupon(self.passenger_user, 'fixed amount', 10)
+        orders = [self.order(self.passenger_user), self.order(self.passenger_user),
+                  self.order(self.passenger_user), self.order(self.other_user)]
+        # 保存点 2 次 + 查询未结算订单、可用券 + 两条条件 UPDATE + 批量写订单
+        with self.assertNumQueries(7):
+            coupons.settle_orders(orders, [Decimal('50')] * 4, self.now)
+        self.assertEqual([order.user_coupon_id for order in orders], [big.id, small.id, None, None])
+        self.assertEqual([order.actual_price for order in orders],
+                         [Decimal('20.00'), Decimal('40.00'), Decimal('50.00'), Decimal('50.00')])
+        self.assertEqual(UserCoupon.objects.filter(status='used').count(), 2)
+
+    def test_settle_view(self):
+        self.coupon(self.passenger_user, 'fixed amount', 5)
+        order = self.order(self.passenger_user, estimated_price=Decimal('32.50'))
+        self.client.force_authenticate(user=self.driver_user)
+        url = f'/api/driver/orders/{order.pk}/settle/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['actual_price']), Decimal('27.50'))
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.post(f'/api/driver/orders/{self.order(self.other_user).pk}/settle/',
+                                          {'price': 'abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_settle_view_zero_price_and_conflict(self):
+        self.coupon(self.passenger_user, 'fixed amount', 5)
+        self.client.force_authenticate(user=self.driver_user)
+        order = self.order(self.passenger_user, estimated_price=Decimal('32.50'))
+        response = self.client.post(f'/api/driver/orders/{order.pk}/settle/', {'price': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['actual_price']), Decimal('0.00'))
+
+        # 重试用尽时返回 409，幂等记录保存该响应供重放
+        order = self.order(self.other_user)
+        url = f'/api/driver/orders/{order.pk}/settle/'
+        with mock.patch.object(coupons, 'settle_orders', side_effect=coupons.SettlementConflict('冲突')):
+            response = self.client.post(url, {'price': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='settle-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        replayed = self.client.post(url, {'price': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='settle-1')
+        self.assertEqual((replayed.status_code, replayed['Idempotent-Replayed']), (status.HTTP_409_CONFLICT, 'true'))
+
+
+class ExpireCouponsTest(TestCase):
+    """
+    expire_coupons 按主键区间分批把过期优惠券标记为 expired
+    """
+    def test_sweep_expires_only_active_coupons_of_expired_coupons(self):
+        now = timezone.now()
+        user = Account.objects.create_user(phone='13600006666', password='PassengerPassword')
+
+        def coupon(valid_until):
+            return Coupon.objects.create(name='券', description='', discount_type='fixed amount', discount_value=5,
+                                         min_spend=0, max_discount=0, valid_from=now - timedelta(days=2),
+                                         valid_until=valid_until, created_by=user)
+
+        expired, valid = coupon(now - timedelta(days=1)), coupon(now + timedelta(days=1))
+        rows = [UserCoupon.objects.create(account=user, coupon=c, claim_no=i, status=s)
+                for i, (c, s) in enumerate([(expired, 'active'), (expired, 'used'), (valid, 'active'),
+                                            (expired, 'active'), (expired, 'active')], start=1)]
+
+        with self.assertNumQueries(1 + 3):
+            self.assertEqual(sum(coupons.expire_user_coupons(now, chunk_size=2)), 3)
+        self.assertEqual([UserCoupon.objects.get(pk=row.pk).status for row in rows],
+                         ['expired', 'used', 'active', 'expired', 'expired'])
+
+        out = io.StringIO()
+        call_command('expire_coupons', stdout=out)
+        self.assertIn('过期 0 条', out.getvalue())
+
+
+class RatingAggregationTest(APITestCase):
+    """
+    提交评价时在同一事务中累加被评价者的评分，rebuild_ratings 按 Review 重建
+    """
+    def setUp(self):
+        self.passenger_user = Account.objects.create_user(phone='13600007777', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        self.passenger = Passenger.objects.create(account=self.passenger_user, nickname='乘客', rating=5.0)
+        self.driver_user = Account.objects.create_user(phone='13500007777', password='DriverPassword123')
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+
+    def order(self):
+        trip_request = TripRequest.objects.create(
+            account=self.passenger_user, trip_type='打车', status='completed',
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=timezone.now()
+        )
+        return TripOrder.objects.create(trip_request=trip_request, driver=self.driver, payment_status='paid')
+
+    def review(self, user, url, order, rating):
+        self.client.force_authenticate(user=user)
+        response = self.client.post(url, {'order': order.pk, 'rating': rating, 'comment': '好'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+    def test_reviews_update_profiles(self):
+        self.review(self.passenger_user, '/api/passenger/review/', self.order(), '4.0')
+        self.review(self.passenger_user, '/api/passenger/review/', self.order(), '4.5')
+        self.driver.refresh_from_db()
+        self.assertEqual((self.driver.rating_sum, self.driver.rating_count, self.driver.rating),
+                         (Decimal('8.5'), 2, Decimal('4.3')))
+
+        # 司机评价的是订单的乘客，reviewee 由订单确定
+        self.review(self.driver_user, '/api/driver/review/', self.order(), '3.0')
+        self.passenger.refresh_from_db()
+        self.assertEqual((self.passenger.rating_sum, self.passenger.rating_count, self.passenger.rating),
+                         (Decimal('3.0'), 1, Decimal('3.0')))
+        self.assertEqual(Review.objects.get(reviewer=self.driver_user).reviewee, self.passenger_user)
+
+    def test_incremental_rating_rounds_like_rebuild(self):
+        # 8.7 / 2 = 4.35：按浮点数舍入会得到 4.3，rating_average() 四舍五入为 4.4
+        self.review(self.passenger_user, '/api/passenger/review/', self.order(), '4.0')
+        self.review(self.passenger_user, '/api/passenger/review/', self.order(), '4.7')
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.rating, Decimal('4.4'))
+        self.assertEqual(list(ratings.rebuild()), [(2, 0)])
+        # 日汇总的平均评分使用同一舍入
+        self.assertEqual(DriverDailyStats.objects.get(driver=self.driver).average_rating, Decimal('4.4'))
+        self.assertEqual(rollups.summarize(DriverDailyStats.objects.filter(driver=self.driver))['average_rating'],
+                         Decimal('4.4'))
+
+    def test_rebuild_ratings(self):
+        order = self.order()
+        Review.objects.create(order=order, reviewer=self.passenger_user, reviewee=self.driver_user, rating=4, comment='')
+        Review.objects.create(order=self.order(), reviewer=self.passenger_user, reviewee=self.driver_user, rating=3,
+                              comment='')
+        Review.objects.create(order=order, reviewer=self.driver_user, reviewee=self.passenger_user, rating=5, comment='')
+
+        # 每个账号区间：Review 聚合 + 两种资料 + 两次 bulk_update（有修正时）
+        with self.assertNumQueries(1 + 5):
+            self.assertEqual(list(ratings.rebuild(chunk_size=1000)), [(2, 2)])
+        self.driver.refresh_from_db()
+        self.passenger.refresh_from_db()
+        self.assertEqual((self.driver.rating_sum, self.driver.rating_count, self.driver.rating),
+                         (Decimal('7.0'), 2, Decimal('3.5')))
+        self.assertEqual((self.passenger.rating_sum, self.passenger.rating_count, self.passenger.rating),
+                         (Decimal('5.0'), 1, Decimal('5.0')))
+
+        out = io.StringIO()
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn('修正 0 份', out.getvalue())
+
+
+class DriverDailyStatsTest(APITestCase):
+    """
+    司机日汇总随订单支付状态与评价增量维护，可按日期区间重建，收入接口只读取汇总表
+    """
+    def setUp(self):
+        self.passenger_user = Account.objects.create_user(phone='13600008888', password='PassengerPassword')
+        self.driver_user = Account.objects.create_user(phone='13500008888', password='DriverPassword123')
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.today = timezone.localdate()
+
+    def order(self, end_time, actual_price, discount_amount=None, payment_status='pending'):
+        trip_request = TripRequest.objects.create(
+            account=self.passenger_user, trip_type='打车', status='completed',
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=end_time
+        )
+        return TripOrder.objects.create(trip_request=trip_request, driver=self.driver, end_time=end_time,
+                                        actual_price=actual_price, discount_amount=discount_amount,
+                                        payment_status=payment_status)
+
+    def stats(self):
+        return {row.day: (row.trip_count, row.revenue, row.discount, row.rating_sum, row.rating_count)
+                for row in DriverDailyStats.objects.filter(driver=self.driver)}
+
+    def test_incremental_updates_match_rebuild(self):
+        now = timezone.now()
+        yesterday = now - timedelta(days=1)
+        first = self.order(now, Decimal('30.00'), Decimal('5.00'))
+        self.assertEqual(self.stats(), {})
+
+        first.payment_status = 'paid'
+        first.save()
+        self.order(now, Decimal('20.00'), payment_status='paid')
+        self.order(yesterday, Decimal('10.00'), payment_status='paid')
+        # 从数据库重新加载（含只加载部分字段）后修改
+        refunded = TripOrder.objects.only('id', 'payment_status').get(pk=first.pk)
+        refunded.payment_status = 'refunded'
+        refunded.save(update_fields=['payment_status'])
+        moved = TripOrder.objects.get(pk=first.pk)
+        moved.payment_status = 'paid'
+        moved.end_time = yesterday
+        moved.save()
+
+        Review.objects.create(order=moved, reviewer=self.passenger_user, reviewee=self.driver_user, rating=4,
+                              comment='')
+        ratings.record_review(Review.objects.select_related('order__driver').get(order=moved))
+
+        incremental = self.stats()
+        self.assertEqual(incremental, {
+            timezone.localdate(now): (1, Decimal('20.00'), Decimal('0.00'), Decimal('0.0'), 0),
+            timezone.localdate(yesterday): (2, Decimal('40.00'), Decimal('5.00'), Decimal('4.0'), 1),
+        })
+        DriverDailyStats.objects.update(trip_count=0)
+        call_command('rebuild_driver_stats', '--start', str(self.today - timedelta(days=3)), stdout=io.StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+        TripOrder.objects.filter(pk=moved.pk).first().delete()
+        self.assertEqual(self.stats()[timezone.localdate(yesterday)][:3], (1, Decimal('10.00'), Decimal('0.00')))
+
+    def test_earnings_endpoint_reads_rollup(self):
+        for offset in range(60):
+            DriverDailyStats.objects.create(driver=self.driver, day=self.today - timedelta(days=offset), trip_count=2,
+                                            revenue=Decimal('50.00'), discount=Decimal('5.00'),
+                                            rating_sum=Decimal('9.0'), rating_count=2)
+        self.client.force_authenticate(user=self.driver_user)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/driver/earnings/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['days']), 30)
+        self.assertEqual(response.data['total'], {'trip_count': 60, 'revenue': Decimal('1500.00'),
+                                                  'discount': Decimal('150.00'), 'average_rating': Decimal('4.5')})
+        self.assertEqual(self.client.get('/api/driver/earnings/', {'start': '2020-01-01'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+
+class LargeTableAdminTest(TestCase):
+    """
+    大表后台列表：关联对象随列表查出（查询数与行数无关），无筛选时总行数使用估算值
+    """
+    def setUp(self):
+        self.admin_user = Account.objects.create_superuser(phone='19900009999', password='AdminPassword')
+        self.client.force_login(self.admin_user)
+        self.driver = Driver.objects.create(account=self.admin_user, rating=5.0)
+        self.coupon = Coupon.objects.create(name='券', description='', discount_type='fixed amount', discount_value=5,
+                                            min_spend=0, max_discount=0, valid_from=timezone.now(),
+                                            valid_until=timezone.now(), created_by=self.admin_user)
+        self.ride = Ride.objects.create(account=self.admin_user, start_location='A', end_location='B',
+                                        departure_time=timezone.now(), total_seats=4, available_seats=4)
+        self.created = 0
+
+    def add_rows(self, count):
+        for i in range(self.created, self.created + count):
+            user = Account.objects.create(phone=f'1370000{i:04d}', password='!')
+            trip_request = TripRequest.objects.create(
+                account=user, trip_type='打车', status='completed', pickup_address='A', pickup_location={},
+                dropoff_address='B', dropoff_location={}, request_time=timezone.now())
+            order = TripOrder.objects.create(trip_request=trip_request, driver=self.driver, payment_status='paid')
+            UserCoupon.objects.create(account=user, coupon=self.coupon, status='active')
+            RideMembership.objects.create(ride=self.ride, account=user, trip_order=order)
+            Message.objects.create(sender=user, receiver=self.admin_user, content='你好')
+            Review.objects.create(order=order, reviewer=user, reviewee=self.admin_user, rating=5, comment='')
+        self.created += count
+
+    def test_changelists_have_constant_query_counts(self):
+        models = ('triporder', 'triprequest', 'usercoupon', 'message', 'review', 'ridemembership',
+                  'archivedtriporder', 'archivedtriprequest')
+        # 每个列表页都分别在 1 行与 30 行时各请求一次
+        counts = {model: [] for model in models}
+        for total in (1, 30):
+            self.add_rows(total - self.created)
+            for model in models:
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(f'/admin/carpool/{model}/')
+                self.assertEqual(response.status_code, 200)
+                counts[model].append(len(context.captured_queries))
+        for model, (one, many) in counts.items():
+            self.assertEqual(one, many, model)
+
+    def test_estimated_count(self):
+        self.add_rows(5)
+        TripOrder.objects.filter(pk=TripOrder.objects.order_by('id').first().pk).delete()
+        with mock.patch('apps.carpool.pagination.ESTIMATED_COUNT_THRESHOLD', 1):
+            # 无筛选：最大 rowid（删除的行仍计入）；有筛选：精确计数
+            self.assertEqual(EstimatedCountPaginator(TripOrder.objects.order_by('-id'), 10).count,
+                             TripOrder.objects.order_by('-id').first().pk)
+            self.assertEqual(EstimatedCountPaginator(TripOrder.objects.filter(payment_status='paid'), 10).count, 4)
+        self.assertEqual(EstimatedCountPaginator(TripOrder.objects.all(), 10).count, 4)
+
+    def test_export_orders(self):
+        self.add_rows(7)
+        orders = TripOrder.objects.all()
+        # 小批量，验证跨批次拼接；每批查询数固定
+        with CaptureQueriesContext(connection) as context:
+            csv_data = b''.join(exports.stream(orders, 'csv', chunk_size=3)).decode('utf-8-sig')
+        self.assertEqual(len(context.captured_queries), 4)
+        lines = csv_data.splitlines()
+        self.assertEqual(lines[0].split(','), exports.HEADERS)
+        self.assertEqual(len(lines), 8)
+        self.assertIn('13700000000', lines[1])
+
+        columnar = b''.join(exports.stream(orders, 'columnar', chunk_size=3))
+        rows = list(exports.read_columnar(io.BytesIO(columnar)))
+        self.assertEqual([row['id'] for row in rows], list(orders.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[0]['passenger_phone'], '13700000000')
+        self.assertEqual(rows[0]['payment_status'], 'paid')
+
+        response = self.client.post('/admin/carpool/triporder/', {
+            'action': 'export_csv', 'select_across': '1', '_selected_action': list(orders.values_list('id', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8-sig').count('\n'), 8)
+
+    def test_export_escapes_formulas_and_counts_rows(self):
+        self.add_rows(3)
+        TripRequest.objects.filter(account__phone='13700000000').update(
+            pickup_address='=HYPERLINK("http://x")', dropoff_address='-1+2')
+        TripOrder.objects.update(actual_price=Decimal('-1.50'))
+        rows = list(csv.reader(io.StringIO(
+            b''.join(exports.stream(TripOrder.objects.all(), 'csv')).decode('utf-8-sig'))))
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row['pickup_address'], '\'=HYPERLINK("http://x")')
+        self.assertEqual(row['dropoff_address'], "'-1+2")
+        # 数值列不转义
+        self.assertEqual(row['actual_price'], '-1.50')
+
+        with tempfile.TemporaryDirectory() as directory:
+            err = io.StringIO()
+            with CaptureQueriesContext(connection) as context:
+                call_command('export_orders', '--month', f'{timezone.localdate():%Y-%m}',
+                             '--output', os.path.join(directory, 'orders.csv'), stderr=err)
+        self.assertIn('3 行', err.getvalue())
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+
+        # 未指定 --output 时经由 self.stdout 输出，call_command 可以捕获
+        out = io.StringIO()
+        call_command('export_orders', '--month', f'{timezone.localdate():%Y-%m}', stdout=out, stderr=io.StringIO())
+        self.assertEqual(len(list(csv.reader(io.StringIO(out.getvalue().lstrip('\ufeff'))))), 4)
+        with self.assertRaises(CommandError):
+            call_command('export_orders', '--month', f'{timezone.localdate():%Y-%m}', '--format', 'columnar',
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class TripArchiveTest(APITestCase):
+    """
+    超过期限的终态请求连同订单移入归档表，历史接口合并读取两张表，汇总与评分不受影响
+    """
+    def setUp(self):
+        self.passenger_user = Account.objects.create_user(phone='13600008888', password='PassengerPassword')
+        self.passenger_user.is_passenger = True
+        self.passenger_user.save()
+        Passenger.objects.create(account=self.passenger_user, nickname='乘客', rating=5.0)
+        self.driver_user = Account.objects.create_user(phone='13500008888', password='DriverPassword123')
+        self.driver_user.is_driver = True
+        self.driver_user.save()
+        self.driver = Driver.objects.create(account=self.driver_user, rating=5.0)
+        self.now = timezone.now()
+
+    def order(self, days_ago, request_status='completed', payment_status='paid'):
+        when = self.now - timedelta(days=days_ago)
+        trip_request = TripRequest.objects.create(
+            account=self.passenger_user, trip_type='打车', status=request_status,
+            pickup_address='A', pickup_location={'lat': 1, 'lng': 1},
+            dropoff_address='B', dropoff_location={'lat': 2, 'lng': 2}, request_time=when)
+        order = TripOrder.objects.create(trip_request=trip_request, driver=self.driver, end_time=when,
+                                         actual_price=Decimal('10.00'), payment_status=payment_status)
+        TripOrder.objects.filter(pk=order.pk).update(created_at=when)
+        return order
+
+    def stats(self):
+        return sorted(DriverDailyStats.objects.values_list('day', 'trip_count', 'revenue', 'rating_sum', 'rating_count'))
+
+    def test_archive_moves_terminal_trips_and_history_reads_both(self):
+        old = [self.order(days) for days in (200, 150, 120)]
+        kept = [self.order(100, request_status='in_progress', payment_status='pending'),
+                self.order(95, payment_status='pending'), self.order(5)]
+        review = Review.objects.create(order=old[0], reviewer=self.passenger_user, reviewee=self.driver_user,
+                                       rating=4, comment='')
+        ratings.record_review(Review.objects.select_related('order__driver').get(pk=review.pk))
+        RoutePoint.objects.create(order=old[1], lat=1, lng=1, recorded_at=self.now)
+        ride = Ride.objects.create(account=self.driver_user, start_location='起点', end_location='终点',
+                                   departure_time=self.now, total_seats=4, available_seats=3)
+        RideMembership.objects.create(ride=ride, account=self.passenger_user, trip_order=old[2])
+        stats_before = self.stats()
+        orders_before = list(TripOrder.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        requests_before = list(TripRequest.objects.order_by('-request_time', '-id').values_list('id', flat=True))
+
+        # 第二批中还有待支付订单的请求留在热表
+        self.assertEqual(list(archive.archive_trips(now=self.now, chunk_size=2)), [(2, 2), (1, 1)])
+        self.assertEqual(set(TripOrder.objects.values_list('id', flat=True)), {order.id for order in kept})
+        self.assertEqual(set(ArchivedTripOrder.objects.values_list('id', flat=True)), {order.id for order in old})
+        archived = ArchivedTripOrder.objects.get(pk=old[2].pk)
+        self.assertEqual((archived.ride_id, archived.created_at, archived.trip_request.account_id),
+                         (ride.id, self.now - timedelta(days=120), self.passenger_user.id))
+        # 没有收到 final 的订单，轨迹点在归档时写入 route_data
+        self.assertEqual(ArchivedTripOrder.objects.get(pk=old[1].pk).route, [[1.0, 1.0]])
+        self.assertFalse(RoutePoint.objects.exists())
+        self.assertFalse(RideMembership.objects.exists())
+        # 评价保留，汇总不变，重建结果与归档前一致
+        archived_review = Review.objects.get(pk=review.pk)
+        self.assertIsInstance(archived_review.trip_order, ArchivedTripOrder)
+        self.assertEqual(archived_review.trip_order.driver, self.driver)
+        self.assertEqual(self.stats(), stats_before)
+        # 默认起始日期包含归档表中最早的订单
+        DriverDailyStats.objects.all().delete()
+        call_command('rebuild_driver_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(), stats_before)
+        Driver.objects.update(rating_sum=0, rating_count=0)
+        list(ratings.rebuild())
+        self.assertEqual(Driver.objects.values_list('rating_sum', 'rating_count').get(), (Decimal('4.0'), 1))
+
+        # 历史接口按游标合并两张表，顺序与归档前相同
+        for url, user, expected in (
+            ('/api/passenger/orders/', self.passenger_user, orders_before),
+            ('/api/driver/orders/', self.driver_user, orders_before),
+            ('/api/passenger/trip/status/', self.passenger_user, requests_before),
+        ):
+            self.client.force_authenticate(user=user)
+            ids, cursor = [], None
+            while True:
+                with self.assertNumQueries(2):
+                    response = self.client.get(url, dict({'page_size': 2}, **({'cursor': cursor} if cursor else {})))
+                ids.extend(item['id'] for item in response.data)
+                cursor = response.get('X-Next-Cursor')
+                if not cursor:
+                    break
+            self.assertEqual(ids, expected, url)
+        self.assertEqual(response.data[-1]['status'], 'completed')
@@ -0,0 +1,176 @@
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RoutePoint, TripOrder
+
+# 司机定位上报：每个订单一个内存环形缓冲区，达到数量阈值、超过时间间隔或行程结束时批量写入 RoutePoint，
+# 不在每次上报时改写 TripOrder.route。缓冲区在进程内，每个 worker 各自维护：
+# 停止上报的订单写入剩余点后移出内存；进程退出时写入所有缓冲区；
+# 行程结束（final）后其他 worker 才写入的点会重新生成 TripOrder.route
+
+# 缓冲区累积到该数量时写入数据库
+FLUSH_SIZE = 500
+# 距上次写入超过该秒数时写入数据库
+FLUSH_INTERVAL = 5.0
+# 环形缓冲区容量，写入失败时最多保留这么多点，更早的点被丢弃
+RING_CAPACITY = 5000
+# 单次上报允许的最大点数
+MAX_POINTS_PER_BATCH = 1000
+# 超过该秒数没有上报的订单，写入剩余点后移出内存
+IDLE_TIMEOUT = 60.0
+
+
+class RouteBuffer:
+    def __init__(self, order_id, account_id):
+        self.order_id = order_id
+        self.account_id = account_id  # 已校验过归属的司机账号，避免每次上报都查库
+        self.points = deque(maxlen=RING_CAPACITY)
+        self.lock = threading.Lock()
+        self.last_flush = self.last_seen = time.monotonic()
+        self.closed = False  # 已移出 _buffers，之后追加的点立即写入
+
+    def drain(self):
+        with self.lock:
+            points = list(self.points)
+            self.points.clear()
+            self.last_flush = time.monotonic()
+        return points
+
+
+_buffers = {}
+_registry_lock = threading.Lock()
+_last_sweep = time.monotonic()
+
+
+def parse_points(raw_points):
+    """
+    将 [[lat, lng, 时间戳(秒)], ...] 解析为 (lat, lng, datetime) 列表，格式错误时抛出 ValueError
+    """
+    if not isinstance(raw_points, list) or not 0 < len(raw_points) <= MAX_POINTS_PER_BATCH:
+        raise ValueError(f'points 必须是包含 1~{MAX_POINTS_PER_BATCH} 个点的列表')
+    parsed = []
+    for point in raw_points:
+        if not isinstance(point, (list, tuple)) or len(point) != 3:
+            raise ValueError('每个点必须是 [lat, lng, 时间戳] 数组')
+        lat, lng, ts = float(point[0]), float(point[1]), float(point[2])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('坐标超出范围')
+        parsed.append((lat, lng, datetime.fromtimestamp(ts, tz=dt_timezone.utc)))
+    return parsed
+
+
+def get_buffer(order_id, account_id):
+    """返回订单的缓冲区；订单不存在或不属于该司机时返回 None"""
+    buffer = _buffers.get(order_id)
+    if buffer is None:
+        if not TripOrder.objects.filter(pk=order_id, driver__account_id=account_id).exists():
+            return None
+        with _registry_lock:
+            buffer = _buffers.setdefault(order_id, RouteBuffer(order_id, account_id))
+    return buffer if buffer.account_id == account_id else None
+
+
+def write_points(order_id, points):
+    RoutePoint.objects.bulk_create([
+        RoutePoint(order_id=order_id, lat=lat, lng=lng, recorded_at=recorded_at)
+        for lat, lng, recorded_at in points
+    ])
+
+
+def flush(buffer):
+    points = buffer.drain()
+    if not points:
+        return 0
+    try:
+        write_points(buffer.order_id, points)
+    except Exception:
+        # 写入失败时放回缓冲区，等待下次重试（超出容量的旧点会被丢弃）
+        with buffer.lock:
+            buffer.points = deque(points + list(buffer.points), maxlen=RING_CAPACITY)
+        raise
+    # 行程已经结束（其他 worker 收到了 final）：这些点没有包含在已保存的路线中，重新生成
+    if TripOrder.objects.filter(pk=buffer.order_id, route_data__isnull=False).exists():
+        store_route(buffer.order_id)
+    return len(points)
+
+
+def add_points(buffer, points):
+    """追加定位点，必要时触发写入，返回本次写入数据库的点数"""
+    with buffer.lock:
+        buffer.points.extend(points)
+        buffer.last_seen = time.monotonic()
+        due = (buffer.closed or len(buffer.points) >= FLUSH_SIZE
+               or buffer.last_seen - buffer.last_flush >= FLUSH_INTERVAL)
+    written = flush(buffer) if due else 0
+    sweep_idle()
+    return written
+
+
+def evict(buffer):
+    """把缓冲区移出 _buffers；之后仍持有它的请求追加的点会立即写入"""
+    with _registry_lock:
+        if _buffers.get(buffer.order_id) is buffer:
+            del _buffers[buffer.order_id]
+    with buffer.lock:
+        buffer.closed = True
+
+
+def sweep_idle():
+    """写入已经停止上报的订单的剩余点，长时间没有上报的订单移出内存（每个间隔最多执行一次）"""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < FLUSH_INTERVAL:
+        return
+    _last_sweep = now
+    for buffer in list(_buffers.values()):
+        try:
+            if buffer.points and now - buffer.last_flush >= FLUSH_INTERVAL:
+                flush(buffer)
+            if now - buffer.last_seen >= IDLE_TIMEOUT:
+                evict(buffer)
+                flush(buffer)
+        except Exception:
+            # 点已放回缓冲区，不影响当前上报请求
+            pass
+
+
+def store_route(order_id):
+    """从已写入的 RoutePoint 生成完整轨迹，写入 TripOrder.route，返回点数"""
+    route = [
+        [lat, lng] for lat, lng in
+        RoutePoint.objects.filter(order_id=order_id).order_by('recorded_at', 'id').values_list('lat', 'lng')
+    ]
+    with transaction.atomic():
+        order = TripOrder.objects.select_for_update().get(pk=order_id)
+        order.route = route
+        if order.end_time is None:
+            order.end_time = timezone.now()
+        order.save(update_fields=['route_data', 'end_time', 'last_modified_at'])
+    return len(route)
+
+
+def finish(buffer):
+    """
+    行程结束：写入本进程中的剩余点，再用数据库中该订单的全部点（包括其他 worker 写入的）生成路线
+    """
+    evict(buffer)
+    flush(buffer)
+    return store_route(buffer.order_id)
+
+
+def flush_all():
+    for buffer in list(_buffers.values()):
+        try:
+            flush(buffer)
+        except Exception:
+            pass
+
+
+# 进程正常退出（重启、部署）时写入所有缓冲区中的点
+atexit.register(flush_all)
@@ -1,21 +1,35 @@
+import hashlib
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
 from django.utils import timezone
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.contrib.auth import authenticate
 
 from ext.permissions import IsPassenger, IsDriver, IsAdvertiser
-from .models import Passenger, Driver, Advertiser, TripRequest, TripOrder, UserCoupon, Coupon, Ride
+from . import coupons, events, geo, pricing, ratings, rollups, seats, surge, tracking
+from .caching import open_rides_cache
+from .idempotency import idempotent
+from .pagination import KeysetPagination
+from .models import Passenger, Driver, Advertiser, TripRequest, TripOrder, UserCoupon, Ride, RideMembership, \
+    DriverDailyStats, ArchivedTripRequest, ArchivedTripOrder
 from .serializers import RegisterSerializer, PassengerSerializer, DriverSerializer, AdvertiserSerializer, \
     IdentityVerificationSerializer, VehicleSerializer, TripRequestSerializer, TripOrderSerializer, ReviewSerializer, \
-    UserCouponSerializer, CouponSerializer, TripSerializer, RideListSerializer
+    UserCouponSerializer, TripSerializer, TripQuoteSerializer, ArchivedTripRequestSerializer, \
+    ArchivedTripOrderSerializer, serialize_rows, ride_list_values, trip_request_values
 
 
 # Create your views here.
 
+# 历史订单同时读取热表与归档表
+ORDER_SERIALIZERS = {TripOrder: TripOrderSerializer, ArchivedTripOrder: ArchivedTripOrderSerializer}
+
 
 # 注册视图
 class RegisterView(APIView):
@@ -133,7 +147,9 @@ class DriverInfoView(APIView):
 
     def get(self, request):
         try:
-            driver = Driver.objects.get(account=request.user)
+            driver = Driver.objects.select_related(
+                'account__identity_verification', 'account__vehicle'
+            ).prefetch_related('services').get(account=request.user)
             serializer = DriverSerializer(driver)
             return Response(serializer.data)
         except Driver.DoesNotExist:
@@ -247,34 +263,84 @@ class VehicleView(APIView):
 class SubmitTripRequestView(APIView):
     permission_classes = [IsPassenger]
 
+    @idempotent
     def post(self, request):
         serializer = TripRequestSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(account=request.user, request_time=timezone.now())
+            estimated_price = pricing.estimate_price(
+                serializer.validated_data.get('trip_type'),
+                serializer.validated_data.get('pickup_location'),
+                serializer.validated_data.get('dropoff_location'),
+                when=serializer.validated_data.get('scheduled_time'),
+            )
+            with transaction.atomic():
+                trip_request = serializer.save(account=request.user, request_time=timezone.now(),
+                                               estimated_price=estimated_price)
+                surge.record_demand(trip_request)
+                events.trip_request_created(trip_request)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# 批量报价（比价页面）：对每条行程返回所有服务类型的预估价格
+class TripQuoteView(APIView):
+    permission_classes = [IsPassenger]
+
+    MAX_TRIPS = 100
+
+    def post(self, request):
+        trips = request.data.get('trips') if isinstance(request.data, dict) else None
+        if not isinstance(trips, list) or not 0 < len(trips) <= self.MAX_TRIPS:
+            return Response({"detail": f"trips 必须是包含 1~{self.MAX_TRIPS} 条行程的列表"}, status=400)
+
+        serializer = TripQuoteSerializer(data=trips, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        services, distance, duration, multipliers, cents = pricing.quote_trips(
+            [geo.parse_point(trip['pickup_location']) for trip in serializer.validated_data],
+            [geo.parse_point(trip['dropoff_location']) for trip in serializer.validated_data],
+        )
+        return Response([
+            {
+                "distance_km": round(float(distance[i]), 2),
+                "duration_min": round(float(duration[i]), 1),
+                "surge": multipliers[i],
+                "quotes": {name: str(pricing.cents_to_decimal(cents[i, j])) for j, name in enumerate(services.names)},
+            }
+            for i in range(len(distance))
+        ])
+
+
 # 查看打车请求状态
 class TripRequestStatusView(APIView):
     permission_classes = [IsPassenger]
 
     def get(self, request):
-        requests = TripRequest.objects.filter(account=request.user)
-        serializer = TripRequestSerializer(requests, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(('-request_time', '-id'))
+        requests = paginator.paginate_querysets([
+            TripRequest.objects.filter(account=request.user),
+            ArchivedTripRequest.objects.filter(account=request.user),
+        ], request)
+        return paginator.get_paginated_response(serialize_rows(
+            requests, {TripRequest: TripRequestSerializer, ArchivedTripRequest: ArchivedTripRequestSerializer}))
 
 
 # 取消打车请求
 class CancelTripRequestView(APIView):
     permission_classes = [IsPassenger]
 
+    @idempotent
     def post(self, request, pk):
         try:
             trip_request = TripRequest.objects.get(id=pk, account=request.user)
             if trip_request.status not in ['completed', 'cancelled']:
-                trip_request.status = 'cancelled'
-                trip_request.save()
+                with transaction.atomic():
+                    if trip_request.status == 'pending':
+                        surge.record_demand(trip_request, -1)
+                    trip_request.status = 'cancelled'
+                    trip_request.save()
+                    events.trip_request_status(trip_request.pk, trip_request.account_id, 'cancelled')
                 return Response({'detail': '请求已取消'})
             return Response({'detail': '当前状态不可取消'}, status=status.HTTP_400_BAD_REQUEST)
         except TripRequest.DoesNotExist:
@@ -286,9 +352,24 @@ class ListOpenRidesView(APIView):
     permission_classes = [IsPassenger]
 
     def get(self, request):
-        open_rides = Ride.objects.filter(status='open').order_by('departure_time')
-        serializer = RideListSerializer(open_rides, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(('departure_time', 'id'))
+        # 所有乘客看到的列表相同：按 (版本, 游标, 每页数量) 缓存分页结果，行程变化时版本号递增
+        cursor = request.query_params.get(paginator.cursor_query_param, '')
+        cache_key = open_rides_cache.key(
+            f'{hashlib.md5(cursor.encode()).hexdigest()}:{paginator.get_page_size(request)}')
+        cached = open_rides_cache.get(cache_key)
+        if cached is None:
+            # 只读列表走 values_list 快速路径，输出与 RideListSerializer 完全一致
+            open_rides = paginator.paginate_queryset(
+                ride_list_values.values(Ride.objects.filter(status='open')), request)
+            data = ride_list_values.serialize(open_rides)
+            open_rides_cache.set(cache_key, (data, paginator.next_cursor))
+        else:
+            data, next_cursor = cached
+            paginator.resume(request, next_cursor)
+        response = paginator.get_paginated_response(data)
+        response['X-Cache'] = 'MISS' if cached is None else 'HIT'
+        return response
   
 # 加入行程  
 class JoinRideView(APIView):
@@ -298,60 +379,60 @@ class JoinRideView(APIView):
     """
     permission_classes = [IsPassenger]
 
+    @idempotent
     def post(self, request, ride_id):
+        # 幂等检查：(ride, account) 唯一索引上的一次查找
+        if RideMembership.objects.filter(ride_id=ride_id, account=request.user).exists():
+            return Response({"detail": "成功加入行程！"}, status=status.HTTP_200_OK)
+
         try:
             ride = Ride.objects.get(pk=ride_id)
         except Ride.DoesNotExist:
             return Response({"detail": "该行程不存在。"}, status=status.HTTP_404_NOT_FOUND)
 
-        if TripOrder.objects.filter(
-            trip_request__account=request.user,
-            driver__account=ride.account,
-            trip_request__pickup_location=ride.start_location,
-            trip_request__dropoff_location=ride.end_location,
-            start_time=ride.departure_time
-        ).exists():
-            return Response({"detail": "成功加入行程！"}, status=status.HTTP_200_OK)
+        if ride.status != 'open':
+            return Response({"detail": "该行程当前不可加入。"}, status=status.HTTP_400_BAD_REQUEST)
+        if ride.account_id == request.user.id:
+            return Response({"detail": "您不能加入自己的行程。"}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            ride = Ride.objects.select_for_update().get(pk=ride_id)
-
-            if ride.status != 'open':
-                return Response({"detail": "该行程当前不可加入。"}, status=status.HTTP_400_BAD_REQUEST)
-            if ride.available_seats <= 0:
-                return Response({"detail": "该行程已满员。"}, status=status.HTTP_400_BAD_REQUEST)
-            if ride.account == request.user:
-                return Response({"detail": "您不能加入自己的行程。"}, status=status.HTTP_400_BAD_REQUEST)
-
-            ride.available_seats -= 1
-            if ride.available_seats == 0:
-                ride.status = 'full'
-            ride.save()
-
-            # --- 修正点 ---
-            # 在创建 TripRequest 时，添加 request_time 字段
-            trip_request = TripRequest.objects.create(
-                account=request.user,
-                trip_type='拼车',
-                pickup_location=ride.start_location,
-                dropoff_location=ride.end_location,
-                scheduled_time=ride.departure_time,
-                request_time=timezone.now(),  # <-- 新增此行，记录当前请求时间
-                seats_needed=1,
-                status='matched'
-            )
-            
-            try:
-                driver_profile = Driver.objects.get(account=ride.account)
-            except Driver.DoesNotExist:
-                return Response({"detail": "找不到该行程的司机信息。"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            TripOrder.objects.create(
-                trip_request=trip_request,
-                driver=driver_profile,
-                payment_status='pending',
-                start_time=ride.departure_time
-            )
+        try:
+            driver_profile = Driver.objects.get(account_id=ride.account_id)
+        except Driver.DoesNotExist:
+            return Response({"detail": "找不到该行程的司机信息。"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            with transaction.atomic():
+                # 条件扣减座位，无需行锁；失败说明行程已满或状态已变化
+                if not seats.reserve_seats(ride.pk, 1):
+                    ride.refresh_from_db(fields=['status', 'available_seats'])
+                    if ride.status == 'full' or ride.available_seats <= 0:
+                        return Response({"detail": "该行程已满员。"}, status=status.HTTP_400_BAD_REQUEST)
+                    return Response({"detail": "该行程当前不可加入。"}, status=status.HTTP_400_BAD_REQUEST)
+
+                # --- 修正点 ---
+                # 在创建 TripRequest 时，添加 request_time 字段
+                trip_request = TripRequest.objects.create(
+                    account=request.user,
+                    trip_type='拼车',
+                    pickup_location=ride.start_location,
+                    dropoff_location=ride.end_location,
+                    scheduled_time=ride.departure_time,
+                    request_time=timezone.now(),  # <-- 新增此行，记录当前请求时间
+                    seats_needed=1,
+                    status='matched'
+                )
+
+                trip_order = TripOrder.objects.create(
+                    trip_request=trip_request,
+                    driver=driver_profile,
+                    payment_status='pending',
+                    start_time=ride.departure_time
+                )
+                RideMembership.objects.create(ride=ride, account=request.user, trip_order=trip_order)
+                surge.record_supply(ride, -1)
+        except IntegrityError:
+            # 并发的重复加入被唯一约束拒绝，整个事务（包括座位扣减）已回滚
+            return Response({"detail": "成功加入行程！"}, status=status.HTTP_200_OK)
 
         return Response({"detail": "成功加入行程！"}, status=status.HTTP_200_OK)
 
@@ -361,9 +442,12 @@ class PassengerOrderHistoryView(APIView):
     permission_classes = [IsPassenger]
 
     def get(self, request):
-        orders = TripOrder.objects.filter(trip_request__account=request.user)
-        serializer = TripOrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(('-created_at', '-id'))
+        orders = paginator.paginate_querysets([
+            TripOrder.objects.filter(passenger_account=request.user),
+            ArchivedTripOrder.objects.filter(passenger_account=request.user),
+        ], request)
+        return paginator.get_paginated_response(serialize_rows(orders, ORDER_SERIALIZERS, {'request': request}))
 
 
 # 评价司机
@@ -374,7 +458,9 @@ class SubmitDriverReviewView(APIView):
         serializer = ReviewSerializer(data=request.data, context={'request': request}) # 正确的方式
         if serializer.is_valid():
             # 此处的 reviewer 也可以在序列化器内部自动设置，但现在这样写也没问题
-            serializer.save(reviewer=request.user)
+            with transaction.atomic():
+                review = serializer.save(reviewer=request.user)
+                ratings.record_review(review)
             return Response({'detail': '评价已提交'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -384,15 +470,15 @@ class PassengerCouponsView(APIView):
     permission_classes = [IsPassenger]
 
     def get(self, request):
-        user_coupons = UserCoupon.objects.filter(account=request.user)
-        now = timezone.now()
-        active_platform_coupons = Coupon.objects.filter(valid_from__lte=now,
-                                                        valid_until__gte=now)
+        # 分页作用于 my_coupons（随时间增长）；available 是当前有效的平台优惠券，数量有限
+        paginator = KeysetPagination(('-acquired_at', '-id'))
+        user_coupons = paginator.paginate_queryset(
+            UserCoupon.objects.select_related('coupon').filter(account=request.user), request)
         user_serializer = UserCouponSerializer(user_coupons, many=True)
-        coupon_serializer = CouponSerializer(active_platform_coupons, many=True)
-        return Response({
+        return paginator.get_paginated_response({
             'my_coupons': user_serializer.data,
-            'available': coupon_serializer.data
+            # 优惠券目录缓存在内存中，只有 my_coupons 需要查询数据库
+            'available': coupons.active_catalog()
         })
 
 
@@ -400,13 +486,18 @@ class PassengerCouponsView(APIView):
 class ReceiveCouponView(APIView):
     permission_classes = [IsPassenger]
 
+    @idempotent
     def post(self, request, coupon_id):
-        try:
-            coupon = Coupon.objects.get(id=coupon_id)
-            UserCoupon.objects.create(account=request.user, coupon=coupon, acquired_at=timezone.now(), status='active')
+        result = coupons.claim(request.user, coupon_id)
+        if result == coupons.CLAIMED:
             return Response({'detail': '领取成功'})
-        except Coupon.DoesNotExist:
+        if result == coupons.NOT_FOUND:
             return Response({'detail': '优惠券不存在'}, status=status.HTTP_404_NOT_FOUND)
+        if result == coupons.NOT_ACTIVE:
+            return Response({'detail': '优惠券不在有效期内'}, status=status.HTTP_400_BAD_REQUEST)
+        if result == coupons.SOLD_OUT:
+            return Response({'detail': '优惠券已领完'}, status=status.HTTP_409_CONFLICT)
+        return Response({'detail': '已达到每人限领数量'}, status=status.HTTP_409_CONFLICT)
 
 
 ##########################################################
@@ -418,50 +509,87 @@ class CreateTripView(generics.CreateAPIView):
     permission_classes = [IsDriver]
 
     def perform_create(self, serializer):
-        serializer.save(account=self.request.user)
+        with transaction.atomic():
+            ride = serializer.save(account=self.request.user)
+            surge.record_supply(ride, ride.available_seats)
 
 
 # 查看行程
 class MyTripsView(generics.ListAPIView):
     serializer_class = TripSerializer
     permission_classes = [IsDriver]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-departure_time', '-id')
 
     def get_queryset(self):
-        return Ride.objects.filter(account=self.request.user).order_by('-departure_time')
+        return Ride.objects.filter(account=self.request.user)
 
 
 # 取消行程
 class CancelRideView(APIView):
     permission_classes = [IsDriver]
 
+    @idempotent
     def post(self, request, pk):
-        try:
-            ride = Ride.objects.get(pk=pk, account=request.user)
-            if ride.status == 'open' and ride.available_seats == ride.total_seats:
-                # 只有在行程状态为 'open' 且可用座位数等于总座位数时(即没有乘客)才能取消
-                ride.status = 'canceled'
-                ride.save()
-                return Response({"detail": "Ride canceled."}, status=status.HTTP_200_OK)
-            return Response({"detail": "Ride cannot be canceled."}, status=status.HTTP_400_BAD_REQUEST)
-        except Ride.DoesNotExist:
+        ride = Ride.objects.filter(pk=pk, account=request.user).first()
+        if ride is None:
             return Response({"detail": "Ride not found."}, status=status.HTTP_404_NOT_FOUND)
+        # 只有在行程状态为 'open' 且可用座位数等于总座位数时(即没有乘客)才能取消。
+        # 条件写在 UPDATE 中：读取之后有乘客加入（reserve_seats 扣减了座位）时不会更新任何行
+        with transaction.atomic():
+            canceled = Ride.objects.filter(pk=pk, account=request.user, status='open',
+                                           available_seats=F('total_seats')).update(status='canceled')
+            if canceled:
+                surge.record_supply(ride, -ride.total_seats)
+                # update() 不触发 post_save，需要单独让开放行程列表的缓存失效
+                open_rides_cache.bump()
+                events.ride_seats_changed(ride.pk)
+        if not canceled:
+            return Response({"detail": "Ride cannot be canceled."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"detail": "Ride canceled."}, status=status.HTTP_200_OK)
 
 
 # 查看待处理的打车请求
 class ListPendingTripRequestsView(APIView):
     permission_classes = [IsDriver]
 
+    # near 模式下的默认 / 最大搜索半径（公里）
+    DEFAULT_RADIUS_KM = 5.0
+    MAX_RADIUS_KM = 50.0
+
     def get(self, request):
         # 只返回状态为 pending 的请求
-        requests = TripRequest.objects.filter(status='pending').order_by('-request_time')
-        serializer = TripRequestSerializer(requests, many=True)
-        return Response(serializer.data)
+        requests = TripRequest.objects.filter(status='pending')
+        paginator = KeysetPagination(('-request_time', '-id'))
+        predicate = None
+
+        near = request.query_params.get('near')
+        if near:
+            try:
+                lat, lng = (float(v) for v in near.split(','))
+                radius = float(request.query_params.get('radius', self.DEFAULT_RADIUS_KM))
+            except ValueError:
+                return Response({"detail": "near 参数格式应为 lat,lng，radius 为公里数"}, status=400)
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius <= self.MAX_RADIUS_KM:
+                return Response({"detail": "near 或 radius 参数超出范围"}, status=400)
+
+            # 只读取覆盖搜索圆的网格，再按实际距离精确过滤
+            cell_field, cells = geo.nearby_cell_filter(lat, lng, radius)
+            requests = requests.filter(**{f'{cell_field}__in': cells})
+
+            def predicate(trip_request):
+                return geo.haversine_km(lat, lng, *geo.parse_point(trip_request.pickup_location)) <= radius
+
+        # 只读列表走 values_list 快速路径，输出与 TripRequestSerializer 完全一致
+        requests = paginator.paginate_queryset(trip_request_values.values(requests), request, predicate=predicate)
+        return paginator.get_paginated_response(trip_request_values.serialize(requests))
 
 
 # 响应乘客请求 / 接单
 class AcceptTripRequestView(APIView):
     permission_classes = [IsDriver]
 
+    @idempotent
     def post(self, request, request_id):
         try:
             trip_request = TripRequest.objects.get(id=request_id, status='pending')
@@ -471,15 +599,18 @@ class AcceptTripRequestView(APIView):
         driver = Driver.objects.get(account=request.user)
 
         if trip_request.trip_type == '打车':
-            # 直接创建订单
-            TripOrder.objects.create(
-                trip_request=trip_request,
-                driver=driver,
-                payment_status='pending',
-                start_time=trip_request.scheduled_time or timezone.now()
-            )
-            trip_request.status = 'matched'
-            trip_request.save()
+            with transaction.atomic():
+                # 直接创建订单
+                TripOrder.objects.create(
+                    trip_request=trip_request,
+                    driver=driver,
+                    payment_status='pending',
+                    start_time=trip_request.scheduled_time or timezone.now()
+                )
+                trip_request.status = 'matched'
+                trip_request.save()
+                surge.record_demand(trip_request, -1)
+                events.trip_request_status(trip_request.pk, trip_request.account_id, 'matched', request.user.id)
             return Response({"detail": "已接打车订单"})
 
         elif trip_request.trip_type == '拼车':
@@ -498,23 +629,33 @@ class AcceptTripRequestView(APIView):
             if trip_request.seats_needed is None:
                 return Response({"detail": "缺少 seats_needed 信息"}, status=400)
 
-            if trip_request.seats_needed > matched_ride.available_seats:
-                return Response({"detail": "拼车请求剩余座位不足"}, status=400)
-
-            # 成功接单
-            TripOrder.objects.create(
-                trip_request=trip_request,
-                driver=driver,
-                payment_status='pending',
-                start_time=matched_ride.departure_time
-            )
-            trip_request.status = 'matched'
-            trip_request.save()
+            # 乘客已在该行程中时不重复接单
+            if RideMembership.objects.filter(ride=matched_ride, account_id=trip_request.account_id).exists():
+                return Response({"detail": "该乘客已在此行程中"}, status=400)
 
-            matched_ride.available_seats -= trip_request.seats_needed
-            if matched_ride.available_seats == 0:
-                matched_ride.status = 'full'
-            matched_ride.save()
+            try:
+                with transaction.atomic():
+                    # 条件扣减座位，并发接单时不会超卖
+                    if not seats.reserve_seats(matched_ride.pk, trip_request.seats_needed):
+                        return Response({"detail": "拼车请求剩余座位不足"}, status=400)
+
+                    # 成功接单
+                    trip_order = TripOrder.objects.create(
+                        trip_request=trip_request,
+                        driver=driver,
+                        payment_status='pending',
+                        start_time=matched_ride.departure_time
+                    )
+                    RideMembership.objects.create(
+                        ride=matched_ride, account_id=trip_request.account_id, trip_order=trip_order)
+                    trip_request.status = 'matched'
+                    trip_request.save()
+                    surge.record_demand(trip_request, -1)
+                    events.trip_request_status(trip_request.pk, trip_request.account_id, 'matched', request.user.id)
+                    surge.record_supply(matched_ride, -trip_request.seats_needed)
+            except IntegrityError:
+                # 并发的重复接单被 RideMembership 的唯一约束拒绝，整个事务（包括座位扣减）已回滚
+                return Response({"detail": "该乘客已在此行程中"}, status=status.HTTP_409_CONFLICT)
 
             return Response({"detail": "已接拼车订单"})
 
@@ -527,11 +668,12 @@ class TripPassengersView(APIView):
 
     def get(self, request, trip_id):
         try:
-            trip = TripOrder.objects.get(trip_request=trip_id, driver__account=request.user)
+            trip = TripOrder.objects.select_related('trip_request__account__passenger').get(
+                trip_request=trip_id, driver__account=request.user)
         except TripOrder.DoesNotExist:
             return Response({"detail": "行程不存在"}, status=404)
 
-        passenger = Passenger.objects.get(account=trip.trip_request.account)
+        passenger = trip.trip_request.account.passenger
         passenger_data = {
             "nickname": passenger.nickname,
             "phone": trip.trip_request.account.phone,
@@ -542,14 +684,97 @@ class TripPassengersView(APIView):
         return Response(passenger_data)
 
 
+# 上报行程定位（批量），结束行程时带上 final=true
+class DriverLocationView(APIView):
+    permission_classes = [IsDriver]
+
+    def post(self, request, order_id):
+        buffer = tracking.get_buffer(order_id, request.user.id)
+        if buffer is None:
+            return Response({"detail": "订单不存在"}, status=404)
+
+        try:
+            points = tracking.parse_points(request.data.get('points'))
+        except (ValueError, TypeError, IndexError, OverflowError, OSError) as e:
+            return Response({"detail": f"points 格式不正确：{e}"}, status=400)
+
+        tracking.add_points(buffer, points)
+        if request.data.get('final'):
+            route_length = tracking.finish(buffer)
+            return Response({"accepted": len(points), "route_points": route_length})
+        return Response({"accepted": len(points)}, status=202)
+
+
+# 结算订单：自动选用乘客优惠最大的优惠券，price 为空时使用订单金额或预估价格
+class SettleOrderView(APIView):
+    permission_classes = [IsDriver]
+
+    @idempotent
+    def post(self, request, order_id):
+        order = TripOrder.objects.select_related('trip_request').filter(
+            id=order_id, driver__account=request.user).first()
+        if order is None:
+            return Response({"detail": "订单不存在"}, status=status.HTTP_404_NOT_FOUND)
+        if order.discount_amount is not None or order.payment_status != 'pending':
+            return Response({"detail": "订单已结算"}, status=status.HTTP_409_CONFLICT)
+
+        # price 为 0 也是有效的价格，只有未传时才使用订单金额或预估价格
+        price = request.data.get('price')
+        if price is None:
+            price = order.actual_price if order.actual_price is not None else order.trip_request.estimated_price
+        try:
+            price = Decimal(str(price))
+        except (InvalidOperation, TypeError):
+            return Response({"detail": "price 格式不正确"}, status=status.HTTP_400_BAD_REQUEST)
+        if not price.is_finite() or price < 0:
+            return Response({"detail": "price 格式不正确"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            settled = coupons.settle_orders([order], [price])
+        except coupons.SettlementConflict:
+            return Response({"detail": "并发结算冲突，请重试"}, status=status.HTTP_409_CONFLICT)
+        if not settled:
+            return Response({"detail": "订单已结算"}, status=status.HTTP_409_CONFLICT)
+        return Response(TripOrderSerializer(order, context={'request': request}).data)
+
+
 # 查看历史订单
 class DriverOrderHistoryView(APIView):
     permission_classes = [IsDriver]
 
     def get(self, request):
-        orders = TripOrder.objects.filter(driver__account=request.user)
-        serializer = TripOrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(('-created_at', '-id'))
+        orders = paginator.paginate_querysets([
+            TripOrder.objects.filter(driver__account=request.user),
+            ArchivedTripOrder.objects.filter(driver__account=request.user),
+        ], request)
+        return paginator.get_paginated_response(serialize_rows(orders, ORDER_SERIALIZERS, {'request': request}))
+
+
+# 收入统计：只读取司机日汇总表，?start=&end=（YYYY-MM-DD，默认最近 30 天）
+class DriverEarningsView(APIView):
+    permission_classes = [IsDriver]
+    default_days = 30
+    max_days = 366
+
+    def get(self, request):
+        try:
+            end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params \
+                else timezone.localdate()
+            start = date.fromisoformat(request.query_params['start']) if 'start' in request.query_params \
+                else end - timedelta(days=self.default_days - 1)
+        except ValueError:
+            return Response({"detail": "日期格式应为 YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        if not timedelta(0) <= end - start < timedelta(days=self.max_days):
+            return Response({"detail": f"日期区间应在 1 ~ {self.max_days} 天之间"}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = DriverDailyStats.objects.filter(driver__account=request.user, day__gte=start, day__lte=end)
+        days = [
+            {'day': row.day, 'trip_count': row.trip_count, 'revenue': row.revenue, 'discount': row.discount,
+             'average_rating': row.average_rating}
+            for row in stats.order_by('day')
+        ]
+        return Response({'start': start, 'end': end, 'days': days, 'total': rollups.summarize(stats)})
 
 
 # 评价乘客
@@ -558,10 +783,8 @@ class RatePassengerView(generics.CreateAPIView):
     permission_classes = [IsDriver]
 
     def perform_create(self, serializer):
-        order = serializer.validated_data['order']
-        serializer.save(
-            reviewer=self.request.user,
-            reviewee=order.passenger,
-            created_at=timezone.now()
-        )
+        # 被评价的乘客（order.trip_request.account）由 ReviewSerializer.validate() 确定
+        with transaction.atomic():
+            review = serializer.save(reviewer=self.request.user, created_at=timezone.now())
+            ratings.record_review(review)
 
@@ -0,0 +1,50 @@
+"""
+性能基准脚本，在项目根目录下以模块方式运行，例如::
+
+    python -m benchmarks.bench_matching
+
+需要数据库的基准会使用 Django 测试库（运行结束后自动销毁），不会改动开发数据库。
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoCarpool.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(alias='default', file_name=None):
+    """
+    创建并在结束时销毁一个迁移到最新状态的测试数据库。
+    多线程基准需要传入 file_name，让 SQLite 使用文件库而不是进程内共享内存库
+    """
+    from django.db import connections
+    from django.test.utils import setup_databases, teardown_databases
+    if file_name and connections[alias].vendor == 'sqlite':
+        connections[alias].settings_dict['TEST']['NAME'] = file_name
+    old_config = setup_databases(verbosity=0, interactive=False, aliases={alias})
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+@contextmanager
+def timer(label, count=None, unit='ops'):
+    started = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - started
+    line = f'{label:<40} {elapsed * 1000:10.1f} ms'
+    if count:
+        line += f'  ({count / elapsed:,.0f} {unit}/s)'
+    print(line)
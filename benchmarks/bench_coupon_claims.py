@@ -0,0 +1,107 @@
+"""
+抢券并发基准：大量乘客在同一时刻领取同一张限量优惠券，比较吞吐量与超发数量
+
+    python -m benchmarks.bench_coupon_claims [--threads 16] [--users 2000] [--quantity 500] [--per-user-limit 1]
+
+对比的两种实现：
+  python-rmw     先读出已领数量与本人已领数量，在 Python 中判断后 save() 计数并插入
+  conditional    coupons.claim()：条件 UPDATE 扣减总量，(account, coupon, claim_no) 唯一约束保证每人限领
+
+每个用户会重复请求两次（模拟客户端重试），用于检验每人限领
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def python_rmw(account, coupon_id, now):
+    from apps.carpool.models import Coupon, UserCoupon
+    coupon = Coupon.objects.get(pk=coupon_id)
+    if coupon.total_quantity is not None and coupon.issued_count >= coupon.total_quantity:
+        return False
+    claimed = UserCoupon.objects.filter(account=account, coupon_id=coupon_id).count()
+    if claimed >= coupon.per_user_limit:
+        return False
+    coupon.issued_count += 1
+    coupon.save(update_fields=['issued_count'])
+    UserCoupon.objects.create(account=account, coupon_id=coupon_id, claim_no=claimed + 1, acquired_at=now,
+                              status='active')
+    return True
+
+
+def conditional(account, coupon_id, now):
+    from apps.carpool import coupons
+    return coupons.claim(account, coupon_id, now) == coupons.CLAIMED
+
+
+def run(strategy, accounts, coupon_id, threads, now):
+    from django.db import connection
+    successes = []
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        ok = err = 0
+        barrier.wait()
+        for account in accounts[index::threads] * 2:
+            try:
+                ok += bool(strategy(account, coupon_id, now))
+            except Exception:  # 例如 SQLite 的 database is locked、python-rmw 的重复请求违反唯一约束
+                err += 1
+        successes.append(ok)
+        errors.append(err)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(successes), sum(errors), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--quantity', type=int, default=500)
+    parser.add_argument('--per-user-limit', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import timedelta
+    from django.db.models import Count
+    from django.utils import timezone
+    from apps.carpool.models import Account, Coupon, UserCoupon
+
+    with tempfile.TemporaryDirectory() as tmp, test_database(file_name=os.path.join(tmp, 'bench.sqlite3')):
+        Account.objects.bulk_create([Account(phone=f'137{i:08d}', password='!') for i in range(args.users + 1)])
+        admin, *accounts = Account.objects.order_by('id')
+        now = timezone.now()
+        total = len(accounts) * 2
+        print(f'{args.threads} threads, {args.users} users x 2 requests, quantity {args.quantity}, '
+              f'limit {args.per_user_limit} per user')
+        print(f'{"strategy":<12} {"claims/s":>10} {"requests/s":>11} {"claimed":>8} {"errors":>7} '
+              f'{"over-issued":>12} {"over-limit":>11}')
+        for name, strategy in [('python-rmw', python_rmw), ('conditional', conditional)]:
+            coupon = Coupon.objects.create(
+                name='秒杀券', description='', discount_type='fixed amount', discount_value=5, min_spend=0,
+                max_discount=5, valid_from=now - timedelta(hours=1), valid_until=now + timedelta(hours=1),
+                total_quantity=args.quantity, per_user_limit=args.per_user_limit, created_by=admin)
+            claimed, errors, elapsed = run(strategy, accounts, coupon.pk, args.threads, now)
+            # 超发 = 实际插入的领取记录数 - 总量；超限 = 领取数超过每人限领的用户数
+            rows = UserCoupon.objects.filter(coupon=coupon)
+            over_issued = max(0, rows.count() - args.quantity)
+            over_limit = (rows.values('account').annotate(n=Count('id')).filter(n__gt=args.per_user_limit).count())
+            print(f'{name:<12} {claimed / elapsed:>10,.0f} {total / elapsed:>11,.0f} {claimed:>8} {errors:>7} '
+                  f'{over_issued:>12} {over_limit:>11}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+结算选券基准：users 个乘客各持有 coupons 张优惠券、各有一个待结算订单
+
+    python -m benchmarks.bench_coupon_settlement [--users 5000] [--coupons 20] [--chunk-size 1000]
+
+  select-python     逐个订单、逐张优惠券在 Python 中计算优惠（只比较选券本身）
+  select-vectorized coupons.choose_coupons()：所有 (订单, 优惠券) 对一次性向量化计算
+  settle-per-order  逐个订单调用 settle_orders()（SettleOrderView 的路径）
+  settle-batch      每 chunk-size 个订单调用一次 settle_orders()（settle_orders 命令的路径）
+"""
+import argparse
+import os
+import random
+import tempfile
+from decimal import Decimal
+
+from benchmarks import setup_django, test_database, timer
+
+
+def python_discount(price, discount_type, value, min_spend, max_discount):
+    if price < min_spend:
+        return -1
+    if discount_type == 'percentage':
+        discount = int(price * float(value) / 100 + 0.5)
+        if max_discount > 0:
+            discount = min(discount, max_discount)
+    else:
+        discount = int(value * 100)
+    return min(discount, price)
+
+
+def select_python(accounts, prices, rows):
+    """rows 与 active_user_coupons() 查询的列相同"""
+    from apps.carpool.coupons import to_cents
+    user_coupons = {}
+    for account_id, user_coupon_id, _, discount_type, value, min_spend, max_discount in rows:
+        user_coupons.setdefault(account_id, []).append(
+            (user_coupon_id, discount_type, value, to_cents(min_spend), to_cents(max_discount)))
+    chosen = []
+    for account_id, price in zip(accounts, prices):
+        best = None
+        for user_coupon_id, discount_type, value, min_spend, max_discount in user_coupons.get(account_id, ()):
+            discount = python_discount(price, discount_type, value, min_spend, max_discount)
+            if discount > 0 and (best is None or discount > best[1]):
+                best = (user_coupon_id, discount)
+        chosen.append(best)
+    return chosen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--coupons', type=int, default=20, help='每个乘客持有的优惠券数')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import timedelta
+    from django.utils import timezone
+    from apps.carpool import coupons
+    from apps.carpool.models import Account, Coupon, Driver, TripOrder, TripRequest, UserCoupon
+
+    rng = random.Random(19)
+    now = timezone.now()
+    with tempfile.TemporaryDirectory() as tmp, test_database(file_name=os.path.join(tmp, 'bench.sqlite3')):
+        Account.objects.bulk_create([Account(phone=f'137{i:08d}', password='!') for i in range(args.users + 1)])
+        driver_account, *accounts = Account.objects.order_by('id')
+        driver = Driver.objects.create(account=driver_account, rating=5)
+        catalog = Coupon.objects.bulk_create([
+            Coupon(name=f'券{i}', description='', discount_type=rng.choice(['fixed amount', 'percentage']),
+                   discount_value=rng.choice([3, 5, 10, 15, 20, 30]), min_spend=rng.choice([0, 20, 50, 100]),
+                   max_discount=rng.choice([0, 10, 20]), valid_from=now - timedelta(days=1),
+                   valid_until=now + timedelta(days=1), created_by=driver_account)
+            for i in range(100)
+        ])
+
+        def prepare():
+            """每轮重新生成订单与优惠券，返回 (orders, prices)"""
+            UserCoupon.objects.all().delete()
+            TripOrder.objects.all().delete()
+            TripRequest.objects.all().delete()
+            UserCoupon.objects.bulk_create([
+                UserCoupon(account=account, coupon=coupon, claim_no=1, status='active', acquired_at=now)
+                for account in accounts for coupon in rng.sample(catalog, args.coupons)
+            ], batch_size=5000)
+            requests = TripRequest.objects.bulk_create([
+                TripRequest(account=account, trip_type='打车', status='completed', pickup_location={},
+                            pickup_address='A', dropoff_location={}, dropoff_address='B', request_time=now)
+                for account in accounts
+            ], batch_size=5000)
+            TripOrder.objects.bulk_create([
+                TripOrder(trip_request=trip_request, driver=driver, payment_status='pending', end_time=now)
+                for trip_request in requests
+            ], batch_size=5000)
+            orders = list(TripOrder.objects.select_related('trip_request').order_by('id'))
+            return orders, [Decimal(rng.randint(1000, 20000)).scaleb(-2) for _ in orders]
+
+        orders, prices = prepare()
+        pairs = args.users * args.coupons
+        print(f'{args.users} users x {args.coupons} coupons ({pairs:,} candidates)')
+        order_accounts = [order.trip_request.account_id for order in orders]
+        price_cents = [coupons.to_cents(price) for price in prices]
+        rows = list(UserCoupon.objects.filter(status='active').values_list(
+            'account_id', 'id', 'coupon_id', 'coupon__discount_type', 'coupon__discount_value', 'coupon__min_spend',
+            'coupon__max_discount'))
+        # 两种实现都包含把查询结果整理成候选集的时间，不含查询本身
+        with timer('select-python', pairs, 'candidates'):
+            expected = select_python(order_accounts, price_cents, rows)
+        with timer('select-vectorized', pairs, 'candidates'):
+            candidates = coupons.CandidateCoupons()
+            for row in rows:
+                candidates.add(*row)
+            chosen = coupons.choose_coupons(order_accounts, price_cents, candidates)
+        # 每个乘客只有一个订单时两者的最优优惠金额应一致
+        assert [c and c[1] for c in chosen] == [c and c[1] for c in expected]
+
+        with timer('settle-per-order', len(orders), 'orders'):
+            for order, price in zip(orders, prices):
+                coupons.settle_orders([order], [price], now)
+
+        orders, prices = prepare()
+        with timer('settle-batch', len(orders), 'orders'):
+            for start in range(0, len(orders), args.chunk_size):
+                coupons.settle_orders(orders[start:start + args.chunk_size], prices[start:start + args.chunk_size],
+                                      now)
+        used = UserCoupon.objects.filter(status='used').count()
+        discounted = TripOrder.objects.filter(user_coupon__isnull=False).count()
+        print(f'{"":<40} {discounted} orders discounted, {used} coupons used')
+
+
+if __name__ == '__main__':
+    main()
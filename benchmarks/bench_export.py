@@ -0,0 +1,87 @@
+"""
+订单导出基准：orders 个已支付订单（关联乘客、司机、优惠券），按两种格式导出到丢弃输出
+
+    python -m benchmarks.bench_export [--orders 5000000] [--chunk-size 5000]
+
+  csv       exports.iter_csv()
+  columnar  exports.iter_columnar()（gzip 压缩的列式 JSON Lines）
+
+每项输出耗时、吞吐、导出大小和进程峰值内存（ru_maxrss）的增长，内存增长应与订单数无关
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from benchmarks import setup_django, test_database, timer
+
+BATCH_SIZE = 20000
+
+
+def max_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=5000000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--passengers', type=int, default=10000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from apps.carpool import exports
+    from apps.carpool.models import Account, Coupon, Driver, TripOrder, TripRequest, UserCoupon
+
+    rng = random.Random(24)
+    now = timezone.now()
+    with tempfile.TemporaryDirectory() as tmp, test_database(file_name=os.path.join(tmp, 'bench.sqlite3')):
+        Account.objects.bulk_create([Account(phone=f'137{i:08d}', password='!') for i in range(args.passengers + 1)])
+        driver_account, *accounts = Account.objects.order_by('id')
+        driver = Driver.objects.create(account=driver_account, rating=5)
+        coupon = Coupon.objects.create(name='满减券', description='', discount_type='fixed amount', discount_value=5,
+                                       min_spend=0, max_discount=0, valid_from=now, valid_until=now,
+                                       created_by=driver_account)
+        requests = TripRequest.objects.bulk_create([
+            TripRequest(account=account, trip_type='打车', status='completed', pickup_address=f'起点 {i}',
+                        pickup_location={}, dropoff_address=f'终点, "{i}"', dropoff_location={}, request_time=now)
+            for i, account in enumerate(accounts)
+        ])
+        user_coupons = UserCoupon.objects.bulk_create([
+            UserCoupon(account=account, coupon=coupon, status='used') for account in accounts])
+
+        # 分批生成，避免造数据本身抬高峰值内存
+        for offset in range(0, args.orders, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, args.orders - offset)):
+                index = rng.randrange(len(requests))
+                start = now - timedelta(minutes=rng.randrange(60 * 24 * 30))
+                discounted = rng.random() < 0.3
+                batch.append(TripOrder(
+                    trip_request=requests[index], driver=driver, payment_status='paid',
+                    actual_price=Decimal(rng.randrange(1000, 20000)) / 100,
+                    user_coupon=user_coupons[index] if discounted else None,
+                    discount_amount=Decimal(5) if discounted else None,
+                    start_time=start, end_time=start + timedelta(minutes=rng.randrange(5, 90)),
+                ))
+            TripOrder.objects.bulk_create(batch)
+            del batch
+        del requests, user_coupons, accounts
+
+        print(f'{args.orders} 个订单，chunk_size={args.chunk_size}')
+        orders = TripOrder.objects.all()
+        for fmt in ('csv', 'columnar'):
+            rss_before = max_rss_mib()
+            size = 0
+            with timer(fmt, args.orders, 'rows'):
+                for data in exports.stream(orders, fmt, args.chunk_size):
+                    size += len(data)
+            print(f'{"":<40} 输出 {size / 1024 / 1024:,.1f} MiB，峰值内存增长 {max_rss_mib() - rss_before:,.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
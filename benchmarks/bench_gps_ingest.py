@@ -0,0 +1,83 @@
+"""
+司机定位上报压测：经由 DriverLocationView 批量上报，统计单 worker 每秒可接收的定位点数
+
+    python -m benchmarks.bench_gps_ingest [--orders 50] [--batches 100] [--batch-size 50]
+
+同时给出对照组：每次上报都读出并改写整个 TripOrder.route。
+"""
+import argparse
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--batches', type=int, default=100, help='每个订单上报的批次数')
+    parser.add_argument('--batch-size', type=int, default=50, help='每批定位点数')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from apps.carpool import tracking
+    from apps.carpool.models import Account, Driver, TripOrder, TripRequest
+    from apps.carpool.views import DriverLocationView
+
+    with test_database():
+        driver_user = Account.objects.create_user(phone='13500000000', password='bench', is_driver=True)
+        driver = Driver.objects.create(account=driver_user, rating=5)
+        passenger = Account.objects.create_user(phone='13600000000', password='bench')
+        orders = []
+        for i in range(args.orders):
+            trip_request = TripRequest.objects.create(
+                account=passenger, trip_type='打车', status='matched', seats_needed=1,
+                pickup_address='A', pickup_location={'lat': 31, 'lng': 121},
+                dropoff_address='B', dropoff_location={'lat': 31.1, 'lng': 121.1}, request_time=timezone.now())
+            orders.append(TripOrder.objects.create(trip_request=trip_request, driver=driver, payment_status='pending'))
+
+        factory = APIRequestFactory()
+        view = DriverLocationView.as_view()
+        base_ts = timezone.now().timestamp()
+
+        def batch(b):
+            return [[31 + (b * args.batch_size + k) * 1e-5, 121 + k * 1e-5, base_ts + b * args.batch_size + k]
+                    for k in range(args.batch_size)]
+
+        requests = []
+        for b in range(args.batches):
+            for order in orders:
+                request = factory.post(f'/api/driver/orders/{order.pk}/locations/',
+                                       {'points': batch(b), 'final': b == args.batches - 1}, format='json')
+                force_authenticate(request, user=driver_user)
+                requests.append((request, order.pk))
+
+        total = args.orders * args.batches * args.batch_size
+        started = time.perf_counter()
+        for request, order_id in requests:
+            response = view(request, order_id=order_id)
+            assert response.status_code in (200, 202), response.data
+        elapsed = time.perf_counter() - started
+        print(f'buffered ingest: {total:,} pings in {elapsed:.2f}s = {total / elapsed:,.0f} pings/s '
+              f'({len(requests) / elapsed:,.0f} requests/s)')
+        assert all(len(order.route) == args.batches * args.batch_size
+                   for order in TripOrder.objects.filter(pk__in=[o.pk for o in orders]))
+        tracking.flush_all()
+
+        # 对照组：每批都读出并重写整个 route，耗时随轨迹长度增长
+        baseline_orders = orders[:min(args.orders, 5)]
+        TripOrder.objects.filter(pk__in=[o.pk for o in baseline_orders]).update(route_data=None)
+        started = time.perf_counter()
+        for b in range(args.batches):
+            for order in baseline_orders:
+                current = TripOrder.objects.get(pk=order.pk)
+                current.route = (current.route or []) + [[lat, lng] for lat, lng, _ in batch(b)]
+                current.save(update_fields=['route_data'])
+        elapsed = time.perf_counter() - started
+        count = len(baseline_orders) * args.batches * args.batch_size
+        print(f'rewrite route per batch (no HTTP layer): {count:,} pings in {elapsed:.2f}s = '
+              f'{count / elapsed:,.0f} pings/s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+列表序列化基准：ModelSerializer 与 values() 快速路径（含查询与 JSON 渲染）
+
+    python -m benchmarks.bench_list_serialization [--rows 1000 10000] [--repeat 5]
+"""
+import argparse
+
+from benchmarks import setup_django, test_database, timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+    from apps.carpool.models import Account, Ride, TripRequest
+    from apps.carpool.serializers import (
+        RideListSerializer, TripRequestSerializer, ride_list_values, trip_request_values
+    )
+
+    renderer = JSONRenderer()
+    with test_database():
+        account = Account.objects.create_user(phone='13600000000', password='x')
+        now = timezone.now()
+        created = 0
+        for rows in sorted(args.rows):
+            Ride.objects.bulk_create([
+                Ride(account=account, start_location='起点', end_location='终点', departure_time=now,
+                     total_seats=4, available_seats=3, status='open')
+                for _ in range(rows - created)
+            ], batch_size=2000)
+            TripRequest.objects.bulk_create([
+                TripRequest(account=account, trip_type='打车', status='pending', seats_needed=1,
+                            pickup_location={'lat': 31.2850, 'lng': 121.2150}, pickup_address='A',
+                            dropoff_location={'lat': 31.2304, 'lng': 121.4737}, dropoff_address='B',
+                            request_time=now, pickup_cell='wtw1yr', pickup_cell_coarse='wtw1')
+                for _ in range(rows - created)
+            ], batch_size=2000)
+            created = rows
+
+            cases = [
+                ('open rides', Ride.objects.select_related('account').filter(status='open'),
+                 RideListSerializer, ride_list_values),
+                ('pending requests', TripRequest.objects.filter(status='pending'),
+                 TripRequestSerializer, trip_request_values),
+            ]
+            for label, queryset, serializer_class, values_serializer in cases:
+                queryset = queryset.order_by('id')
+                with timer(f'{label} x{rows} ModelSerializer', rows * args.repeat, 'rows'):
+                    for _ in range(args.repeat):
+                        expected = renderer.render(serializer_class(queryset, many=True).data)
+                with timer(f'{label} x{rows} values()', rows * args.repeat, 'rows'):
+                    for _ in range(args.repeat):
+                        actual = renderer.render(values_serializer.serialize(values_serializer.values(queryset)))
+                assert actual == expected, f'{label}: 输出不一致'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+拼车批量匹配引擎基准：10k 请求 x 1k 行程
+
+    python -m benchmarks.bench_matching [--requests 10000] [--rides 1000] [--routes 100]
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import setup_django, timer
+
+
+def build_dataset(n_requests, n_rides, n_routes, seed=42):
+    from apps.carpool.matching import OpenRide, PendingRequest
+
+    rng = random.Random(seed)
+    base = datetime(2025, 6, 18, 8, 0, tzinfo=timezone.utc)
+    routes = [(f'起点{i}', f'终点{i}') for i in range(n_routes)]
+    rides = [
+        OpenRide(i, 100000 + i, rng.choice(routes), base + timedelta(minutes=rng.randint(0, 120)),
+                 rng.randint(1, 6), None)
+        for i in range(n_rides)
+    ]
+    requests = [
+        PendingRequest(i, 200000 + i, rng.choice(routes), base + timedelta(minutes=rng.randint(0, 120)),
+                       rng.choice((1, 1, 1, 2, 2, 3)), None)
+        for i in range(n_requests)
+    ]
+    return requests, rides
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--rides', type=int, default=1000)
+    parser.add_argument('--routes', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from apps.carpool.matching import plan_matches
+
+    requests, rides = build_dataset(args.requests, args.rides, args.routes)
+    with timer(f'plan_matches {args.requests}x{args.rides}', args.requests, 'requests'):
+        matches = plan_matches(requests, rides)
+
+    seats = sum(r.seats_needed for r, _ in matches)
+    capacity = sum(r.available_seats for r in rides)
+    wait = sum(abs((ride.departure_time - r.scheduled_time).total_seconds()) for r, ride in matches)
+    print(f'matched {len(matches)} requests, {seats}/{capacity} seats filled, '
+          f'avg wait {wait / max(len(matches), 1) / 60:.1f} min')
+
+
+if __name__ == '__main__':
+    main()
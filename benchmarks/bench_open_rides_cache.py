@@ -0,0 +1,61 @@
+"""
+开放行程列表缓存基准：不同读写比例下 ListOpenRidesView 的吞吐与缓存命中率
+
+    python -m benchmarks.bench_open_rides_cache [--rides 2000] [--requests 2000] [--write-every 0 100 10]
+
+--write-every N 表示每 N 次读取穿插一次行程修改（递增缓存版本号），0 表示只读。
+命中率来自 open_rides_cache.stats()，即本进程内的统计
+"""
+import argparse
+
+from benchmarks import setup_django, test_database, timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rides', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--write-every', type=int, nargs='+', default=[0, 100, 10])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+    from django.utils import timezone
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from apps.carpool.caching import open_rides_cache
+    from apps.carpool.models import Account, Ride
+    from apps.carpool.views import ListOpenRidesView
+
+    with test_database():
+        passenger = Account.objects.create_user(phone='13600000000', password='x', is_passenger=True)
+        driver = Account.objects.create_user(phone='13500000000', password='x')
+        now = timezone.now()
+        Ride.objects.bulk_create([
+            Ride(account=driver, start_location='起点', end_location='终点', departure_time=now,
+                 total_seats=4, available_seats=3, status='open')
+            for _ in range(args.rides)
+        ], batch_size=2000)
+        ride = Ride.objects.order_by('id').first()
+        print(f'{args.rides:,} 个开放行程，每组 {args.requests:,} 次读取')
+
+        view = ListOpenRidesView.as_view()
+        request = APIRequestFactory().get('/api/passenger/rides/open/')
+        force_authenticate(request, user=passenger)
+
+        for write_every in args.write_every:
+            cache.clear()
+            open_rides_cache.reset_stats()
+            label = '只读' if not write_every else f'每 {write_every} 次读取 1 次修改'
+            with timer(label, args.requests, 'req'):
+                for i in range(args.requests):
+                    if write_every and i % write_every == write_every - 1:
+                        # 自动提交模式下 on_commit 回调立即执行，版本号随即递增
+                        ride.available_seats = 3 - ride.available_seats % 2
+                        ride.save(update_fields=['available_seats'])
+                    view(request).render()
+            stats = open_rides_cache.stats()
+            print(f'{"":<40} 命中 {stats["hits"]:,}，未命中 {stats["misses"]:,}，命中率 {stats["hit_ratio"]:.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+历史订单分页基准：游标分页第一页与深页的耗时对比（附 OFFSET 分页作参照）
+
+    python -m benchmarks.bench_pagination [--orders 50000] [--page-size 50] [--repeat 20]
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks import setup_django, test_database, timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from apps.carpool.models import Account, Driver, TripOrder, TripRequest
+    from apps.carpool.pagination import KeysetPagination
+
+    with test_database():
+        passenger = Account.objects.create_user(phone='13600000000', password='x')
+        driver = Driver.objects.create(account=Account.objects.create_user(phone='13500000000', password='x'),
+                                       rating=5.0)
+        now = timezone.now()
+        requests = TripRequest.objects.bulk_create([
+            TripRequest(account=passenger, trip_type='打车', status='completed', pickup_location={},
+                        pickup_address='A', dropoff_location={}, dropoff_address='B', request_time=now)
+            for _ in range(args.orders)
+        ], batch_size=2000)
+        request_ids = list(TripRequest.objects.order_by('id').values_list('id', flat=True))
+        TripOrder.objects.bulk_create([
+            TripOrder(trip_request_id=request_id, driver=driver, payment_status='paid')
+            for request_id in request_ids
+        ], batch_size=2000)
+        # auto_now_add 不能在 bulk_create 时指定，按 1000 条一组改成递增的时间（组内时间相同），模拟长期的历史
+        order_ids = list(TripOrder.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(order_ids), 1000):
+            TripOrder.objects.filter(id__in=order_ids[start:start + 1000]).update(
+                created_at=now - timedelta(hours=len(order_ids) - start))
+        print(f'{args.orders:,} orders for one driver, {len(requests):,} requests')
+
+        queryset = TripOrder.objects.filter(driver=driver)
+        factory = APIRequestFactory()
+        params = {'page_size': args.page_size}
+
+        # 深页游标：倒数第二页的起点
+        deep_row = queryset.order_by('-created_at', '-id')[args.orders - 2 * args.page_size]
+        deep_cursor = KeysetPagination(('-created_at', '-id')).encode_cursor(deep_row)
+
+        for label, extra in [('keyset page 1', {}), ('keyset deep page', {'cursor': deep_cursor})]:
+            request = Request(factory.get('/api/driver/orders/', dict(params, **extra)))
+            with timer(label, args.repeat, 'pages'):
+                for _ in range(args.repeat):
+                    KeysetPagination(('-created_at', '-id')).paginate_queryset(queryset, request)
+
+        ordered = queryset.order_by('-created_at', '-id')
+        for label, offset in [('offset page 1', 0), ('offset deep page', args.orders - 2 * args.page_size)]:
+            with timer(label, args.repeat, 'pages'):
+                for _ in range(args.repeat):
+                    list(ordered[offset:offset + args.page_size])
+
+
+if __name__ == '__main__':
+    main()
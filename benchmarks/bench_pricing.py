@@ -0,0 +1,63 @@
+"""
+车费估算基准：向量化报价 vs 逐行 Decimal 计算
+
+    python -m benchmarks.bench_pricing [--trips 100000]
+"""
+import argparse
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+from benchmarks import setup_django, timer
+
+
+def decimal_loop(pickups, dropoffs, services):
+    from apps.carpool import geo, pricing
+    result = []
+    for (lat1, lng1), (lat2, lng2) in zip(pickups, dropoffs):
+        distance = Decimal(repr(geo.haversine_km(lat1, lng1, lat2, lng2) * pricing.ROAD_FACTOR))
+        duration = distance / Decimal(repr(pricing.AVERAGE_SPEED_KMH)) * 60
+        result.append([
+            (service.base_fare + service.per_km_rate * distance + service.per_minute_rate * duration)
+            .quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            for service in services
+        ])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trips', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+    from apps.carpool import pricing
+    from apps.carpool.models import RideService
+
+    services = [
+        RideService(name='打车', base_fare=Decimal('10.00'), per_km_rate=Decimal('2.00'),
+                    per_minute_rate=Decimal('0.50')),
+        RideService(name='拼车', base_fare=Decimal('6.00'), per_km_rate=Decimal('1.20'),
+                    per_minute_rate=Decimal('0.30')),
+        RideService(name='专车', base_fare=Decimal('20.00'), per_km_rate=Decimal('3.00'),
+                    per_minute_rate=Decimal('1.00')),
+    ]
+    table = pricing.ServiceTable(services)
+
+    rng = random.Random(7)
+    pickups = [(31.2 + rng.random() * 0.2, 121.3 + rng.random() * 0.3) for _ in range(args.trips)]
+    dropoffs = [(31.2 + rng.random() * 0.2, 121.3 + rng.random() * 0.3) for _ in range(args.trips)]
+    quotes = args.trips * len(services)
+
+    with timer(f'decimal loop ({args.trips} trips)', quotes, 'quotes'):
+        expected = decimal_loop(pickups, dropoffs, services)
+    with timer(f'numpy vectorized ({args.trips} trips)', quotes, 'quotes'):
+        distance, duration = pricing.trip_metrics(pickups, dropoffs)
+        cents = pricing.quote_cents(distance, duration, table)
+
+    worst = max(abs(int(expected[i][j] * 100) - int(cents[i, j]))
+                for i in range(args.trips) for j in range(len(services)))
+    print(f'max difference between the two methods: {worst} cent')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+响应渲染基准：历史订单接口的数据分别用 DRF JSONRenderer、FastJSONRenderer、MessagePackRenderer 编码，
+比较编码耗时与响应体大小（含 gzip 后的大小）
+
+    python -m benchmarks.bench_renderers [--orders 2000] [--points 300] [--repeat 10]
+"""
+import argparse
+import gzip
+import random
+from decimal import Decimal
+
+from benchmarks import setup_django, timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=300, help='?include=route 时每条路线的点数')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from apps.carpool.models import TripOrder
+    from apps.carpool.serializers import TripOrderSerializer
+    from ext import renderers
+
+    rng = random.Random(5)
+    now = timezone.now()
+    orders = []
+    for i in range(args.orders):
+        order = TripOrder(id=i, trip_request_id=i, driver_id=1, payment_status='paid', start_time=now, end_time=now,
+                          created_at=now, last_modified_at=now, actual_price=Decimal(rng.randint(1000, 9000)) / 100,
+                          passenger_rating=Decimal('4.5'), passenger_comment='司机很准时')
+        order.route = [[31.2 + rng.random() * 0.2, 121.3 + rng.random() * 0.3] for _ in range(args.points)]
+        orders.append(order)
+
+    print(f'orjson installed: {renderers.orjson is not None}')
+    factory = APIRequestFactory()
+    cases = [
+        ('JSONRenderer (stdlib)', JSONRenderer()),
+        ('FastJSONRenderer', renderers.FastJSONRenderer()),
+        ('MessagePackRenderer', renderers.MessagePackRenderer()),
+    ]
+    for label, params in [('/api/driver/orders/', {}), ('/api/driver/orders/?include=route', {'include': 'route'})]:
+        request = Request(factory.get('/api/driver/orders/', params))
+        data = TripOrderSerializer(orders, many=True, context={'request': request}).data
+        print(label)
+        for name, renderer in cases:
+            with timer(f'  {name}', args.orders * args.repeat, 'orders'):
+                for _ in range(args.repeat):
+                    body = renderer.render(data, renderer.media_type, {})
+            print(f'{"":<40} {len(body) / 1024:,.0f} KiB, gzip {len(gzip.compress(body)) / 1024:,.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
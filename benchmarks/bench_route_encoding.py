@@ -0,0 +1,68 @@
+"""
+行程路线编码基准：原始坐标 JSON 与紧凑编码的存储大小、历史订单接口的序列化耗时
+
+    python -m benchmarks.bench_route_encoding [--orders 500] [--points 600]
+"""
+import argparse
+import json
+import random
+
+from benchmarks import setup_django, timer
+
+
+def random_walk(rng, points):
+    lat, lng = 31.2 + rng.random() * 0.2, 121.3 + rng.random() * 0.3
+    route = []
+    for _ in range(points):
+        lat += rng.uniform(-0.0003, 0.0003)
+        lng += rng.uniform(-0.0003, 0.0003)
+        route.append([round(lat, 6), round(lng, 6)])
+    return route
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--points', type=int, default=600, help='每条路线的点数（约 10 分钟、1 秒 1 个点）')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from apps.carpool import route_codec
+    from apps.carpool.models import TripOrder
+    from apps.carpool.serializers import TripOrderSerializer
+
+    rng = random.Random(3)
+    routes = [random_walk(rng, args.points) for _ in range(args.orders)]
+
+    with timer('json.dumps routes', args.orders, 'routes'):
+        as_json = [json.dumps(route).encode() for route in routes]
+    with timer('route_codec.encode_route', args.orders, 'routes'):
+        encoded = [route_codec.encode_route(route) for route in routes]
+    with timer('route_codec.decode_route', args.orders, 'routes'):
+        for data in encoded:
+            route_codec.decode_route(data)
+    json_size, encoded_size = sum(map(len, as_json)), sum(map(len, encoded))
+    print(f'storage: JSON {json_size / args.orders:,.0f} B/route, encoded {encoded_size / args.orders:,.0f} B/route '
+          f'({json_size / encoded_size:.1f}x smaller)')
+
+    now = timezone.now()
+    orders = [
+        TripOrder(id=i, trip_request_id=i, driver_id=1, payment_status='paid', start_time=now, end_time=now,
+                  created_at=now, last_modified_at=now, route_data=data)
+        for i, data in enumerate(encoded)
+    ]
+    factory = APIRequestFactory()
+    renderer = JSONRenderer()
+    for label, params in [('history with ?include=route', {'include': 'route'}), ('history default (no route)', {})]:
+        request = Request(factory.get('/api/passenger/orders/', params))
+        with timer(label, args.orders, 'orders'):
+            body = renderer.render(TripOrderSerializer(orders, many=True, context={'request': request}).data)
+        print(f'{"":<40} response {len(body) / 1024:,.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
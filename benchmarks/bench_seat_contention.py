@@ -0,0 +1,108 @@
+"""
+座位扣减并发基准：多个线程同时抢同一个行程的座位，比较吞吐量与超卖数量
+
+    python -m benchmarks.bench_seat_contention [--threads 16] [--attempts 50] [--seats 200]
+
+对比的三种实现：
+  python-rmw     AcceptTripRequestView 原实现：读出座位数，在 Python 中扣减后 save()
+  row-lock       JoinRideView 原实现：事务内 select_for_update() 后再扣减
+  conditional    seats.reserve_seats()：一条条件 UPDATE
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def python_rmw(ride_id):
+    from apps.carpool.models import Ride
+    ride = Ride.objects.get(pk=ride_id)
+    if ride.status != 'open' or ride.available_seats < 1:
+        return False
+    ride.available_seats -= 1
+    if ride.available_seats == 0:
+        ride.status = 'full'
+    ride.save()
+    return True
+
+
+def row_lock(ride_id):
+    from django.db import transaction
+    from apps.carpool.models import Ride
+    with transaction.atomic():
+        ride = Ride.objects.select_for_update().get(pk=ride_id)
+        if ride.status != 'open' or ride.available_seats < 1:
+            return False
+        ride.available_seats -= 1
+        if ride.available_seats == 0:
+            ride.status = 'full'
+        ride.save()
+    return True
+
+
+def conditional(ride_id):
+    from apps.carpool.seats import reserve_seats
+    return reserve_seats(ride_id, 1)
+
+
+def run(strategy, ride_id, threads, attempts):
+    from django.db import connection
+    successes = []
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        ok = err = 0
+        barrier.wait()
+        for _ in range(attempts):
+            try:
+                ok += bool(strategy(ride_id))
+            except Exception:  # 例如 SQLite 的 database is locked
+                err += 1
+        successes.append(ok)
+        errors.append(err)
+        connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(successes), sum(errors), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=50)
+    parser.add_argument('--seats', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from apps.carpool.models import Account, Ride
+
+    with tempfile.TemporaryDirectory() as tmp, test_database(file_name=os.path.join(tmp, 'bench.sqlite3')):
+        driver = Account.objects.create_user(phone='13500000000', password='bench')
+        total = args.threads * args.attempts
+        print(f'{args.threads} threads x {args.attempts} attempts, {args.seats} seats')
+        print(f'{"strategy":<12} {"joins/s":>10} {"attempts/s":>11} {"joined":>7} {"errors":>7} {"oversold":>9}')
+        for name, strategy in [('python-rmw', python_rmw), ('row-lock', row_lock), ('conditional', conditional)]:
+            ride = Ride.objects.create(account=driver, start_location='A', end_location='B',
+                                       departure_time=timezone.now(), total_seats=args.seats,
+                                       available_seats=args.seats)
+            joined, errors, elapsed = run(strategy, ride.pk, args.threads, args.attempts)
+            ride.refresh_from_db()
+            # 超卖 = 成功加入次数 - 数据库中实际扣减的座位数（丢失更新时两者对不上）
+            oversold = joined - (args.seats - ride.available_seats)
+            print(f'{name:<12} {joined / elapsed:>10,.0f} {total / elapsed:>11,.0f} {joined:>7} {errors:>7} '
+                  f'{oversold:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoCarpool.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 必须在 Django 初始化之后导入
+from apps.carpool.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # WebSocket 连接交给推送通道，其余请求照常由 Django 处理
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -141,6 +141,12 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON 在安装了 orjson 时使用 orjson 编码；客户端可以通过 Accept: application/msgpack 获取 MessagePack
+    "DEFAULT_RENDERER_CLASSES": [
+        'ext.renderers.FastJSONRenderer',
+        'ext.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 from datetime import timedelta
@@ -25,10 +25,11 @@ from apps.carpool.views import (
     DriverCreateView, DriverInfoView,
     AdvertiserCreateView, AdvertiserInfoView,
     IdentityVerificationView, VehicleView,
-    SubmitTripRequestView, TripRequestStatusView, CancelTripRequestView,
+    SubmitTripRequestView, TripQuoteView, TripRequestStatusView, CancelTripRequestView,
     PassengerOrderHistoryView, SubmitDriverReviewView, PassengerCouponsView, ReceiveCouponView,
-    CreateTripView, MyTripsView, AcceptTripRequestView, TripPassengersView, RatePassengerView,
-    CancelRideView, ListPendingTripRequestsView, DriverOrderHistoryView, ListOpenRidesView, JoinRideView
+    CreateTripView, MyTripsView, AcceptTripRequestView, TripPassengersView, RatePassengerView, DriverLocationView,
+    CancelRideView, ListPendingTripRequestsView, DriverOrderHistoryView, ListOpenRidesView, JoinRideView,
+    SettleOrderView, DriverEarningsView
 )
 
 urlpatterns = [
@@ -58,6 +59,7 @@ urlpatterns = [
 
     # 乘客功能接口
     path('api/passenger/trip/request/', SubmitTripRequestView.as_view(), name='submit-trip-request'),
+    path('api/passenger/trip/quote/', TripQuoteView.as_view(), name='trip-quote'),
     path('api/passenger/trip/status/', TripRequestStatusView.as_view(), name='trip-request-status'),
     path('api/passenger/trip/cancel/<int:pk>/', CancelTripRequestView.as_view(), name='cancel-trip-request'),
     path('api/passenger/rides/open/', ListOpenRidesView.as_view(), name='open-ride-list'),
@@ -75,5 +77,8 @@ urlpatterns = [
     path('api/driver/trip/<int:request_id>/accept/', AcceptTripRequestView.as_view(), name='driver-accept-trip-request'),
     path('api/driver/trip/<int:trip_id>/passengers/', TripPassengersView.as_view(), name='trip-passenger-list'),
     path('api/driver/orders/', DriverOrderHistoryView.as_view(), name='driver-orders'),
+    path('api/driver/orders/<int:order_id>/locations/', DriverLocationView.as_view(), name='driver-order-locations'),
+    path('api/driver/orders/<int:order_id>/settle/', SettleOrderView.as_view(), name='driver-order-settle'),
+    path('api/driver/earnings/', DriverEarningsView.as_view(), name='driver-earnings'),
     path('api/driver/review/', RatePassengerView.as_view(), name='rate-passenger'),
 ]
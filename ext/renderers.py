@@ -0,0 +1,50 @@
+import msgpack
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# 可选依赖：安装了 orjson 时用它编码 JSON，否则使用标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Decimal、datetime、UUID、惰性翻译字符串等按 DRF 的规则转换，保证与默认 JSONRenderer 的输出一致
+_drf_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    与 DRF JSONRenderer 输出相同的 JSON，安装了 orjson 时使用 orjson 编码。
+    需要缩进（如 Accept: application/json; indent=4 或可浏览 API）时仍使用标准库
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime 交给 DRF 的规则处理（UTC 输出为 Z），非字符串键与标准库一样转为字符串
+            ret = orjson.dumps(data, default=_drf_default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson 不支持的数据（如超过 64 位的整数），回退到标准库
+            return super().render(data, accepted_media_type, renderer_context)
+        # 与 DRF 一样转义 U+2028 / U+2029，使输出是合法的 JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Accept: application/msgpack 时返回 MessagePack，数据结构与 JSON 响应相同
+    （Decimal、datetime 等与 JSON 一样先转换为字符串或数字）
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_drf_default, use_bin_type=True)